@@ -31,8 +31,7 @@ import sys
 
 sys.path.append('../lib')
 import copy
-
-# import time
+import time
 
 from structs.gui_message import GuiMessage
 from structs.mqtt_config import MqttConfig
@@ -46,6 +45,32 @@ from processes.base_process import BaseProcess
 from command_slot_manager import CommandSlotManager
 
 MAX_BUFFER = 120
+# seconds to wait for the device to respond to a message
+DEVICE_RESPONSE_TIMEOUT = 2.0
+# while other messages are waiting to be processed, milliseconds between
+# sending waiting throttle commands, newer commands replace waiting ones
+COALESCE_TIME = 20
+
+# command lanes, lower lanes are sent first,
+# commands in the immediate lane are sent at once, they never wait
+LANE_IMMEDIATE = 0
+LANE_CONTROL = 1
+LANE_SPEED = 2
+
+
+class PendingCommand(object):
+    """ a throttle command waiting to be sent to the device """
+
+    def __init__(self, gui_message=None, lane=LANE_SPEED, sequence=0):
+        self.gui_message = gui_message  # newest message, the one sent
+        self.replaced_messages = []  # older messages, get the same response
+        self.lane = lane
+        self.sequence = sequence  # order commands were first queued
+
+    def __repr__(self):
+        # return "%s(%r)" % (self.__class__, self.__dict__)
+        fdict = repr(self.__dict__)
+        return f"{self.__class__}({fdict})"
 
 
 class BaseDriver(BaseProcess):
@@ -67,6 +92,16 @@ class BaseDriver(BaseProcess):
         self.cab_pub_topic = None
         self.slot_manager = None
         self.max_locos = 32
+        # matches device responses to requests, late responses are dropped
+        self.device_request_id = 0
+        # send the messages for all locos in a consist to the device as one
+        # list and wait for their responses together, device must support it
+        self.pipeline_device_messages = False
+        # throttle commands waiting to be sent, keyed by command key,
+        # see find_command_lane
+        self.pending_commands = {}
+        self.pending_command_sequence = 0
+        self.pending_command_sent = 0  # monotonic milliseconds
 
     def initialize_process(self):
         """ initialize the process """
@@ -100,64 +135,77 @@ class BaseDriver(BaseProcess):
                     str(msg_body))
                 msg_consummed = True
             else:
+                if msg_type == Global.DRIVER_SEND_AND_RESPOND and \
+                        msg_body.command == Global.THROTTLE and \
+                        msg_body.sub_command not in [Global.SPEED, \
+                            Global.DIRECTION, Global.FUNCTION]:
+                    # keep waiting commands ahead of acquire, release, etc
+                    self.send_pending_commands()
                 if msg_type == Global.DRIVER_SEND_AND_RESPOND:
                     #print(">>> commands: " + str(msg_body.command) + " ... " + str(msg_body.sub_command))
                     if msg_body.command == Global.THROTTLE and \
                             msg_body.sub_command == Global.CONNECT:
                         self.connect_throttle(msg_body)
                         msg_body.reported = Global.CONNECTED
-                        self.publish_response(msg_body, msg_body.response_queue)
+                        self.publish_response(msg_body, msg_body.response_queue,
+                                              msg_body.request_id)
                         msg_consummed = True
                     elif msg_body.command == Global.THROTTLE and \
                             msg_body.sub_command == Global.DISCONNECT:
                         self.disconnect_throttle(msg_body)
                         msg_body.reported = Global.DISCONNECTED
-                        self.publish_response(msg_body, msg_body.response_queue)
+                        self.publish_response(msg_body, msg_body.response_queue,
+                                              msg_body.request_id)
                         msg_consummed = True
                     elif msg_body.command == Global.THROTTLE and \
                             msg_body.sub_command == Global.ACQUIRE:
                         resp_message = self.acquire_loco(msg_body)
                         # msg_body.reported = Global.ACQUIRED
-                        self.publish_response(resp_message, msg_body.response_queue)
+                        self.publish_response(resp_message, msg_body.response_queue,
+                                              msg_body.request_id)
                         msg_consummed = True
                     elif msg_body.command == Global.THROTTLE and \
                             msg_body.sub_command == Global.STEAL:
                         resp_message = self.steal_loco(msg_body)
                         msg_body.reported = Global.ACQUIRED
-                        self.publish_response(msg_body, msg_body.response_queue)
+                        self.publish_response(msg_body, msg_body.response_queue,
+                                              msg_body.request_id)
                         msg_consummed = True
                     elif msg_body.command == Global.THROTTLE and \
                             msg_body.sub_command == Global.RELEASE:
                         self.release_loco(msg_body)
                         msg_body.reported = Global.RELEASED
-                        self.publish_response(msg_body, msg_body.response_queue)
+                        self.publish_response(msg_body, msg_body.response_queue,
+                                              msg_body.request_id)
                         msg_consummed = True
                     elif msg_body.command == Global.THROTTLE and \
                             msg_body.sub_command == Global.REPORT:
                         response_message = self.__get_loco_status(msg_body)
                         #print(">>> dcc response: " + str(dcc_response))
-                        self.publish_response(response_message, msg_body.response_queue)
+                        self.publish_response(response_message, msg_body.response_queue,
+                                              msg_body.request_id)
                         msg_consummed = True
                     elif msg_body.command == Global.THROTTLE and \
                             msg_body.sub_command == Global.SET_LEAD:
                         self.__set_lead(msg_body)
                         msg_body.reported = Global.LEAD_SET
-                        self.publish_response(msg_body, msg_body.response_queue)
+                        self.publish_response(msg_body, msg_body.response_queue,
+                                              msg_body.request_id)
                         msg_consummed = True
                     elif msg_body.command == Global.THROTTLE and \
                             msg_body.sub_command == Global.SPEED:
                         self.slot_manager.set_loco_speed(msg_body)
-                        self.__execute_gui_message(msg_body)
+                        self.__schedule_gui_message(msg_body)
                         msg_consummed = True
                     elif msg_body.command == Global.THROTTLE and \
                             msg_body.sub_command == Global.DIRECTION:
                         self.slot_manager.set_loco_direction(msg_body)
-                        self.__execute_gui_message(msg_body)
+                        self.__schedule_gui_message(msg_body)
                         msg_consummed = True
                     elif msg_body.command == Global.THROTTLE and \
                             msg_body.sub_command == Global.FUNCTION:
                         self.slot_manager.set_loco_function(msg_body)
-                        self.__execute_gui_message(msg_body)
+                        self.__schedule_gui_message(msg_body)
                         msg_consummed = True
                     else:
                         self.process_non_gui_message(msg_body)
@@ -176,14 +224,33 @@ class BaseDriver(BaseProcess):
                     self.log_debug("Rcvd from Device: " + str(msg_device_identity) + ": "+ str(msg_body))
                     self.process_unsolicited_device_input_message(msg_body, msg_device_identity)
                     msg_consummed = True
+        self.__send_pending_commands_when_idle()
         return msg_consummed
 
+    def process_other(self):
+        """ perform other than message queue tasks """
+        super().process_other()
+        self.__send_pending_commands_when_idle()
+
+    def find_command_lane(self, _gui_message):
+        """ lane and key of a speed, direction or function command,
+            a waiting command is replaced by a newer one with the same key,
+            None if commands are sent at once, in the order received
+        --- override in derived class """
+        return None
+
+    def send_pending_commands(self):
+        """ send all waiting throttle commands """
+        while self.pending_commands:
+            self.__send_next_pending_command()
+
     def process_non_gui_message(self, msg_body):
         """ process messages not related to throttles """
         # print(">>> non throttle: " + str(msg_body))
         response_message = self.send_and_wait_gui_message(msg_body)
         #print(">>> device response: " + str(response_message))
-        self.publish_response(response_message, msg_body.response_queue)
+        self.publish_response(response_message, msg_body.response_queue,
+                              msg_body.request_id)
 
     def process_unsolicited_device_input_message(self, msg_body, _msg_device_identity):
         """ received unsolicted input from device """
@@ -197,6 +264,11 @@ class BaseDriver(BaseProcess):
         """ decode a message """
         return self.decoder.decode_message(msg_body, source)
 
+    def encode_response_prefix(self, _msg_body):
+        """ start of the device response to a message, None if the device
+            does not respond to it, "" if any line read is the response """
+        return ""
+
     def send_and_wait_gui_message(self, gui_message):
         """ send throttle message and wait for response"""
         adjusted_message = self.adjust_device_message_before_send(gui_message)
@@ -207,6 +279,26 @@ class BaseDriver(BaseProcess):
             self.__device_send_message_and_wait_response(device_queue_name, dcc_message)
         return self.__process_device_input(dcc_response)
 
+    def send_and_wait_gui_messages(self, gui_messages):
+        """ send throttle messages back to back and wait for their responses
+            together, returns list of responses of all messages """
+        device_messages = {}
+        response_prefixes = {}
+        for gui_message in gui_messages:
+            adjusted_message = self.adjust_device_message_before_send(gui_message)
+            device_queue_name = self.find_device_queue(adjusted_message)
+            dcc_message = self.encode_message(adjusted_message, Global.CLIENT)
+            device_messages.setdefault(device_queue_name, []).append(dcc_message)
+            response_prefixes.setdefault(device_queue_name, []).append(
+                self.encode_response_prefix(adjusted_message))
+        rett = []
+        for device_queue_name, dcc_messages in device_messages.items():
+            dcc_response = self.__device_send_message_and_wait_response(
+                device_queue_name, dcc_messages,
+                response_prefixes[device_queue_name])
+            rett += self.__process_device_input(dcc_response)
+        return rett
+
     def send_gui_message(self, gui_message):
         """ send throttle message, DO NOT wait for response"""
         adjusted_message_to_be_sent =self.adjust_device_message_before_send(gui_message)
@@ -215,10 +307,13 @@ class BaseDriver(BaseProcess):
         # print(">>> send dcc message: " + str(dcc_message))
         self.__device_send_message(device_queue_name, dcc_message)
 
-    def publish_response(self, response_data, response_queue):
-        """ publish serial input """
+    def publish_response(self, response_data, response_queue, request_id=None):
+        """ publish serial input, request_id of the request is
+            returned with the response, if the request had one """
         # print(">>> response to: " + str(response_queue) + " ... " + str(response_data))
         message = (Global.DRIVER_RESPONSE, response_data)
+        if request_id is not None:
+            message = (Global.DRIVER_RESPONSE, response_data, request_id)
         resp_queue = self.queues.get(response_queue, None)
         if resp_queue is not None:
             resp_queue.put(message)
@@ -351,14 +446,84 @@ class BaseDriver(BaseProcess):
             for updated_message in updated_messages:
                 _response_message = self.send_and_wait_gui_message(updated_message)
 
+    def __schedule_gui_message(self, gui_message):
+        """ send a throttle command at once, or queue it to be sent
+            when the driver is idle, replacing a waiting one """
+        command_lane = self.find_command_lane(gui_message)
+        if command_lane is None:
+            self.__execute_gui_message(gui_message)
+        else:
+            (lane, command_key) = command_lane
+            pending_command = self.pending_commands.pop(command_key, None)
+            if lane == LANE_IMMEDIATE:
+                response_message = self.__execute_gui_message(gui_message)
+                if pending_command is not None:
+                    # replaced, device has been sent the current loco state
+                    pending_command.replaced_messages.append(
+                        pending_command.gui_message)
+                    self.__publish_replaced_responses(pending_command,
+                                                      response_message)
+            elif pending_command is None:
+                self.pending_command_sequence += 1
+                self.pending_commands[command_key] = PendingCommand(
+                    gui_message, lane, self.pending_command_sequence)
+            else:
+                # commands send loco state from slot table, newest wins
+                pending_command.replaced_messages.append(pending_command.gui_message)
+                pending_command.gui_message = gui_message
+                pending_command.lane = min(lane, pending_command.lane)
+                self.pending_commands[command_key] = pending_command
+
+    def __send_pending_commands_when_idle(self):
+        """ send waiting commands while no other messages are waiting,
+            one every COALESCE_TIME while there are """
+        while self.pending_commands:
+            busy = not self.in_queue.empty()
+            if busy and self.__now_milliseconds() - self.pending_command_sent \
+                    < COALESCE_TIME:
+                break
+            self.__send_next_pending_command()
+            if busy:
+                break
+
+    def __send_next_pending_command(self):
+        """ send the oldest waiting command of the lowest lane """
+        (command_key, pending_command) = min(
+            self.pending_commands.items(),
+            key=lambda item: (item[1].lane, item[1].sequence))
+        del self.pending_commands[command_key]
+        response_message = self.__execute_gui_message(pending_command.gui_message)
+        self.pending_command_sent = self.__now_milliseconds()
+        self.__publish_replaced_responses(pending_command, response_message)
+
+    def __publish_replaced_responses(self, pending_command, response_message):
+        """ respond to commands replaced by a newer one """
+        for replaced_message in pending_command.replaced_messages:
+            replaced_response = copy.copy(response_message)
+            replaced_response.dcc_id = replaced_message.dcc_id
+            self.publish_response(replaced_response, replaced_message.response_queue,
+                                  replaced_message.request_id)
+
+    def __now_milliseconds(self):
+        """ monotonic time in milliseconds """
+        return time.monotonic() * 1000
+
     def __execute_gui_message(self, gui_message):
-        """ execute a list of gui_messages """
+        """ execute a list of gui_messages, returns response """
         response_message = copy.deepcopy(gui_message)
         #print(">>> gui_message: " + str(gui_message))
         updated_messages = self.__generate_updated_throttle_mesages(gui_message)
         #print(">>> updatesd_messages:" + str(updated_messages))
-        for updated_message in updated_messages:
-            response_message = self.send_and_wait_gui_message(updated_message)
+        missing_locos = []
+        if self.pipeline_device_messages and len(updated_messages) > 1:
+            # consist, send to all locos at once
+            response_message = self.send_and_wait_gui_messages(updated_messages)
+            missing_locos = self.__find_missing_responses(updated_messages,
+                                                          response_message)
+            response_message = response_message[-1:]
+        else:
+            for updated_message in updated_messages:
+                response_message = self.send_and_wait_gui_message(updated_message)
         # print(">>> res msg: " + str(response_message))
         if isinstance(response_message, list):
             if response_message:
@@ -366,7 +531,29 @@ class BaseDriver(BaseProcess):
             else:
                 response_message = gui_message
         response_message.dcc_id = gui_message.dcc_id
-        self.publish_response(response_message, gui_message.response_queue)
+        if missing_locos:
+            # some locos of consist did not respond, report them
+            self.log_warning("No device response for locos: " + str(missing_locos))
+            response_message = copy.copy(response_message)
+            response_message.reported = Global.ERROR
+            response_message.items = missing_locos
+        self.publish_response(response_message, gui_message.response_queue,
+                              gui_message.request_id)
+        return response_message
+
+    def __find_missing_responses(self, gui_messages, responses):
+        """ dcc ids of locos whose message got no response when others did,
+            devices do not respond to some messages at all """
+        missing_locos = []
+        responding_slots = set()
+        for response in responses:
+            if response.command == Global.THROTTLE:
+                responding_slots.add(str(response.slot_id))
+        if responding_slots:
+            for gui_message in gui_messages:
+                if str(gui_message.slot_id) not in responding_slots:
+                    missing_locos.append(gui_message.dcc_id)
+        return missing_locos
 
     def __generate_updated_throttle_mesages(self, gui_message):
         """ create one or more updated throttle messages, one per each loco in cab """
@@ -428,21 +615,39 @@ class BaseDriver(BaseProcess):
         dev_queue.put(
             (Global.DEVICE_SEND, send_message_map))
 
-    def __device_send_message_and_wait_response(self, device_queue_name, send_message):
-        """ put a message in device_queue, wait for a reply """
+    def __device_send_message_and_wait_response(self, device_queue_name, send_message,
+                                                response_prefixes=None):
+        """ put a message in device_queue, wait for a reply,
+            response_prefixes has the start of the reply to each
+            message of a list, see encode_response_prefix """
         self.log_info("Sent to Device: " + str(device_queue_name) + ": "+ str(send_message))
-        send_message_map = {Global.TEXT: send_message, Global.RESPONSE_QUEUE: self.response_queue_name}
+        self.device_request_id += 1
+        request_id = self.device_request_id
+        send_message_map = {Global.TEXT: send_message,
+                            Global.RESPONSE_QUEUE: self.response_queue_name,
+                            Global.REQUEST_ID: request_id}
+        if response_prefixes is not None:
+            send_message_map[Global.RESPONSE_PREFIXES] = response_prefixes
         # print(">>> driver response: " + str(self.response_queue))
         dev_queue = self.queues[device_queue_name]
         dev_queue.put(
             (Global.DEVICE_SEND_AND_RESPOND, send_message_map))
         response = None
-        try:
-            (Global.DEVICE_INPUT,
-             response) = self.response_queue.get(True, 2.0)
-        except Exception as _error:
-            # ignore exception from timeout on get
-            pass
+        expires = time.monotonic() + DEVICE_RESPONSE_TIMEOUT
+        while True:
+            try:
+                device_message = self.get_with_heartbeat(
+                    self.response_queue, max(0, expires - time.monotonic()))
+            except Exception as _error:
+                # ignore exception from timeout on get
+                break
+            if len(device_message) == 3 and device_message[2] != request_id:
+                # response to an earlier request that timed out
+                self.log_warning("Late device response ignored: " +
+                                 str(device_message[1]))
+                continue
+            response = device_message[1]
+            break
         self.log_debug("Rcvd from Device: " + str(device_queue_name) + ": "+ str(response))
         # print(">>> sync response: " + str(response))
         return response
@@ -31,8 +31,10 @@ import sys
 
 sys.path.append('../lib')
 
-#import time
 import copy
+import heapq
+import time
+from collections import deque
 
 
 from utils.utility import Utility
@@ -45,11 +47,48 @@ from processes.base_process import BaseProcess
 
 from command_throttle import CommandThrottle
 
+# seconds to wait for the driver to respond to a request
+DRIVER_RESPONSE_TIMEOUT = 2.0
+# most cab requests of one throttle waiting to be processed, more are refused
+MAX_WAITING_CAB_REQUESTS = 32
 
 
 # from structs.io_data import IoData
 
 
+class DriverRequest(object):
+    """ a request sent to the driver, waiting for its response """
+
+    def __init__(self, request_id=None, expires=0, on_response=None):
+        self.request_id = request_id
+        self.expires = expires  # monotonic seconds
+        self.on_response = on_response  # called with response, None if timed out
+
+    def __repr__(self):
+        # return "%s(%r)" % (self.__class__, self.__dict__)
+        fdict = repr(self.__dict__)
+        return f"{self.__class__}({fdict})"
+
+
+class CabRequest(object):
+    """ a cab request of a throttle, waiting to be processed """
+
+    def __init__(self, msg_body=None, coalesce_key=None):
+        self.msg_body = msg_body
+        # requests with the same key may replace each other while waiting,
+        # None if the request is never replaced
+        self.coalesce_key = coalesce_key
+        # bodies of earlier requests this one replaced, answered with it
+        self.replaced = []
+        # dcc ids of consist locos the device did not respond for
+        self.missing_locos = []
+
+    def __repr__(self):
+        # return "%s(%r)" % (self.__class__, self.__dict__)
+        fdict = repr(self.__dict__)
+        return f"{self.__class__}({fdict})"
+
+
 class CabProcess(BaseProcess):
     """ handle cab messages """
 
@@ -59,9 +98,17 @@ class CabProcess(BaseProcess):
                          in_queue=queues[Global.CAB],
                          app_queue=queues[Global.APPLICATION],
                          log_queue=queues[Global.LOGGER])
-        self.response_queue_name = Global.CAB + ":" + Global.RESPONSE
+        # driver responses come back on the cab queue, so new cab requests
+        # are processed while earlier ones wait for the driver
+        self.response_queue_name = Global.CAB
         self.driver_queue = queues[Global.DRIVER]
-        self.response_queue = queues[self.response_queue_name]
+        # request id -> DriverRequest waiting for a driver response
+        self.driver_requests = {}
+        # heap of (expires, request id), may hold completed requests
+        self.driver_request_timers = []
+        self.next_request_id = 0
+        # throttle key -> CabRequests of the throttle, first is in progress
+        self.throttle_requests = {}
         self.roster = None
         self.throttles = {}
         self.throttle_timeout = 0
@@ -91,6 +138,9 @@ class CabProcess(BaseProcess):
     def process_message(self, new_message):
         """ process messages from async message queue """
         consummed = super().process_message(new_message)
+        if not consummed and new_message[0] == Global.DRIVER_RESPONSE:
+            self.__process_driver_response(new_message)
+            consummed = True
         if not consummed:
             (operation, msg_body) = new_message
             # print(">>> message: " + str(operation) + " ... " + str(msg_body))
@@ -103,7 +153,7 @@ class CabProcess(BaseProcess):
                 elif msg_body.command == Global.THROTTLE and \
                         msg_body.sub_command == Global.RELEASE:
                     # print(">>> release loco. ." + str(msg_body))
-                    self.__driver_send_message_and_wait_response(msg_body)
+                    self.__driver_send_message(msg_body)
                     consummed = True
             elif operation == Global.CAB:
                 # cab request forwarded from application
@@ -115,8 +165,54 @@ class CabProcess(BaseProcess):
                 consummed = True
         return consummed
 
+    def process_other(self):
+        """ perform other than message queue tasks """
+        super().process_other()
+        self.__expire_driver_requests()
+
     def process_request_cab_message(self, msg_body=None):
-        """ process a cab request message """
+        """ process a cab request message, requests from a throttle are
+            processed in order, other throttles do not wait for them """
+        throttle_key = self.__request_throttle_key(msg_body)
+        cab_request = CabRequest(msg_body, self.__request_coalesce_key(msg_body))
+        waiting_requests = self.throttle_requests.get(throttle_key, None)
+        if waiting_requests is not None:
+            if self.__coalesce_cab_request(waiting_requests, cab_request):
+                # replaced a waiting request of the same loco
+                pass
+            elif len(waiting_requests) >= MAX_WAITING_CAB_REQUESTS:
+                self.log_warning("Warning: Too many cab requests waiting: " +
+                                 str(throttle_key))
+                self.__publish_responses(
+                    msg_body, Global.ERROR,
+                    "Error: Too many requests waiting for throttle", None)
+            else:
+                # wait for earlier request of this throttle to complete
+                waiting_requests.append(cab_request)
+        else:
+            self.throttle_requests[throttle_key] = deque([cab_request])
+            self.__run_throttle_requests(throttle_key)
+
+    def process_data_cab_message(self, msg_body=None):
+        """ process a cab data message """
+        desired = msg_body.mqtt_desired
+        if desired == Global.PING:
+            # throttle keep alive ping
+            throttle_id = msg_body.mqtt_throttle_id
+            node_id = msg_body.mqtt_node_id
+            throttle_key = CommandThrottle.make_key(node_id, throttle_id)
+            throttle = self.throttles.get(throttle_key, None)
+            if throttle is not None:
+                throttle.last_timestamp = Utility.now_milliseconds()
+
+    #
+    # private functions
+    #
+
+    def __start_cab_request(self, cab_request):
+        """ start processing a cab request,
+            returns True if it is waiting for the driver """
+        msg_body = cab_request.msg_body
         if msg_body.mqtt_desired != Global.PING:
             # only log non "ping" messages
             self.log_info("Cab Request: " + str(msg_body.mqtt_desired) + " ... " +
@@ -127,56 +223,130 @@ class CabProcess(BaseProcess):
         desired = msg_body.mqtt_desired
         reported = Global.ERROR
         message = None
-        data_reported = None
+        # request handlers are generators, they yield messages to be sent
+        # to the driver and are resumed with the driver response
+        request = None
         if desired == Global.CONNECT:
-            (reported, message, data_reported) = \
-                self.__process_cab_connect_request(msg_body)
+            request = self.__process_cab_connect_request(msg_body)
         elif desired == Global.DISCONNECT:
-            (reported, message, data_reported) = \
-                self.__process_cab_disconnect_request(msg_body)
+            request = self.__process_cab_disconnect_request(msg_body)
         elif desired in [Global.ACQUIRE, Global.STEAL]:
-            (reported, message, data_reported) = \
-                self.__process_cab_acquire_request(msg_body)
+            request = self.__process_cab_acquire_request(msg_body)
         elif desired == Global.RELEASE:
-            (reported, message, data_reported) = \
-                self.__process_cab_release_request(msg_body)
+            request = self.__process_cab_release_request(msg_body)
         elif desired == Global.SET_LEAD:
-            (reported, message, data_reported) = \
-                self.__process_cab_set_lead_request(msg_body)
+            request = self.__process_cab_set_lead_request(msg_body)
         elif isinstance(desired, dict):
             if Global.SPEED in desired:
-                (reported, message, data_reported) = \
-                    self.__process_cab_speed_request(msg_body)
+                request = self.__process_cab_speed_request(msg_body)
             elif Global.DIRECTION in desired:
-                (reported, message, data_reported) = \
-                    self.__process_cab_direction_request(msg_body)
+                request = self.__process_cab_direction_request(msg_body)
             elif Global.REPORT in desired:
-                (reported, message, data_reported) = \
-                    self.__process_cab_report_request(msg_body)
+                request = self.__process_cab_report_request(msg_body)
             elif Global.FUNCTION in desired:
-                (reported, message, data_reported) = \
-                    self.__process_cab_function_request(msg_body)
+                request = self.__process_cab_function_request(msg_body)
 
         else:
             reported = Global.ERROR
             message = "Unknown CAB reuquest: {" + str(desired) + "}"
-        self.__publish_responses(msg_body, reported, message, data_reported)
-
-    def process_data_cab_message(self, msg_body=None):
-        """ process a cab data message """
+        if request is None:
+            self.__publish_cab_request_responses(cab_request, reported,
+                                                 message, None)
+            return False
+        return self.__advance_cab_request(cab_request, request, None)
+
+    def __advance_cab_request(self, cab_request, request, driver_response):
+        """ resume a cab request with a driver response, send its next driver
+            message or publish its result, returns True if it is waiting """
+        try:
+            driver_message = request.send(driver_response)
+        except StopIteration as request_done:
+            (reported, message, data_reported) = request_done.value
+            self.__publish_cab_request_responses(cab_request, reported,
+                                                 message, data_reported)
+            return False
+        except Exception as exc:
+            # a failed request must not stall the requests of its throttle
+            message = "Error: Cab request failed: " + str(exc)
+            self.log_error(message)
+            self.__publish_cab_request_responses(cab_request, Global.ERROR,
+                                                 message, None)
+            return False
+        self.__driver_send_message(
+            driver_message,
+            lambda response: self.__continue_cab_request(cab_request, request,
+                                                         response))
+        return True
+
+    def __continue_cab_request(self, cab_request, request, driver_response):
+        """ a driver response for a cab request has been received """
+        self.__record_missing_locos(cab_request, driver_response)
+        if not self.__advance_cab_request(cab_request, request, driver_response):
+            # request is complete, start next one from throttle
+            throttle_key = self.__request_throttle_key(cab_request.msg_body)
+            self.throttle_requests[throttle_key].popleft()
+            self.__run_throttle_requests(throttle_key)
+
+    def __record_missing_locos(self, cab_request, driver_response):
+        """ remember locos the driver reported as not responding """
+        if not isinstance(driver_response, list):
+            driver_response = [driver_response]
+        for resp in driver_response:
+            if resp is not None and resp.reported == Global.ERROR and \
+                    isinstance(resp.items, list):
+                cab_request.missing_locos += resp.items
+
+    def __run_throttle_requests(self, throttle_key):
+        """ start waiting requests of a throttle until one waits for the driver """
+        waiting_requests = self.throttle_requests[throttle_key]
+        while waiting_requests:
+            if self.__start_cab_request(waiting_requests[0]):
+                return
+            waiting_requests.popleft()
+        del self.throttle_requests[throttle_key]
+
+    def __request_throttle_key(self, msg_body):
+        """ key of throttle a cab request is from """
+        return str(msg_body.mqtt_node_id) + ":" + str(msg_body.mqtt_throttle_id)
+
+    def __request_coalesce_key(self, msg_body):
+        """ speed, direction and function requests of a loco replace waiting
+            ones of the same kind, returns None for other requests """
+        rett = None
         desired = msg_body.mqtt_desired
-        if desired == Global.PING:
-            # throttle keep alive ping
-            throttle_id = msg_body.mqtt_throttle_id
-            node_id = msg_body.mqtt_node_id
-            throttle_key = CommandThrottle.make_key(node_id, throttle_id)
-            throttle = self.throttles.get(throttle_key, None)
-            if throttle is not None:
-                throttle.last_timestamp = Utility.now_milliseconds()
-
-    #
-    # private functions
-    #
+        loco_key = (msg_body.mqtt_cab_id, msg_body.mqtt_loco_id)
+        if isinstance(desired, dict):
+            speed = desired.get(Global.SPEED, None)
+            if isinstance(speed, (int, float)) and speed >= 0:
+                # emergency stops are never replaced
+                rett = (Global.SPEED, loco_key)
+            elif Global.SPEED not in desired and Global.DIRECTION in desired:
+                rett = (Global.DIRECTION, loco_key)
+            elif Global.SPEED not in desired and \
+                    Global.DIRECTION not in desired and \
+                    Global.REPORT not in desired and \
+                    isinstance(desired.get(Global.FUNCTION, None), int):
+                rett = (Global.FUNCTION, loco_key, desired[Global.FUNCTION])
+        return rett
+
+    def __coalesce_cab_request(self, waiting_requests, cab_request):
+        """ replace a waiting request with the same coalesce key, the new
+            request is added last, returns True if one was replaced """
+        if cab_request.coalesce_key is None:
+            return False
+        # first request is in progress, only look back past requests that
+        # may be replaced themselves so other requests keep their order
+        for index in range(len(waiting_requests) - 1, 0, -1):
+            waiting_request = waiting_requests[index]
+            if waiting_request.coalesce_key is None:
+                break
+            if waiting_request.coalesce_key == cab_request.coalesce_key:
+                del waiting_requests[index]
+                cab_request.replaced = waiting_request.replaced + \
+                    [waiting_request.msg_body]
+                waiting_requests.append(cab_request)
+                return True
+        return False
 
     def __parse_config(self, _config):
         """ parse options from config dict """
@@ -209,12 +379,12 @@ class CabProcess(BaseProcess):
             driver_message.node_id, driver_message.throttle_id)
         if throttle_key in self.throttles:
             # already connected, clear out old connection
-            self.__process_cab_disconnect_request(msg_body)
+            yield from self.__process_cab_disconnect_request(msg_body)
         driver_message.command = Global.THROTTLE
         driver_message.sub_command = Global.CONNECT
-        connect_response_message =  \
-            self.__driver_send_message_and_wait_response(driver_message)
-        if connect_response_message.reported == Global.CONNECTED:
+        connect_response_message = yield driver_message
+        if connect_response_message is not None and \
+                connect_response_message.reported == Global.CONNECTED:
             new_throttle = CommandThrottle(
                 driver_message.node_id, driver_message.throttle_id)
             new_throttle.last_timestamp = Utility.now_milliseconds()
@@ -237,8 +407,7 @@ class CabProcess(BaseProcess):
         else:
             driver_message.command = Global.THROTTLE
             driver_message.sub_command = Global.DISCONNECT
-            _driver_response_message =  \
-                self.__driver_send_message_and_wait_response(driver_message)
+            _driver_response_message = yield driver_message
             # delete the throttle and its cabs and locos
             del self.throttles[throttle_key]
             reported = Global.DISCONNECT
@@ -267,8 +436,7 @@ class CabProcess(BaseProcess):
                 driver_message.sub_command = Global.STEAL
             else:
                 driver_message.sub_command = Global.ACQUIRE
-            driver_response_message =  \
-                self.__driver_send_message_and_wait_response(driver_message)
+            driver_response_message = yield driver_message
             if not isinstance(driver_response_message, list):
                 driver_response_message = [driver_response_message]
             for resp in driver_response_message:
@@ -290,8 +458,7 @@ class CabProcess(BaseProcess):
             driver_message.sub_command = Global.SPEED
             driver_message.speed = 0
             driver_message.direction = Global.FORWARD
-            _driver_response =  \
-                self.__driver_send_message_and_wait_response(driver_message)
+            _driver_response = yield driver_message
             self.__publish_loco_direction_changed(msg_body.mqtt_loco_id, Global.FORWARD)
         return (reported, message, data_reported)
 
@@ -303,8 +470,7 @@ class CabProcess(BaseProcess):
         driver_message = self.__parse_mqtt_data(msg_body)
         driver_message.command = Global.THROTTLE
         driver_message.sub_command = Global.SET_LEAD
-        driver_response =  \
-            self.__driver_send_message_and_wait_response(driver_message)
+        driver_response = yield driver_message
         if not isinstance(driver_response, list):
             driver_response = [driver_response]
         for resp in driver_response:
@@ -321,8 +487,7 @@ class CabProcess(BaseProcess):
         driver_message = self.__parse_mqtt_data(msg_body)
         driver_message.command = Global.THROTTLE
         driver_message.sub_command = Global.RELEASE
-        driver_response =  \
-            self.__driver_send_message_and_wait_response(driver_message)
+        driver_response = yield driver_message
         if not isinstance(driver_response, list):
             driver_response = [driver_response]
         for resp in driver_response:
@@ -346,8 +511,7 @@ class CabProcess(BaseProcess):
             # convert speed percent to speedsteps
             speed = round((speed / 100) * self.default_speedsteps)
         driver_message.speed = speed
-        driver_response =  \
-            self.__driver_send_message_and_wait_response(driver_message)
+        driver_response = yield driver_message
         # print(">>> speed response:" + str(driver_response))
         if not isinstance(driver_response, list):
             driver_response = [driver_response]
@@ -368,8 +532,7 @@ class CabProcess(BaseProcess):
         driver_message.command = Global.THROTTLE
         driver_message.sub_command = Global.DIRECTION
         driver_message.direction = msg_body.mqtt_desired[Global.DIRECTION]
-        driver_response =  \
-            self.__driver_send_message_and_wait_response(driver_message)
+        driver_response = yield driver_message
         if not isinstance(driver_response, list):
             driver_response = [driver_response]
         for resp in driver_response:
@@ -428,8 +591,7 @@ class CabProcess(BaseProcess):
             driver_message.dcc_id = msg_body.mqtt_loco_id
             driver_message.function = new_function
             driver_message.mode = new_function_state
-            _dcc_response =  \
-                self.__driver_send_message_and_wait_response(driver_message)
+            _dcc_response = yield driver_message
 
         if message is not None:
             reported = Global.ERROR
@@ -448,18 +610,17 @@ class CabProcess(BaseProcess):
         driver_message.command = Global.THROTTLE
         driver_message.sub_command = Global.REPORT
         driver_message.mode = msg_body.mqtt_desired[Global.REPORT]
-        driver_response =  \
-            self.__driver_send_message_and_wait_response(driver_message)
+        driver_response = yield driver_message
         if not isinstance(driver_response, list):
             driver_response = [driver_response]
         for resp in driver_response:
-            if resp.reported == Global.ERROR:
-                reported = Global.ERROR
-            else:
-                if resp.mode == Global.SPEED:
+            if resp is not None:
+                if resp.reported == Global.ERROR:
+                    reported = Global.ERROR
+                elif resp.mode == Global.SPEED:
                     reported = {Global.SPEED: resp.speed}
                 else:
-                    reported = {Global.DIRECTION: resp.direction}#
+                    reported = {Global.DIRECTION: resp.direction}
         return (reported, message, data_reported)
 
     def __report_loco_stolen(self, gui_message):
@@ -476,12 +637,29 @@ class CabProcess(BaseProcess):
             self.__publish_responses(response_message, Global.RELEASED,
                                      None, None)
 
-    def __publish_responses(self, msg_body, reported, message, data_reported):
-        """ format and publish responses """
+    def __publish_cab_request_responses(self, cab_request, reported, message,
+                                        data_reported):
+        """ publish the response of a cab request, requests it replaced
+            get the same response """
+        missing_locos = cab_request.missing_locos or None
+        if missing_locos is not None:
+            # part of a consist did not respond, the request failed for them
+            reported = Global.ERROR
+            message = "Error: No response from locos: " + str(missing_locos)
+        for msg_body in cab_request.replaced + [cab_request.msg_body]:
+            self.__publish_responses(msg_body, reported, message, data_reported,
+                                     missing_locos)
+
+    def __publish_responses(self, msg_body, reported, message, data_reported,
+                            missing_locos=None):
+        """ format and publish responses, missing_locos are the dcc ids of
+            consist locos that failed """
         # print(">>> response: " + str(reported))
         metadata = None
         if message is not None:
             metadata = {Global.MESSAGE: message}
+        if missing_locos is not None:
+            metadata[Global.LOCOS] = missing_locos
         self.app_queue.put((Global.PUBLISH, {
             Global.TYPE: Global.RESPONSE,
             Global.REPORTED: reported,
@@ -580,26 +758,48 @@ class CabProcess(BaseProcess):
 #        self.driver_queue.put((Global.DRIVER_SEND,
 #                               send_message))
 
-    def __driver_send_message_and_wait_response(self, send_message):
-        """ put a message in driver queue, wait for a reply """
+    def __driver_send_message(self, send_message, on_response=None):
+        """ put a message in driver queue, on_response is called with the
+            driver response, or with None if there is no response in time """
         # assumes message is a GuiMessage class
-        response = {Global.TEXT: Global.ERROR}
-        self.log_debug("sync send and respond: " + str(send_message))
+        self.next_request_id += 1
+        request_id = self.next_request_id
         send_message.response_queue = self.response_queue_name
+        send_message.request_id = request_id
+        expires = time.monotonic() + DRIVER_RESPONSE_TIMEOUT
+        self.driver_requests[request_id] = \
+            DriverRequest(request_id, expires, on_response)
+        heapq.heappush(self.driver_request_timers, (expires, request_id))
+        self.log_debug("async send: %s", send_message)
         self.driver_queue.put(
             (Global.DRIVER_SEND_AND_RESPOND, send_message))
-        # timeout = 2000 + Utility.now_milliseconds()  # timeout after 2 seconds
-        # print(">>> sync send: "+ str(send_message))
-        response = None
-        try:
-            (Global.DRIVER_RESPONSE,
-             response) = self.response_queue.get(True, 2.0)
-        except Exception as _error:
-            # ignore exception from timeout on get
-            pass
-        self.log_debug("sync response: " + str(response))
-        #  print(">>> sync response: " + str(response))
-        return response
+
+    def __process_driver_response(self, new_message):
+        """ complete the driver request a response is for """
+        request_id = None
+        if len(new_message) == 3:
+            (_operation, response, request_id) = new_message
+        else:
+            (_operation, response) = new_message
+        self.log_debug("async response: %s %s", request_id, response)
+        driver_request = self.driver_requests.pop(request_id, None)
+        if driver_request is None:
+            # response arrived after request timed out
+            self.log_warning("Late driver response ignored: " + str(request_id))
+        elif driver_request.on_response is not None:
+            driver_request.on_response(response)
+
+    def __expire_driver_requests(self):
+        """ complete requests the driver has not responded to in time """
+        now = time.monotonic()
+        timers = self.driver_request_timers
+        while timers and timers[0][0] <= now:
+            (_expires, request_id) = heapq.heappop(timers)
+            driver_request = self.driver_requests.pop(request_id, None)
+            if driver_request is not None:
+                self.log_warning("Driver response timed out: " + str(request_id))
+                if driver_request.on_response is not None:
+                    driver_request.on_response(None)
 
     def __parse_mqtt_data(self, mqtt_data):
         """ create a throttle message from a mqtt data message body """
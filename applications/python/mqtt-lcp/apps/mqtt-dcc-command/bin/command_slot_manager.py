@@ -27,6 +27,7 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SO
 """
 import sys
 import copy
+import heapq
 
 sys.path.append('../lib')
 
@@ -46,6 +47,9 @@ class CommandSlotManager(object):
         self.slots = {}
         self.slots_by_dcc_id = {}
         self.slots_by_cab_id = {}  # lists of slot id's keyed by node/throtttle/cab ids
+        self.cab_keys_by_slot = {}  # cab key of each slot in slots_by_cab_id
+        self.free_slot_ids = set()
+        self.free_slot_heap = []  # lowest free slot first, may hold stale ids
         self.__initialize_slots()
 
     def connect_throttle(self, gui_message):
@@ -124,11 +128,7 @@ class CommandSlotManager(object):
 
     def get_slots_available(self):
         """ return count of unasigned register slots """
-        available = 0
-        for _slot_id, slot_loco in self.slots.items():
-            if slot_loco is None:
-                available += 1
-        return available
+        return len(self.free_slot_ids)
 
     def set_lead(self, gui_message):
         """ set the lead loco in consist """
@@ -193,29 +193,28 @@ class CommandSlotManager(object):
         if existing_slot_id is not None:
             first_avail= existing_slot_id
         else:
-            for slot_id, slot_loco in self.slots.items():
-                if slot_loco is None:
-                    first_avail = slot_id
-                    break
+            first_avail = self.__pop_free_slot()
        # print(">>> first avail: " + str(first_avail))
         if first_avail is not None:
             # assign loco to first avail slot
             rett = first_avail
             slot_loco = CommandLoco.parse_gui_message(gui_message)
             slot_loco.slot_id = rett
+            old_slot_loco = self.slots.get(rett, None)
+            if old_slot_loco is not None and \
+                    self.slots_by_dcc_id.get(old_slot_loco.dcc_id, None) == rett:
+                del self.slots_by_dcc_id[old_slot_loco.dcc_id]
             self.slots[rett] = slot_loco
+            self.slots_by_dcc_id[slot_loco.dcc_id] = rett
+            self.free_slot_ids.discard(rett)
             # self.add_to_slots_by_cab_id(slot_loco)
-        self.__rebuild_slots_by_dcc_id()
-        self.__rebuild_slots_by_cab_id()
         # print(">>> rett slot: " + str(rett))
         return rett
 
     def clear_a_slot(self, slot_id):
         """ clear out a register slot, make it available for reuse"""
         if 1 <= slot_id <= self.slot_count:
-            self.slots[slot_id] = None
-        self.__rebuild_slots_by_dcc_id()
-        self.__rebuild_slots_by_cab_id()
+            self.__free_slot(slot_id)
         #print(">>> clear a slot: [" + str(slot_id) + "] " + str(self.slots))
         return slot_id
 
@@ -240,9 +239,7 @@ class CommandSlotManager(object):
             if slot_loco is not None and \
                     slot_loco.node_id == node_id and \
                     slot_loco.throttle_id == throttle_id:
-                self.slots[slot_id] = None
-        self.__rebuild_slots_by_dcc_id()
-        self.__rebuild_slots_by_cab_id()
+                self.__free_slot(slot_id)
 
     def find_throttle_locos(self, node_id, throttle_id):
         """ get a list of slot locos associated with this throttle """
@@ -265,6 +262,43 @@ class CommandSlotManager(object):
         else:
             # append to existing list
             self.slots_by_cab_id[cab_key] += [command_loco.slot_id]
+        self.cab_keys_by_slot[command_loco.slot_id] = cab_key
+
+    def check_indexes(self):
+        """ compare the slot indexes to ones rebuilt from the slots,
+            returns list of differences, empty if none """
+        rett = []
+        slots_by_dcc_id = {}
+        free_slot_ids = set()
+        for slot_id, slot_loco in self.slots.items():
+            if slot_loco is None:
+                free_slot_ids.add(slot_id)
+            else:
+                slots_by_dcc_id[slot_loco.dcc_id] = slot_id
+        if slots_by_dcc_id != self.slots_by_dcc_id:
+            rett.append("slots by dcc id: " + str(self.slots_by_dcc_id) +
+                        " expected: " + str(slots_by_dcc_id))
+        if free_slot_ids != self.free_slot_ids:
+            rett.append("free slots: " + str(self.free_slot_ids) +
+                        " expected: " + str(free_slot_ids))
+        if not free_slot_ids.issubset(self.free_slot_heap):
+            rett.append("free slots missing from heap: " +
+                        str(free_slot_ids - set(self.free_slot_heap)))
+        cab_keys_by_slot = {}
+        for cab_key, cab_slot_list in self.slots_by_cab_id.items():
+            if not cab_slot_list:
+                rett.append("empty cab slot list: " + str(cab_key))
+            for slot_id in cab_slot_list:
+                if self.slots.get(slot_id, None) is None:
+                    rett.append("free slot in cab: " + str(cab_key) +
+                                " " + str(slot_id))
+                if slot_id in cab_keys_by_slot:
+                    rett.append("slot in more than one cab: " + str(slot_id))
+                cab_keys_by_slot[slot_id] = cab_key
+        if cab_keys_by_slot != self.cab_keys_by_slot:
+            rett.append("cab keys by slot: " + str(self.cab_keys_by_slot) +
+                        " expected: " + str(cab_keys_by_slot))
+        return rett
 
     def get_lead_loco(self, slot_list):
         """ find the lead loco in a cab """
@@ -284,6 +318,30 @@ class CommandSlotManager(object):
         for slot in range(1, \
                 self.slot_count + 1):  # slot 0 is for programming, don't use it
             self.slots[slot] = None
+            self.free_slot_ids.add(slot)
+        # ascending list is already a valid heap
+        self.free_slot_heap = sorted(self.free_slot_ids)
+
+    def __pop_free_slot(self):
+        """ remove and return lowest free slot id, None if all in use """
+        while self.free_slot_heap:
+            slot_id = heapq.heappop(self.free_slot_heap)
+            if slot_id in self.free_slot_ids:
+                return slot_id
+            # stale, slot was assigned as an existing slot
+        return None
+
+    def __free_slot(self, slot_id):
+        """ clear a slot and remove it from the indexes """
+        slot_loco = self.slots.get(slot_id, None)
+        self.slots[slot_id] = None
+        if slot_loco is not None:
+            if self.slots_by_dcc_id.get(slot_loco.dcc_id, None) == slot_id:
+                del self.slots_by_dcc_id[slot_loco.dcc_id]
+            self.__remove_loco_from_cab(slot_id)
+        if slot_id not in self.free_slot_ids:
+            self.free_slot_ids.add(slot_id)
+            heapq.heappush(self.free_slot_heap, slot_id)
 
     def __build_cab_key(self, command_loco):
         """ build the key for a loco list for a cab """
@@ -300,45 +358,17 @@ class CommandSlotManager(object):
                 cab_loco_list = self.slots_by_cab_id.get(cab_key, [])
                 cab_loco_list += [slot_id]
                 self.slots_by_cab_id[cab_key] = cab_loco_list
+                self.cab_keys_by_slot[slot_id] = cab_key
 
-#    def __remove_loco_from_cab(self, slot_id):
-#        """ remove a slot_id of a loco from the cabs loco list """
-#        slot_loco = self.slots.get(slot_id, None)
-#        if slot_loco is not None:
-#            cab_key = self.__build_cab_key(slot_loco)
-#            if cab_key is not None:
-#                new_cab_loco_list = []
-#                for cab_slot_id in self.slots_by_cab_id.get(cab_key, []):
-#                    if cab_slot_id != slot_id:
-#                        new_cab_loco_list += [cab_slot_id]
-#                self.slots_by_cab_id[cab_key] = new_cab_loco_list
-
-    def __rebuild_slots_by_dcc_id(self):
-        """ rebuild slots by dcc_id to remove slots no longer in use"""
-        self.slots_by_dcc_id = {}
-        for slot_id, slot_loco in self.slots.items():
-            if slot_loco is not None:
-                self.slots_by_dcc_id[slot_loco.dcc_id] = slot_id
-        # print(">>> slots by ID: " + str(self.slots_by_dcc_id))
-
-    def __rebuild_slots_by_cab_id(self):
-        """ rebuild slots by cab_id, removing locos no longer in use """
-        cab_key_list = []
-        for cab_key in self.slots_by_cab_id:
-            cab_key_list.append(cab_key)
-        for cab_key in cab_key_list:
+    def __remove_loco_from_cab(self, slot_id):
+        """ remove a slot_id of a loco from the cabs loco list """
+        cab_key = self.cab_keys_by_slot.pop(slot_id, None)
+        if cab_key is not None:
             cab_slot_list = self.slots_by_cab_id[cab_key]
-            new_cab_slot_list = []
-            for slot_id in cab_slot_list:
-                slot = self.slots.get(slot_id, None)
-                if slot is not None:
-                    new_cab_slot_list += [slot_id]
-            if new_cab_slot_list:
-                self.slots_by_cab_id[cab_key] = new_cab_slot_list
-            else:
+            cab_slot_list.remove(slot_id)
+            if not cab_slot_list:
                 # no locos for cab, delete cab list
                 del self.slots_by_cab_id[cab_key]
-        # print(">>> slots by ID: " + str(self.slots_by_dcc_id))
 
     def __log_cab_locos(self, gui_message):
         """ log locos in a cab """
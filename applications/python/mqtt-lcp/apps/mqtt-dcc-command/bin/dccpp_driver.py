@@ -33,9 +33,9 @@ sys.path.append('../lib')
 from utils.global_constants import Global
 
 from decoders.dccpp_decoder import DccppDecoder
-from decoders.dccpp_encoder import DccppEncoder
+from decoders.dccpp_encoder import DccppEncoder, FUNCTION_GROUP_BYTES
 
-from base_driver import BaseDriver
+from base_driver import BaseDriver, LANE_IMMEDIATE, LANE_CONTROL, LANE_SPEED
 
 
 class DccppDriver(BaseDriver):
@@ -47,11 +47,40 @@ class DccppDriver(BaseDriver):
 
         self.decoder = DccppDecoder()
         self.encoder = DccppEncoder()
+        # serial process writes message lists back to back
+        self.pipeline_device_messages = True
 
     def initialize_process(self):
         """ initialize the process """
         super().initialize_process()
 
+    def encode_response_prefix(self, msg_body):
+        """ start of the dcc++ response to a message """
+        return self.encoder.encode_response_prefix(msg_body)
+
+    def find_command_lane(self, gui_message):
+        """ lane and key of a speed, direction or function command,
+            dcc++ sends speed and direction in one <t> command and all
+            functions of a group in one <f> command, only the newest
+            of each needs to be sent """
+        loco_key = gui_message.dcc_id
+        if loco_key is None:
+            loco_key = (gui_message.node_id, gui_message.throttle_id,
+                        gui_message.cab_id)
+        rett = None
+        if gui_message.sub_command == Global.FUNCTION:
+            group = FUNCTION_GROUP_BYTES.get(gui_message.function, None)
+            if group is not None:
+                rett = (LANE_CONTROL, (loco_key, Global.FUNCTION, group[0]))
+        elif gui_message.sub_command == Global.DIRECTION:
+            rett = (LANE_CONTROL, (loco_key, Global.THROTTLE))
+        elif gui_message.speed is not None and gui_message.speed < 0:
+            # estop, never waits
+            rett = (LANE_IMMEDIATE, (loco_key, Global.THROTTLE))
+        else:
+            rett = (LANE_SPEED, (loco_key, Global.THROTTLE))
+        return rett
+
     def process_non_gui_message(self, msg_body):
         """ process messages not related to throttles """
         # print(">>> non throttle: " + str(msg_body))
@@ -59,9 +88,11 @@ class DccppDriver(BaseDriver):
             # for dcc++, switch command do not get acknowleged, send only
             self.send_gui_message(msg_body)
             # print(">>> send response: " + msg_body.response_queue)
-            self.publish_response(msg_body, msg_body.response_queue)
+            self.publish_response(msg_body, msg_body.response_queue,
+                                  msg_body.request_id)
         else:
             # print(">>> non throttle: " + str(msg_body))
             response_message = self.send_and_wait_gui_message(msg_body)
             # print(">>> device response: " + str(response_message))
-            self.publish_response(response_message, msg_body.response_queue)
+            self.publish_response(response_message, msg_body.response_queue,
+                                  msg_body.request_id)
@@ -11,7 +11,7 @@ roster_process - Generate the requested rosters for for mqtt-lcp apps.
 
                 The application monitors the directory the loco json files are stored.  Periodiucally the files
                 in the folder are checked for changes, files added, files deleted or files modified. If changes are
-                detected, all of the files are reloaded and a new roster is build.  When this happens, a
+                detected, only the changed files are reloaded and the roster is updated.  When this happens, a
                 data messesge is published indicating the roster has changed.
 
                 Optionally, the application can import date from the loco roster in JMRI.  To enable the import
@@ -93,6 +93,9 @@ class RosterProcess(BaseProcess):
         self.roster_server_path = None
         self.roster_dir_watcher = None
         self.consists_dir_watcher = None
+        # file name -> dcc id, to remove entries when files are removed
+        self.loco_files = {}
+        self.consist_files = {}
         self.import_roster_send_after_message = None
         self.check_roster_send_after_message = None
         self.mqtt_config = None
@@ -117,7 +120,6 @@ class RosterProcess(BaseProcess):
         else:
             self.roster_dir_watcher = DirWatcher(self.roster_data_path)
             self.consists_dir_watcher = DirWatcher(self.consists_data_path)
-            self.__check_for_roster_changes()
             self.__load_roster()
         (self.roster_server_host, self.roster_server_port,
             self.roster_server_path, self.roster_server_refresh) \
@@ -139,9 +141,7 @@ class RosterProcess(BaseProcess):
             # print(">>> roster new message: " + str(new_message))
             (msg_type, msg_body) = new_message
             if msg_type == Global.ROSTER:
-                if self.__check_for_roster_changes():
-                    self.log_info("Roster data has changed, reloading locos and consists files")
-                    self.__load_roster()
+                self.__check_for_roster_changes()
                 self.send_after(self.check_roster_send_after_message)
                 msg_consummed = True
             if msg_type == Global.IMPORT:
@@ -155,6 +155,13 @@ class RosterProcess(BaseProcess):
                 msg_consummed = True
         return msg_consummed
 
+    def shutdown_process(self):
+        """ stop watching roster directories """
+        for watcher in [self.roster_dir_watcher, self.consists_dir_watcher]:
+            if watcher is not None:
+                watcher.close()
+        super().shutdown_process()
+
     #
     # private functions
     #
@@ -179,12 +186,34 @@ class RosterProcess(BaseProcess):
                                              Global.DATA: None}))
 
     def __check_for_roster_changes(self):
-        """ check for changes to roster and reload is necessary"""
+        """ check for changes to roster and reload changed files """
         #if self.roster_server_host is not None and \
         #        self.roster_server_path is not None:
         #    self.__import_roster_from_server()
-        return (self.roster_dir_watcher.has_changed() or\
-                self.consists_dir_watcher.has_changed())
+        if self.roster_dir_watcher is None or self.roster is None:
+            return
+        loco_changes = self.roster_dir_watcher.get_changes()
+        consist_changes = self.consists_dir_watcher.get_changes()
+        if loco_changes.rescan or consist_changes.rescan:
+            self.log_info("Roster data has changed, reloading locos and consists files")
+            self.__load_roster()
+        elif loco_changes or consist_changes:
+            self.log_info("Roster data has changed, reloading changed files")
+            self.__apply_changes(loco_changes, self.loco_files,
+                                 self.roster.locos, self.__load_loco_file)
+            self.__apply_changes(consist_changes, self.consist_files,
+                                 self.roster.consists, self.__load_consist_file)
+            self.__publish_roster_changed()
+
+    def __apply_changes(self, changes, data_files, data_map, load_file):
+        """ update roster entries from changed files """
+        for full_file_name in changes.removed | changes.modified:
+            dcc_id = data_files.pop(full_file_name, None)
+            if dcc_id is not None:
+                data_map.pop(dcc_id, None)
+        for full_file_name in changes.added | changes.modified:
+            if os.path.isfile(full_file_name):
+                load_file(full_file_name)
 
     def __generate_roster_report(self):
         """ generate report data for roster """
@@ -213,6 +242,8 @@ class RosterProcess(BaseProcess):
         #roster_map = self.json_helper.load_and_parse_file(roster_path)
         #print(">>> roster_map: " + str(roster_map))
         self.roster = Roster()
+        self.loco_files = {}
+        self.consist_files = {}
         self.__load_loco_files()
         self.__load_consists_files()
         self.__publish_roster_changed()
@@ -222,28 +253,38 @@ class RosterProcess(BaseProcess):
         if os.path.isdir(self.roster_data_path):
             for file_name  in os.listdir(self.roster_data_path):
                 full_file_name = os.path.join(self.roster_data_path, file_name)
-                # print(">>> roster file: "+str(full_file_name))
-                if ".json" in full_file_name:
-                    loco_parsed = self.json_helper.parse_one_json_file(full_file_name)
-                    new_loco = LocoData(init_map=loco_parsed)
-                    self.roster.locos.update({new_loco.dcc_id: new_loco})
-                    self.log_info("Loaded Loco: "+str(new_loco.dcc_id))
+                self.__load_loco_file(full_file_name)
         # print(">>> rosterclass: "+ str(self.roster))
 
+    def __load_loco_file(self, full_file_name):
+        """ load one loco json data file """
+        # print(">>> roster file: "+str(full_file_name))
+        if ".json" in full_file_name:
+            loco_parsed = self.json_helper.parse_one_json_file(full_file_name)
+            new_loco = LocoData(init_map=loco_parsed)
+            self.roster.locos.update({new_loco.dcc_id: new_loco})
+            self.loco_files[full_file_name] = new_loco.dcc_id
+            self.log_info("Loaded Loco: "+str(new_loco.dcc_id))
+
     def __load_consists_files(self):
         """ load consists data from json data files """
         if os.path.isdir(self.consists_data_path):
             for file_name  in os.listdir(self.consists_data_path):
                 full_file_name = os.path.join(self.consists_data_path, file_name)
-                # print(">>> consists file: "+str(full_file_name))
-                if ".json" in full_file_name:
-                    consist_parsed = self.json_helper.parse_one_json_file(full_file_name)
-                new_consist = ConsistData(init_map=consist_parsed)
-                self.roster.consists.update({new_consist.dcc_id: new_consist})
-                self.log_info("Loaded Consist: "+str(new_consist.dcc_id))
+                self.__load_consist_file(full_file_name)
         #print(">>> rosterclass: "+ str(self.roster))
 
 
+    def __load_consist_file(self, full_file_name):
+        """ load one consist json data file """
+        # print(">>> consists file: "+str(full_file_name))
+        if ".json" in full_file_name:
+            consist_parsed = self.json_helper.parse_one_json_file(full_file_name)
+            new_consist = ConsistData(init_map=consist_parsed)
+            self.roster.consists.update({new_consist.dcc_id: new_consist})
+            self.consist_files[full_file_name] = new_consist.dcc_id
+            self.log_info("Loaded Consist: "+str(new_consist.dcc_id))
+
     def __parse_path_options_config(self, config):
         """ parse path options section of config file """
         roster_data_path = None
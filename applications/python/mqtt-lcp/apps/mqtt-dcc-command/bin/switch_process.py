@@ -273,7 +273,7 @@ class SwitchProcess(BaseProcess):
         response = None
         try:
             (Global.DRIVER_INPUT,
-             response) = self.response_queue.get(True, 2.0)
+             response) = self.get_with_heartbeat(self.response_queue, 2.0)
         except Exception as _error:
             # ignore exception from timeout on get
             pass
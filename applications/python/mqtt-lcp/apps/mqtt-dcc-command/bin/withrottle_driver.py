@@ -59,8 +59,8 @@ class WithrottleDriver(BaseDriver):
         self.all_device_queues += [Global.WITHROTTLE2]
         self.all_device_queues += [Global.WITHROTTLE3]
         self.all_device_queues += [Global.WITHROTTLE4]
-        self.decoder = WithrottleDecoder(queues[Global.LOGGER])
-        self.encoder = WithrottleEncoder(queues[Global.LOGGER])
+        self.decoder = WithrottleDecoder(logger=self)
+        self.encoder = WithrottleEncoder(logger=self)
         self.cab_queue = queues[Global.CAB]
         self.switch_queue = queues[Global.SWITCH]
         self.wi_ping_send_after_message = None
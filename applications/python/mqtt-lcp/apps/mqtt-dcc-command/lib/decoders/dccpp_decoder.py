@@ -93,8 +93,8 @@ class DccppDecoder(object):
             if command_parts[3] == "1":
                 loco_dir = Global.FORWARD
             rett.command = Global.THROTTLE
-            rett.slot_id = cmd[1]
-            rett.value = cmd[2]
+            rett.slot_id = command_parts[1]
+            rett.value = command_parts[2]
             rett.direction = loco_dir
         return rett
 
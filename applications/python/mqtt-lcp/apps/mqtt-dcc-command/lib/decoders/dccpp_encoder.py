@@ -28,6 +28,7 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SO
 """
 
 import sys
+from itertools import compress, product
 
 sys.path.append('../../lib')
 
@@ -36,6 +37,40 @@ sys.path.append('../../lib')
 from utils.global_constants import Global
 from utils.global_synonyms import Synonyms
 
+# dcc function groups: (first function, last function, group byte,
+# True if function bits are sent in a second byte after the group byte)
+FUNCTION_GROUPS = (
+    (0, 4, 128, False),  # f0-f4
+    (5, 8, 176, False),  # f5-f8
+    (9, 12, 160, False),  # f9-f12
+    (13, 20, 222, True),  # f13-f20
+    (21, 28, 223, True))  # f21-f28
+
+# bit of each function in its group, f0 is after f1-f4
+FUNCTION_BITS = (16, 1, 2, 4, 8,
+                 1, 2, 4, 8,
+                 1, 2, 4, 8,
+                 1, 2, 4, 8, 16, 32, 64, 128,
+                 1, 2, 4, 8, 16, 32, 64, 128)
+
+
+def build_function_group_bytes():
+    """ function -> (first function, last function + 1, group byte,
+        second byte used, function bits of each on/off combination) """
+    rett = {}
+    for (first, last, group_byte, second_byte) in FUNCTION_GROUPS:
+        function_bits = FUNCTION_BITS[first:last + 1]
+        bits_by_states = {}
+        for states in product((0, 1), repeat=len(function_bits)):
+            bits_by_states[states] = sum(compress(function_bits, states))
+        for function in range(first, last + 1):
+            rett[function] = (first, last + 1, group_byte, second_byte,
+                              bits_by_states)
+    return rett
+
+
+FUNCTION_GROUP_BYTES = build_function_group_bytes()
+
 
 class DccppEncoder(object):
     """ Encode DCC++ serial commands """
@@ -85,76 +120,32 @@ class DccppEncoder(object):
 
     def encode_throttle_request(self, message):
         """ encode a throttle request message"""
-        slot = message.slot_id
-        dcc_id = message.dcc_id
-        speed = message.speed
-        direction = message.direction
         loco_dir = 1
-        if direction == Global.REVERSE:
+        if message.direction == Global.REVERSE:
             loco_dir = 0
-        rett = "<t " + str(slot) + " " + str(dcc_id) + " " + \
-                str(speed) + " " + str(loco_dir) + ">"
+        rett = f"<t {message.slot_id} {message.dcc_id} {message.speed} {loco_dir}>"
         #print(">>> throttle: " + str(rett))
         return rett
 
     def encode_function_request(self, message):
-        """ encode a loco function request message """
-        _slot = message.slot_id
-        dcc_id = message.dcc_id
-        changed_function = message.function
-        # functions_list_globals = message.items
+        """ encode a loco function request message,
+            sends the function group the changed function is in """
         functions_list = message.items  # assumes func dict conrain 0,1 as off, on
-
+        group = FUNCTION_GROUP_BYTES.get(message.function, None)
         rett = ""
-        func_byte1 = -1
-        func_byte2 = -1
-        if changed_function in range(0, 5):  # f0-f4
-            func_byte1 = 128
-            func_byte1 += functions_list[0] * 16
-            func_byte1 += functions_list[1] * 1
-            func_byte1 += functions_list[2] * 2
-            func_byte1 += functions_list[3] * 4
-            func_byte1 += functions_list[4] * 8
-        elif changed_function in range(5, 9):  # f5-f8
-            func_byte1 = 176
-            func_byte1 += functions_list[5] * 1
-            func_byte1 += functions_list[6] * 2
-            func_byte1 += functions_list[7] * 4
-            func_byte1 += functions_list[8] * 8
-        elif changed_function in range(9, 13):  # f9-f12
-            func_byte1 = 160
-            func_byte1 += functions_list[9] * 1
-            func_byte1 += functions_list[10] * 2
-            func_byte1 += functions_list[11] * 4
-            func_byte1 += functions_list[12] * 8
-        elif changed_function in range(13, 21):  # f13-f20
-            func_byte1 = 222
-            func_byte2 = 0
-            func_byte2 += functions_list[13] * 1
-            func_byte2 += functions_list[14] * 2
-            func_byte2 += functions_list[15] * 4
-            func_byte2 += functions_list[16] * 8
-            func_byte2 += functions_list[17] * 16
-            func_byte2 += functions_list[18] * 32
-            func_byte2 += functions_list[19] * 64
-            func_byte2 += functions_list[20] * 128
-        elif changed_function in range(21, 29):  # f21-f28
-            func_byte1 = 223
-            func_byte2 = 0
-            func_byte2 += functions_list[21] * 1
-            func_byte2 += functions_list[22] * 2
-            func_byte2 += functions_list[23] * 4
-            func_byte2 += functions_list[24] * 8
-            func_byte2 += functions_list[25] * 16
-            func_byte2 += functions_list[26] * 32
-            func_byte2 += functions_list[27] * 64
-            func_byte2 += functions_list[28] * 128
-        if func_byte1 != -1:
-            # command = self.__generate_function_command(slot, dcc_id, func_byte1, func_byte2)
-            rett = "<f " + str(dcc_id) + " " + str(func_byte1)
-            if func_byte2 != -1:
-                rett = rett + ", " + str(func_byte2)
-            rett = rett + ">"
+        if group is not None:
+            (first, end, group_byte, second_byte, bits_by_states) = group
+            # items is a dict keyed by function number, not a list
+            states = tuple(functions_list[f] for f in range(first, end))
+            bits = bits_by_states.get(states, None)
+            if bits is None:
+                # not all 0 or 1
+                bits = sum(state * bit for (state, bit) in
+                           zip(states, FUNCTION_BITS[first:end]))
+            if second_byte:
+                rett = f"<f {message.dcc_id} {group_byte}, {bits}>"
+            else:
+                rett = f"<f {message.dcc_id} {group_byte + bits}>"
         # print(">>> func code: " + str(rett))
         return rett
 
@@ -171,6 +162,21 @@ class DccppEncoder(object):
             mode) + ">"
         return rett
 
+    def encode_response_prefix(self, message):
+        """ start of the line the command station responds to a message
+            with, None if it does not respond, "" if any line will do """
+        rett = ""
+        if message.command == Global.THROTTLE:
+            rett = None
+            if message.sub_command != Global.FUNCTION:
+                # <t REG CAB SPEED DIR> is answered with <T REG SPEED DIR>
+                rett = f"<T {message.slot_id} "
+        elif message.command == Global.POWER:
+            rett = "<p"
+        elif message.command == Global.SWITCH:
+            rett = None
+        return rett
+
     #
     # private functions
     #
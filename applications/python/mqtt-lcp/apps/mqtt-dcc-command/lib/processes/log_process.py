@@ -29,14 +29,133 @@ import sys
 
 sys.path.append('../../lib')
 
+import os
+import threading
 import logging
-import logging.handlers
 import colorlog
 
 from utils.global_constants import Global
 
 from processes.base_process import BaseProcess
 
+# bytes of formatted records held before the writer thread is woken
+LOG_BUFFER_SIZE = 64 * 1024
+# max bytes held while the writer is behind, lower level records are dropped
+LOG_BUFFER_LIMIT = 4 * 1024 * 1024
+# default seconds between writes of held records
+LOG_FLUSH_TIME = 1.0
+
+
+class BufferedFileHandler(logging.Handler):
+    """ log handler that writes to a file from a separate thread,
+        records are written when enough are held, when the flush time
+        expires or when an error is logged.  Like WatchedFileHandler the
+        file is reopened if it has been moved by log rotation. """
+
+    def __init__(self, file_name, flush_time=LOG_FLUSH_TIME):
+        logging.Handler.__init__(self)
+        self.file_name = os.path.abspath(file_name)
+        self.flush_time = flush_time
+        self.stream = None
+        self.stream_id = None
+        self.held = []
+        self.held_bytes = 0
+        self.dropped_count = 0
+        self.write_now = False
+        self.closing = False
+        self.condition = threading.Condition()
+        self.writer = threading.Thread(target=self.__write_loop,
+                                       name="log-writer", daemon=True)
+        self.writer.start()
+
+    def emit(self, record):
+        """ format record and hold it for the writer thread """
+        try:
+            line = self.format(record) + "\n"
+        except Exception:
+            self.handleError(record)
+            return
+        with self.condition:
+            if self.held_bytes >= LOG_BUFFER_LIMIT and \
+                    record.levelno < logging.WARNING:
+                self.dropped_count += 1
+                return
+            self.held.append(line)
+            self.held_bytes += len(line)
+            if self.held_bytes >= LOG_BUFFER_SIZE or \
+                    record.levelno >= logging.ERROR:
+                self.write_now = True
+                self.condition.notify()
+
+    def flush(self):
+        """ ask writer thread to write held records """
+        with self.condition:
+            self.write_now = True
+            self.condition.notify()
+
+    def close(self):
+        """ write held records and stop the writer thread """
+        with self.condition:
+            self.closing = True
+            self.condition.notify()
+        if self.writer.is_alive():
+            self.writer.join()
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        logging.Handler.close(self)
+
+    #
+    # private functions
+    #
+
+    def __write_loop(self):
+        """ write held records until closed """
+        closing = False
+        while not closing:
+            with self.condition:
+                self.condition.wait_for(lambda: self.write_now or self.closing,
+                                        self.flush_time)
+                lines = self.held
+                dropped_count = self.dropped_count
+                self.held = []
+                self.held_bytes = 0
+                self.dropped_count = 0
+                self.write_now = False
+                closing = self.closing
+            if dropped_count > 0:
+                lines.append("... log writer behind, " + str(dropped_count) +
+                             " records dropped\n")
+            if lines:
+                self.__write_lines(lines)
+
+    def __write_lines(self, lines):
+        """ write lines to the log file, reopen it if it has been moved """
+        try:
+            self.__reopen_if_moved()
+            self.stream.write("".join(lines))
+            self.stream.flush()
+        except OSError as exc:
+            print("!!! Log write failed: " + str(exc))
+            if self.stream is not None:
+                self.stream.close()
+                self.stream = None
+
+    def __reopen_if_moved(self):
+        """ open log file, or reopen it if log rotation has moved it """
+        try:
+            stat = os.stat(self.file_name)
+            file_id = (stat.st_dev, stat.st_ino)
+        except FileNotFoundError:
+            file_id = None
+        if self.stream is not None and file_id != self.stream_id:
+            self.stream.close()
+            self.stream = None
+        if self.stream is None:
+            self.stream = open(self.file_name, "a", encoding="utf-8")
+            stat = os.fstat(self.stream.fileno())
+            self.stream_id = (stat.st_dev, stat.st_ino)
+
 
 class LogProcess(BaseProcess):
     """ Class that waits for an event to occur """
@@ -44,11 +163,15 @@ class LogProcess(BaseProcess):
         BaseProcess.__init__(self,
                              name="log",
                              events=events,
-                             in_queue=queues[Global.LOGGER])
+                             in_queue=queues[Global.LOGGER],
+                             app_queue=queues.get(Global.APPLICATION, None))
         print("init logger")
         self.display_queue = None
         self.log_file_name = None
+        self.log_flush_time = LOG_FLUSH_TIME
         self.logger = None
+        self.file_handler = None
+        self.console_handler = None
 
     def __repr__(self):
         # return "%s(%r)" % (self.__class__, self.__dict__)
@@ -67,6 +190,8 @@ class LogProcess(BaseProcess):
             if Global.LOGGER in self.config[Global.CONFIG]:
                 self.log_file_name = self.config[Global.CONFIG][
                     Global.LOGGER].get(Global.FILE, None)
+                self.log_flush_time = self.config[Global.CONFIG][
+                    Global.LOGGER].get(Global.FLUSH_TIME, LOG_FLUSH_TIME)
 
         self.logger = logging.getLogger(self.name)
         self.logger.setLevel(self.log_level)
@@ -74,13 +199,14 @@ class LogProcess(BaseProcess):
             # set up file logging
             self.log_file_name = self.log_file_name.replace(
                 "**" + Global.NODE + "**", self.node_name)
-            filehandler = logging.handlers.WatchedFileHandler(
-                self.log_file_name)
+            filehandler = BufferedFileHandler(self.log_file_name,
+                                              self.log_flush_time)
             filehandler.setLevel(logging.DEBUG)
             fileformatter = logging.Formatter(
                 '%(asctime)s %(name)s %(levelname)-8s: %(message)s')
             filehandler.setFormatter(fileformatter)
             self.logger.addHandler(filehandler)
+            self.file_handler = filehandler
         # Set up logging to the console.
         console_handler = colorlog.StreamHandler()
         console_handler.setFormatter(
@@ -98,13 +224,28 @@ class LogProcess(BaseProcess):
         console_handler.setLevel(self.log_level)
         console_handler.setLevel(self.log_level)
         self.logger.addHandler(console_handler)
+        self.console_handler = console_handler
 
+    def shutdown_process(self):
+        """ write held log records """
+        if self.file_handler is not None:
+            self.logger.removeHandler(self.file_handler)
+            self.file_handler.close()
+            self.file_handler = None
+        super().shutdown_process()
 
     def process_message(self, new_message=None):
         """ process message from queue """
-        (log_level, log_message) = new_message
-        # print("())() "+str(log_message))
-        self.__write_log_messages(log_level, log_message)
+        if isinstance(new_message, list):
+            # a batch of log messages sent by a process
+            for (log_level, log_message) in new_message:
+                self.__write_log_messages(log_level, log_message)
+        elif new_message[0] == Global.FLIGHT_RECORDER:
+            self.__write_flight_recorder(new_message[1])
+        else:
+            (log_level, log_message) = new_message
+            # print("())() "+str(log_message))
+            self.__write_log_messages(log_level, log_message)
 
     def __write_log_messages(self, level, message=None):
         """ write a log message to output """
@@ -120,3 +261,17 @@ class LogProcess(BaseProcess):
                     self.logger.critical(message)
                 else:
                     self.logger.info(message)
+
+    def __write_flight_recorder(self, records):
+        """ write records a process held below its log level,
+            to the log file only and with their original times """
+        handler = self.file_handler
+        if handler is None:
+            handler = self.console_handler
+        for (created, level, message) in records:
+            record = self.logger.makeRecord(self.logger.name, level, __file__,
+                                            0, "[flight recorder] " + message,
+                                            None, None)
+            record.created = created
+            record.msecs = (created - int(created)) * 1000
+            handler.handle(record)
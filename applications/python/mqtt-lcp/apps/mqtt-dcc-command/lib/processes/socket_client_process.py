@@ -146,7 +146,8 @@ class SocketClientProcess(BaseProcess):
                     # print(">>> wait for response...")
                     message = self.__perform_async_io(0.1)
                     # print(">>> ... response..." + str(message))
-                    self.publish_response(message,msg_map[Global.RESPONSE_QUEUE])
+                    self.publish_response(message,msg_map[Global.RESPONSE_QUEUE],
+                                          msg_map.get(Global.REQUEST_ID, None))
                     msg_consummed = True
         return msg_consummed
 
@@ -171,9 +172,12 @@ class SocketClientProcess(BaseProcess):
         else:
             self.send_to_application(message)
 
-    def publish_response(self, serial_data, response_queue):
-        """ publish serial input """
+    def publish_response(self, serial_data, response_queue, request_id=None):
+        """ publish serial input, request_id of the request is
+            returned with the response, if the request had one """
         message = (Global.DEVICE_RESPONSE, serial_data)
+        if request_id is not None:
+            message = (Global.DEVICE_RESPONSE, serial_data, request_id)
         resp_queue = self.queues.get(response_queue, None)
         # print(">>> socket response: " + str(response_queue) + " ... " + str(resp_queue))
         if resp_queue is not None:
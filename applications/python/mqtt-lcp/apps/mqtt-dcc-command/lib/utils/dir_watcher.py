@@ -5,6 +5,10 @@
 
    DirWatcher.py - watch a directory(folder) for changes
 
+        Changes are returned as sets of added, modified and removed files.
+        On linux inotify is used through ctypes so the directory is not
+        rescanned on every check, elsewhere directory scans are compared.
+
 The MIT License (MIT)
 
 Copyright 2023 richard p hughes
@@ -29,17 +33,87 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SO
 
 import sys
 import os
+import ctypes
+import ctypes.util
+import struct
 
 sys.path.append('../../lib')
 
-from utils.global_constants import Global
+# inotify flags, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | \
+    IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+
+# struct inotify_event: wd, mask, cookie, len, followed by name
+INOTIFY_EVENT = struct.Struct("iIII")
+
+# bytes read from the inotify descriptor at a time
+INOTIFY_READ_SIZE = 64 * 1024
+
+
+def load_inotify():
+    """ libc with inotify functions, None if not available """
+    libc = None
+    if sys.platform.startswith("linux"):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6",
+                               use_errno=True)
+            libc.inotify_init1.argtypes = [ctypes.c_int]
+            libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                               ctypes.c_uint32]
+        except (OSError, AttributeError):
+            libc = None
+    return libc
+
+
+class DirChanges(object):
+    """ files added, modified and removed in a directory, full paths """
+    def __init__(self, added=None, modified=None, removed=None, rescan=False):
+        self.added = added if added is not None else set()
+        self.modified = modified if modified is not None else set()
+        self.removed = removed if removed is not None else set()
+        # changes were lost, all files should be reloaded
+        self.rescan = rescan
+
+    def __repr__(self):
+        # return "%s(%r)" % (self.__class__, self.__dict__)
+        fdict = repr(self.__dict__)
+        return f"{self.__class__}({fdict})"
+
+    def __bool__(self):
+        return bool(self.added or self.modified or self.removed or self.rescan)
 
 
 class DirWatcher(object):
-    """ help class for logging operations """
+    """ watch a directory for added, modified and removed files,
+        uses inotify on linux, otherwise compares directory scans """
+
+    libc = None
+    libc_loaded = False
+
     def __init__(self, dir_name):
         self.dir_name = dir_name
         self.last_directory = None
+        self.inotify_fd = None
+        self.watch_id = None
+        self.known_files = set()
+        self.pending = DirChanges()
+        if self.dir_name is not None:
+            self.__start_watching()
 
     def __repr__(self):
         # return "%s(%r)" % (self.__class__, self.__dict__)
@@ -48,19 +122,149 @@ class DirWatcher(object):
 
     def has_changed(self):
         """ have there been any changes in directory """
-        changed = False
-        new_list = {}
+        return bool(self.get_changes())
+
+    def get_changes(self):
+        """ changes in directory since last call """
+        changes = DirChanges()
         if self.dir_name is not None:
-            #print(">>> watch folder: "+str(self.dir_name))
-            file_list = os.listdir(self.dir_name)
-            #print(">>> watch files: "+str(file_list))
-            for f in file_list:
-                fkey = f + ":" + str(os.path.getmtime(os.path.join(self.dir_name, f)))
-                new_list[fkey] = None
-            if self.last_directory is not None:
-                added = [f for f in new_list if not f in self.last_directory]
-                removed = [f for f in self.last_directory if not f in new_list]
-                if len(added) != 0 or len(removed) != 0:
-                    changed = True
-            self.last_directory = new_list
-        return changed
+            if self.inotify_fd is not None:
+                changes = self.__read_inotify_changes()
+            else:
+                changes = self.__scan_changes()
+        return changes
+
+    def close(self):
+        """ release the inotify descriptor """
+        if self.inotify_fd is not None:
+            os.close(self.inotify_fd)
+            self.inotify_fd = None
+
+    #
+    # private functions
+    #
+
+    def __start_watching(self):
+        """ watch with inotify if possible, else remember a directory scan """
+        if not self.__start_inotify():
+            self.last_directory = self.__scan_directory()
+
+    def __start_inotify(self):
+        """ start an inotify watch of the directory """
+        if not DirWatcher.libc_loaded:
+            DirWatcher.libc = load_inotify()
+            DirWatcher.libc_loaded = True
+        if DirWatcher.libc is None:
+            return False
+        fd = DirWatcher.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            return False
+        watch_id = DirWatcher.libc.inotify_add_watch(
+            fd, os.fsencode(self.dir_name), WATCH_MASK)
+        if watch_id < 0:
+            os.close(fd)
+            return False
+        self.inotify_fd = fd
+        self.watch_id = watch_id
+        self.known_files = set(self.__scan_directory())
+        return True
+
+    def __read_inotify_changes(self):
+        """ drain inotify events into a change set """
+        while True:
+            try:
+                buffer = os.read(self.inotify_fd, INOTIFY_READ_SIZE)
+            except BlockingIOError:
+                break
+            if not buffer:
+                break
+            self.__parse_inotify_events(buffer)
+        changes = self.pending
+        self.pending = DirChanges()
+        if changes.rescan:
+            # events were lost or the directory went away, start over
+            self.close()
+            self.__start_watching()
+        return changes
+
+    def __parse_inotify_events(self, buffer):
+        """ add events in buffer to pending changes """
+        offset = 0
+        while offset + INOTIFY_EVENT.size <= len(buffer):
+            (_wd, mask, _cookie, name_len) = \
+                INOTIFY_EVENT.unpack_from(buffer, offset)
+            offset += INOTIFY_EVENT.size
+            name = os.fsdecode(
+                buffer[offset:offset + name_len].rstrip(b"\0"))
+            offset += name_len
+            if mask & (IN_Q_OVERFLOW | IN_IGNORED | IN_DELETE_SELF |
+                       IN_MOVE_SELF):
+                self.pending.rescan = True
+            elif name and not mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self.__file_added(name)
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    self.__file_removed(name)
+                else:
+                    self.__file_modified(name)
+
+    def __file_added(self, name):
+        """ a file was created or moved into the directory """
+        path = os.path.join(self.dir_name, name)
+        if path in self.pending.removed:
+            # replaced, an editor saving by rename
+            self.pending.removed.discard(path)
+            self.pending.modified.add(path)
+        elif name in self.known_files:
+            self.pending.modified.add(path)
+        else:
+            self.pending.added.add(path)
+        self.known_files.add(name)
+
+    def __file_removed(self, name):
+        """ a file was deleted or moved out of the directory """
+        path = os.path.join(self.dir_name, name)
+        self.known_files.discard(name)
+        self.pending.modified.discard(path)
+        if path in self.pending.added:
+            # created and removed since last check
+            self.pending.added.discard(path)
+        else:
+            self.pending.removed.add(path)
+
+    def __file_modified(self, name):
+        """ a file was written or its attributes changed """
+        path = os.path.join(self.dir_name, name)
+        if path not in self.pending.added:
+            self.pending.modified.add(path)
+
+    def __scan_directory(self):
+        """ file names and modification times in directory """
+        #print(">>> watch folder: "+str(self.dir_name))
+        directory = {}
+        try:
+            with os.scandir(self.dir_name) as entries:
+                for entry in entries:
+                    try:
+                        directory[entry.name] = entry.stat().st_mtime_ns
+                    except FileNotFoundError:
+                        pass
+        except FileNotFoundError:
+            pass
+        return directory
+
+    def __scan_changes(self):
+        """ compare directory to the previous scan """
+        new_directory = self.__scan_directory()
+        changes = DirChanges()
+        for name, mtime in new_directory.items():
+            last_mtime = self.last_directory.get(name, None)
+            if last_mtime is None:
+                changes.added.add(os.path.join(self.dir_name, name))
+            elif last_mtime != mtime:
+                changes.modified.add(os.path.join(self.dir_name, name))
+        for name in self.last_directory:
+            if name not in new_directory:
+                changes.removed.add(os.path.join(self.dir_name, name))
+        self.last_directory = new_directory
+        return changes
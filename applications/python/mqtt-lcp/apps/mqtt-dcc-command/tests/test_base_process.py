@@ -0,0 +1,256 @@
+#!/usr/bin/python3
+# test_base_process.py
+"""
+
+    test_base_process.py - the main loop of a process keeps calling
+        process_other on time while its in queue is flooded, send after
+        timers fire once each, in expiry order, unless cancelled, log
+        messages that do not format are still logged
+
+    Run from the tests folder:
+
+        python3 -m unittest test_base_process
+
+The MIT License (MIT)
+
+Copyright 2023 richard p hughes
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+and associated documentation files (the "Software"), to deal in the Software without restriction,
+including without limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom the Software
+is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies
+or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""
+
+import os
+import random
+import sys
+import threading
+import time
+import unittest
+from queue import Queue
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BIN_DIR = os.path.join(TESTS_DIR, '..', 'bin')
+sys.path.append(os.path.join(TESTS_DIR, '..', 'lib'))
+
+from processes.base_process import BaseProcess, SendAfterMessage
+from utils.global_constants import Global
+
+# milliseconds between process_other calls in the tests
+TEST_OTHER_INTERVAL = 50
+# process_other calls made before a flood test shuts down
+FLOOD_OTHER_CALLS = 10
+# seconds each flood message takes to handle
+FLOOD_HANDLER_TIME = 0.001
+# messages waiting in the in queue throughout a flood
+FLOOD_DEPTH = 100
+# messages queued for the load test
+LOAD_MESSAGES = 20000
+# timers set in the timer tests
+TIMER_COUNT = 10000
+# milliseconds, timers due later than this are not fired in the tests
+TIMER_FUTURE = 60000
+
+
+class DrainProcess(BaseProcess):
+    """ process that records its messages and process_other calls """
+
+    def __init__(self, handler_time=0, refill=False, stop_after_calls=None,
+                 stop_after_messages=None):
+        super().__init__(name="drain",
+                         events={Global.SHUTDOWN: threading.Event()},
+                         in_queue=Queue(), log_queue=Queue())
+        self.process_other_interval = TEST_OTHER_INTERVAL
+        self.handler_time = handler_time
+        self.refill = refill
+        self.stop_after_calls = stop_after_calls
+        self.stop_after_messages = stop_after_messages
+        self.handled = []
+        # (monotonic milliseconds, time it was due) of each call
+        self.other_calls = []
+
+    def process_message(self, new_message):
+        """ busy for handler time, keep the queue full if flooding """
+        expires = time.perf_counter() + self.handler_time
+        while time.perf_counter() < expires:
+            pass
+        self.handled.append(new_message[1])
+        if self.refill:
+            self.in_queue.put(new_message)
+        return True
+
+    def process_other(self):
+        """ record the call, shut down when the test is done """
+        self.other_calls.append((time.monotonic() * 1000,
+                                 self.process_other_due))
+        if (self.stop_after_calls is not None and
+                len(self.other_calls) >= self.stop_after_calls) or \
+                (self.stop_after_messages is not None and
+                 len(self.handled) >= self.stop_after_messages):
+            self.events[Global.SHUTDOWN].set()
+
+
+class TestMessageDrain(unittest.TestCase):
+    """ bounded message blocks under a flooded in queue """
+
+    def setUp(self):
+        # processes load the app config from the bin folder
+        self.cwd = os.getcwd()
+        os.chdir(BIN_DIR)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+
+    def test_process_other_on_time(self):
+        """ process_other is called every interval while flooded """
+        process = DrainProcess(handler_time=FLOOD_HANDLER_TIME, refill=True,
+                               stop_after_calls=FLOOD_OTHER_CALLS)
+        for number in range(FLOOD_DEPTH):
+            process.in_queue.put(("flood", number))
+        process.run()
+        self.assertEqual(len(process.other_calls), FLOOD_OTHER_CALLS)
+        # first call is due as the loop starts, later ones an interval apart
+        for (called, due) in process.other_calls[1:]:
+            self.assertLess(called - due, TEST_OTHER_INTERVAL)
+        self.assertEqual(process.process_other_late_count, 0)
+        self.assertGreater(process.message_block_full_count, 0)
+        # the flood was handled in between
+        self.assertGreater(len(process.handled), FLOOD_OTHER_CALLS *
+                           process.max_message_block)
+
+    def test_block_full_count(self):
+        """ a backlog is drained in full blocks, in order """
+        process = DrainProcess(stop_after_messages=LOAD_MESSAGES)
+        for number in range(LOAD_MESSAGES):
+            process.in_queue.put(("load", number))
+        process.run()
+        self.assertEqual(process.handled, list(range(LOAD_MESSAGES)))
+        self.assertEqual(process.messages_processed_count, LOAD_MESSAGES)
+        # blocks cut short by process_other coming due are not full
+        self.assertGreaterEqual(
+            process.message_block_full_count,
+            LOAD_MESSAGES // process.max_message_block -
+            len(process.other_calls))
+        self.assertLessEqual(process.message_block_full_count,
+                             LOAD_MESSAGES // process.max_message_block)
+
+
+class TestSendAfter(unittest.TestCase):
+    """ heap of send after timers """
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        os.chdir(BIN_DIR)
+        self.generator = random.Random(1)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+
+    def test_same_millisecond(self):
+        """ many timers due at the same time all fire, in the order set """
+        process = DrainProcess(stop_after_messages=TIMER_COUNT)
+        for number in range(TIMER_COUNT):
+            process.send_after(SendAfterMessage("timer", number, 0))
+        process.run()
+        self.assertEqual(process.handled, list(range(TIMER_COUNT)))
+        self.assertEqual(process.send_after_pending, {})
+        self.assertEqual(process.send_after_timers, [])
+
+    def test_expiry_order(self):
+        """ timers fire in order of expiry, ties in the order set """
+        process = DrainProcess(stop_after_messages=TIMER_COUNT)
+        timers = []
+        for number in range(TIMER_COUNT):
+            timer = SendAfterMessage("timer", number,
+                                     self.generator.randint(0, 20))
+            process.send_after(timer)
+            timers.append(timer)
+        process.send_after(SendAfterMessage("timer", "future", TIMER_FUTURE))
+        process.run()
+        timers.sort(key=lambda timer: (timer.expires, timer.key))
+        self.assertEqual(process.handled,
+                         [timer.message_body for timer in timers])
+        self.assertEqual(len(process.send_after_pending), 1)
+
+    def test_cancel(self):
+        """ cancelled timers do not fire, each cancel is reported once """
+        process = DrainProcess()
+        keys = [process.send_after(SendAfterMessage("timer", number, 0))
+                for number in range(TIMER_COUNT)]
+        cancelled = set(self.generator.sample(range(TIMER_COUNT),
+                                              TIMER_COUNT // 2))
+        for number in cancelled:
+            self.assertTrue(process.cancel_send_after(keys[number]))
+            self.assertFalse(process.cancel_send_after(keys[number]))
+        process.stop_after_messages = TIMER_COUNT - len(cancelled)
+        process.run()
+        self.assertEqual(process.handled,
+                         [number for number in range(TIMER_COUNT)
+                          if number not in cancelled])
+        # fired timers can no longer be cancelled
+        self.assertFalse(process.cancel_send_after(keys[0]))
+
+    def test_cancelled_timers_compacted(self):
+        """ cancelled timers do not build up in the heap """
+        process = DrainProcess()
+        kept_key = process.send_after(
+            SendAfterMessage("timer", "kept", TIMER_FUTURE))
+        for number in range(TIMER_COUNT):
+            key = process.send_after(
+                SendAfterMessage("timer", number, TIMER_FUTURE))
+            process.cancel_send_after(key)
+            self.assertLessEqual(len(process.send_after_timers),
+                                 2 * len(process.send_after_pending) + 65)
+        self.assertEqual(list(process.send_after_pending), [kept_key])
+
+
+class TestLogMessage(unittest.TestCase):
+    """ formatting of log messages with args """
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        os.chdir(BIN_DIR)
+        self.process = DrainProcess()
+        self.process.log_level = Global.LOG_LEVEL_INFO
+        self.process.log_batch_time = 0
+        # records logged while loading the config
+        while not self.process.log_queue.empty():
+            self.process.log_queue.get_nowait()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+
+    def logged(self):
+        """ text of the next log record """
+        (_level, text) = self.process.log_queue.get_nowait()
+        return text
+
+    def test_args_formatted(self):
+        """ args are formatted into the message """
+        self.process.log_info("loco %s speed %d", 3, 50)
+        self.assertEqual(self.logged(), "drain: loco 3 speed 50")
+
+    def test_bad_args_logged(self):
+        """ a message and args that do not format are logged as they are """
+        self.process.log_info("loco %d", "three")
+        self.assertEqual(self.logged(), "drain: loco %d ('three',)")
+        self.process.log_error("loco %s %s", 3)
+        self.assertEqual(self.logged(), "drain: loco %s %s (3,)")
+        self.process.log_warning("100%", 3)
+        self.assertEqual(self.logged(), "drain: 100% (3,)")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+#!/usr/bin/python3
+# test_cab_process.py
+"""
+
+    test_cab_process.py - a cab request that times out or fails is answered
+        and the next request of its throttle runs
+
+    Run from the tests folder:
+
+        python3 -m unittest test_cab_process
+
+The MIT License (MIT)
+
+Copyright 2023 richard p hughes
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+and associated documentation files (the "Software"), to deal in the Software without restriction,
+including without limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom the Software
+is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies
+or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""
+
+import os
+import sys
+import unittest
+from queue import Queue, Empty
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BIN_DIR = os.path.join(TESTS_DIR, '..', 'bin')
+sys.path.append(os.path.join(TESTS_DIR, '..', 'lib'))
+sys.path.append(BIN_DIR)
+
+from utils.global_constants import Global
+from structs.io_data import IoData
+
+import cab_process
+from cab_process import CabProcess
+
+# dcc address of the loco in the test requests
+TEST_LOCO = 3001
+
+
+def cab_request(desired):
+    """ a cab request of one throttle for the test loco """
+    rett = IoData()
+    rett.mqtt_message_root = Global.CAB
+    rett.mqtt_node_id = "test-node"
+    rett.mqtt_throttle_id = "test-throttle"
+    rett.mqtt_cab_id = "test-cab"
+    rett.mqtt_loco_id = TEST_LOCO
+    rett.mqtt_desired = desired
+    rett.mqtt_respond_to = "cmd/mqtt-lcp/node/test-node/res"
+    return rett
+
+
+class TestCabRequestFailures(unittest.TestCase):
+    """ failed cab requests do not stall their throttle """
+
+    def setUp(self):
+        # processes load the app config from the bin folder
+        self.cwd = os.getcwd()
+        os.chdir(BIN_DIR)
+        self.queues = {Global.CAB: Queue(), Global.APPLICATION: Queue(),
+                       Global.LOGGER: Queue(), Global.DRIVER: Queue()}
+        self.process = CabProcess(events=None, queues=self.queues)
+        self.timeout = cab_process.DRIVER_RESPONSE_TIMEOUT
+
+    def tearDown(self):
+        cab_process.DRIVER_RESPONSE_TIMEOUT = self.timeout
+        os.chdir(self.cwd)
+
+    def driver_message(self):
+        """ next message sent to the driver """
+        (_operation, message) = self.queues[Global.DRIVER].get_nowait()
+        return message
+
+    def response(self):
+        """ next response published by the cab process """
+        (_operation, publish) = self.queues[Global.APPLICATION].get_nowait()
+        return publish
+
+    def test_report_timeout(self):
+        """ a report with no driver response is answered, the next
+            request of the throttle is sent to the driver """
+        cab_process.DRIVER_RESPONSE_TIMEOUT = 0
+        self.process.process_request_cab_message(
+            cab_request({Global.REPORT: Global.SPEED}))
+        self.process.process_request_cab_message(
+            cab_request({Global.DIRECTION: Global.FORWARD}))
+        self.assertEqual(self.driver_message().sub_command, Global.REPORT)
+        self.assertRaises(Empty, self.driver_message)
+        self.process.process_other()
+        self.assertIsNone(self.response()[Global.REPORTED])
+        self.assertEqual(self.driver_message().sub_command, Global.DIRECTION)
+
+    def test_request_failure(self):
+        """ a request that raises is answered with an error, the next
+            request of the throttle is sent to the driver """
+        self.process.process_request_cab_message(
+            cab_request({Global.REPORT: Global.SPEED}))
+        # not a speed, the speed request fails converting it
+        self.process.process_request_cab_message(
+            cab_request({Global.SPEED: "fast"}))
+        self.process.process_request_cab_message(
+            cab_request({Global.DIRECTION: Global.FORWARD}))
+        report = self.driver_message()
+        self.process.process_message(
+            (Global.DRIVER_RESPONSE, report, report.request_id))
+        self.assertEqual(self.response()[Global.REPORTED],
+                         {Global.SPEED: None})
+        response = self.response()
+        self.assertEqual(response[Global.REPORTED], Global.ERROR)
+        self.assertIn(Global.MESSAGE, response[Global.METADATA])
+        self.assertEqual(self.driver_message().sub_command, Global.DIRECTION)
+
+if __name__ == '__main__':
+    unittest.main()
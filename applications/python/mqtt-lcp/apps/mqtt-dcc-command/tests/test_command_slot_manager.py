@@ -0,0 +1,225 @@
+#!/usr/bin/python3
+# test_command_slot_manager.py
+"""
+
+    test_command_slot_manager.py - random sequences of slot operations keep
+        the slot indexes consistent and match a simple model of the slots
+
+    Run from the tests folder:
+
+        python3 -m unittest test_command_slot_manager
+
+The MIT License (MIT)
+
+Copyright 2023 richard p hughes
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+and associated documentation files (the "Software"), to deal in the Software without restriction,
+including without limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom the Software
+is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies
+or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""
+
+import os
+import random
+import sys
+import unittest
+from queue import Queue
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BIN_DIR = os.path.join(TESTS_DIR, '..', 'bin')
+sys.path.append(os.path.join(TESTS_DIR, '..', 'lib'))
+sys.path.append(BIN_DIR)
+
+from utils.global_constants import Global
+from structs.gui_message import GuiMessage
+
+from command_slot_manager import CommandSlotManager
+
+# random operation sequences and operations in each
+SEQUENCE_COUNT = 200
+SEQUENCE_LENGTH = 200
+# few slots and cabs so slots fill up and cabs share locos
+SLOT_COUNT = 6
+NODE_IDS = ["node-a", "node-b"]
+THROTTLE_IDS = ["throttle-1", "throttle-2"]
+CAB_IDS = ["A", "B"]
+DCC_IDS = list(range(1, 11))
+
+
+def gui_message(cab, dcc_id):
+    """ a throttle message of a cab for a loco """
+    rett = GuiMessage()
+    rett.command = Global.THROTTLE
+    (rett.node_id, rett.throttle_id, rett.cab_id) = cab
+    rett.dcc_id = dcc_id
+    return rett
+
+
+class SlotModel(object):
+    """ the slots as a plain dict and list per cab,
+        a slot is (dcc id, owner cab, is in the owner's cab list) """
+
+    def __init__(self, slot_count):
+        self.slots = {slot_id: None for slot_id in range(1, slot_count + 1)}
+        self.cabs = {}
+
+    def find_dcc_id(self, dcc_id):
+        """ slot holding a loco, None if not in a slot """
+        rett = None
+        for (slot_id, slot) in self.slots.items():
+            if slot is not None and slot[0] == dcc_id:
+                rett = slot_id
+        return rett
+
+    def acquire(self, cab, dcc_id):
+        """ expected (reported, slot id) of an acquire """
+        rett = (Global.ERROR, -1)
+        slot_id = self.find_dcc_id(dcc_id)
+        if slot_id is not None:
+            if self.slots[slot_id][1] == cab:
+                rett = (Global.ACQUIRED, slot_id)
+            else:
+                rett = (Global.STEAL_NEEDED, -1)
+        else:
+            free_slot_ids = [slot_id for (slot_id, slot)
+                             in self.slots.items() if slot is None]
+            if free_slot_ids:
+                slot_id = min(free_slot_ids)
+                self.slots[slot_id] = (dcc_id, cab, True)
+                self.cabs.setdefault(cab, []).append(slot_id)
+                rett = (Global.ACQUIRED, slot_id)
+        return rett
+
+    def assign(self, slot_id, cab, dcc_id):
+        """ a loco put in a given slot, not added to a cab """
+        self.slots[slot_id] = (dcc_id, cab, False)
+
+    def free(self, slot_id):
+        """ clear a slot """
+        slot = self.slots[slot_id]
+        self.slots[slot_id] = None
+        if slot is not None and slot[2]:
+            cab_slot_ids = self.cabs[slot[1]]
+            cab_slot_ids.remove(slot_id)
+            if not cab_slot_ids:
+                del self.cabs[slot[1]]
+
+    def set_lead(self, cab, dcc_id):
+        """ move a loco to the front of its cab """
+        cab_slot_ids = self.cabs.get(cab, [])
+        lead_slot_ids = [slot_id for slot_id in cab_slot_ids
+                         if self.slots[slot_id][0] == dcc_id]
+        if lead_slot_ids:
+            cab_slot_ids.remove(lead_slot_ids[0])
+            cab_slot_ids.insert(0, lead_slot_ids[0])
+
+
+class TestCommandSlotManager(unittest.TestCase):
+    """ random acquire, release, steal and lead changes """
+
+    def setUp(self):
+        self.generator = random.Random(21)
+
+    def assert_same(self, manager, model, operation):
+        """ the manager indexes agree with its slots and with the model """
+        self.assertEqual(manager.check_indexes(), [], msg=operation)
+        slots = {slot_id: None if slot_loco is None else
+                 (slot_loco.dcc_id,
+                  manager.cab_keys_by_slot.get(slot_id, None))
+                 for (slot_id, slot_loco) in manager.slots.items()}
+        model_slots = {slot_id: None if slot is None else
+                       (slot[0], ":".join(slot[1]) if slot[2] else None)
+                       for (slot_id, slot) in model.slots.items()}
+        self.assertEqual(slots, model_slots, msg=operation)
+        self.assertEqual(manager.slots_by_cab_id,
+                         {":".join(cab): slot_ids
+                          for (cab, slot_ids) in model.cabs.items()},
+                         msg=operation)
+        self.assertEqual(manager.get_slots_available(),
+                         list(model.slots.values()).count(None),
+                         msg=operation)
+
+    def test_random_operations(self):
+        """ indexes are checked after every operation """
+        for sequence in range(SEQUENCE_COUNT):
+            manager = CommandSlotManager(slot_count=SLOT_COUNT,
+                                         log_queue=Queue())
+            model = SlotModel(SLOT_COUNT)
+            for step in range(SEQUENCE_LENGTH):
+                operation = self.__random_operation(manager, model)
+                self.assert_same(manager, model,
+                                 (sequence, step) + operation)
+
+    #
+    # private functions
+    #
+
+    def __random_operation(self, manager, model):
+        """ apply one random operation to the manager and the model """
+        generator = self.generator
+        cab = (generator.choice(NODE_IDS), generator.choice(THROTTLE_IDS),
+               generator.choice(CAB_IDS))
+        dcc_id = generator.choice(DCC_IDS)
+        operation = generator.choice(["acquire", "acquire", "release",
+                                      "release-cab", "steal", "lead",
+                                      "clear-throttle", "assign"])
+        if operation == "acquire":
+            response = manager.acquire_loco(gui_message(cab, dcc_id))
+            self.assertEqual((response.reported, response.slot_id),
+                             model.acquire(cab, dcc_id))
+        elif operation == "release":
+            manager.release_loco(gui_message(cab, dcc_id))
+            slot_id = model.find_dcc_id(dcc_id)
+            if slot_id is not None:
+                model.free(slot_id)
+        elif operation == "release-cab":
+            # no dcc id, first loco of the cab is released
+            manager.release_loco(gui_message(cab, None))
+            if model.cabs.get(cab, None):
+                model.free(model.cabs[cab][0])
+        elif operation == "steal":
+            # as the driver does, release from the owner then acquire
+            slot_locos = manager.find_loco_slot(gui_message(cab, dcc_id))
+            if slot_locos:
+                slot_loco = slot_locos[0][1]
+                manager.release_loco(gui_message(
+                    (slot_loco.node_id, slot_loco.throttle_id,
+                     slot_loco.cab_id), dcc_id))
+                model.free(model.find_dcc_id(dcc_id))
+            response = manager.acquire_loco(gui_message(cab, dcc_id))
+            self.assertEqual((response.reported, response.slot_id),
+                             model.acquire(cab, dcc_id))
+        elif operation == "lead":
+            manager.set_lead(gui_message(cab, dcc_id))
+            model.set_lead(cab, dcc_id)
+        elif operation == "clear-throttle":
+            manager.clear_all_throttle_locos(cab[0], cab[1])
+            for (slot_id, slot) in model.slots.items():
+                if slot is not None and slot[1][:2] == cab[:2]:
+                    model.free(slot_id)
+        elif operation == "assign":
+            # a given free slot, leaves a stale id in the free slot heap
+            free_slot_ids = [slot_id for (slot_id, slot)
+                             in model.slots.items() if slot is None]
+            if free_slot_ids and model.find_dcc_id(dcc_id) is None:
+                slot_id = generator.choice(free_slot_ids)
+                manager.assign_loco_to_slot(gui_message(cab, dcc_id),
+                                            existing_slot_id=slot_id)
+                model.assign(slot_id, cab, dcc_id)
+        return (operation, cab, dcc_id)
+
+
+if __name__ == '__main__':
+    unittest.main()
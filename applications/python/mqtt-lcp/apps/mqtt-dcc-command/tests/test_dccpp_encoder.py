@@ -0,0 +1,171 @@
+#!/usr/bin/python3
+# test_dccpp_encoder.py
+"""
+
+    test_dccpp_encoder.py - golden test of dcc++ function commands against the
+        group arithmetic of the previous encoder
+
+    Run from the tests folder:
+
+        python3 -m unittest test_dccpp_encoder
+
+The MIT License (MIT)
+
+Copyright 2023 richard p hughes
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+and associated documentation files (the "Software"), to deal in the Software without restriction,
+including without limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom the Software
+is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies
+or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""
+
+import os
+import random
+import sys
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(TESTS_DIR, '..', 'lib'))
+sys.path.append(os.path.join(TESTS_DIR, '..', 'bin'))
+
+from utils.global_constants import Global
+from structs.gui_message import GuiMessage
+from decoders.dccpp_encoder import DccppEncoder
+
+from command_loco import CommandLoco
+
+# dcc address used in the test messages
+TEST_DCC_ID = 1234
+
+
+def old_encode_function_request(dcc_id, changed_function, functions_list):
+    """ function command as built by the encoder before function group tables """
+    rett = ""
+    func_byte1 = -1
+    func_byte2 = -1
+    if changed_function in range(0, 5):  # f0-f4
+        func_byte1 = 128
+        func_byte1 += functions_list[0] * 16
+        func_byte1 += functions_list[1] * 1
+        func_byte1 += functions_list[2] * 2
+        func_byte1 += functions_list[3] * 4
+        func_byte1 += functions_list[4] * 8
+    elif changed_function in range(5, 9):  # f5-f8
+        func_byte1 = 176
+        func_byte1 += functions_list[5] * 1
+        func_byte1 += functions_list[6] * 2
+        func_byte1 += functions_list[7] * 4
+        func_byte1 += functions_list[8] * 8
+    elif changed_function in range(9, 13):  # f9-f12
+        func_byte1 = 160
+        func_byte1 += functions_list[9] * 1
+        func_byte1 += functions_list[10] * 2
+        func_byte1 += functions_list[11] * 4
+        func_byte1 += functions_list[12] * 8
+    elif changed_function in range(13, 21):  # f13-f20
+        func_byte1 = 222
+        func_byte2 = 0
+        func_byte2 += functions_list[13] * 1
+        func_byte2 += functions_list[14] * 2
+        func_byte2 += functions_list[15] * 4
+        func_byte2 += functions_list[16] * 8
+        func_byte2 += functions_list[17] * 16
+        func_byte2 += functions_list[18] * 32
+        func_byte2 += functions_list[19] * 64
+        func_byte2 += functions_list[20] * 128
+    elif changed_function in range(21, 29):  # f21-f28
+        func_byte1 = 223
+        func_byte2 = 0
+        func_byte2 += functions_list[21] * 1
+        func_byte2 += functions_list[22] * 2
+        func_byte2 += functions_list[23] * 4
+        func_byte2 += functions_list[24] * 8
+        func_byte2 += functions_list[25] * 16
+        func_byte2 += functions_list[26] * 32
+        func_byte2 += functions_list[27] * 64
+        func_byte2 += functions_list[28] * 128
+    if func_byte1 != -1:
+        rett = "<f " + str(dcc_id) + " " + str(func_byte1)
+        if func_byte2 != -1:
+            rett = rett + ", " + str(func_byte2)
+        rett = rett + ">"
+    return rett
+
+
+def function_message(changed_function, function_states):
+    """ a function message as the driver sends it, items is the
+        function state dict of the slot loco """
+    rett = GuiMessage()
+    rett.command = Global.THROTTLE
+    rett.sub_command = Global.FUNCTION
+    rett.slot_id = 1
+    rett.dcc_id = TEST_DCC_ID
+    rett.function = changed_function
+    rett.items = function_states
+    return rett
+
+
+class TestDccppEncoderFunctions(unittest.TestCase):
+    """ function commands match the previous encoder """
+
+    def setUp(self):
+        self.encoder = DccppEncoder()
+
+    def assert_same_as_old(self, changed_function, function_states):
+        """ new and old encoders build the same command """
+        message = function_message(changed_function, function_states)
+        self.assertEqual(
+            self.encoder.encode_message(message, None),
+            old_encode_function_request(TEST_DCC_ID, changed_function,
+                                        function_states),
+            msg=f"function: {changed_function} states: {function_states}")
+
+    def test_command_loco_states(self):
+        """ the function state dict of a new loco, all functions off """
+        loco = CommandLoco("node", "throttle", "cab", TEST_DCC_ID, None)
+        for changed_function in range(0, 29):
+            self.assert_same_as_old(changed_function, loco.function_states)
+
+    def test_single_function_on(self):
+        """ each function on by itself, all functions changed """
+        for on_function in range(0, 29):
+            function_states = {f: 0 for f in range(0, 29)}
+            function_states[on_function] = 1
+            for changed_function in range(0, 29):
+                self.assert_same_as_old(changed_function, function_states)
+
+    def test_all_functions_on(self):
+        """ every function on """
+        function_states = {f: 1 for f in range(0, 29)}
+        for changed_function in range(0, 29):
+            self.assert_same_as_old(changed_function, function_states)
+
+    def test_random_states(self):
+        """ random on/off combinations of f0-f28 """
+        generator = random.Random(28)
+        for _ in range(2000):
+            function_states = {f: generator.randint(0, 1) for f in range(0, 29)}
+            self.assert_same_as_old(generator.randint(0, 28), function_states)
+
+    def test_function_out_of_range(self):
+        """ no command for functions outside f0-f28 """
+        function_states = {f: 1 for f in range(0, 29)}
+        for changed_function in (-1, 29):
+            message = function_message(changed_function, function_states)
+            self.assertEqual(self.encoder.encode_message(message, None), "")
+
+
+if __name__ == '__main__':
+    unittest.main()
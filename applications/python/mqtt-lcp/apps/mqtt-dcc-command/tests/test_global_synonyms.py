@@ -0,0 +1,176 @@
+#!/usr/bin/python3
+# test_global_synonyms.py
+"""
+
+    test_global_synonyms.py - synonym lookups and the reversed list of Global
+        values match the functions they replaced
+
+    Run from the tests folder:
+
+        python3 -m unittest test_global_synonyms
+
+The MIT License (MIT)
+
+Copyright 2023 richard p hughes
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+and associated documentation files (the "Software"), to deal in the Software without restriction,
+including without limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom the Software
+is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies
+or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""
+
+import os
+import sys
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(TESTS_DIR, '..', 'lib'))
+
+from utils.global_constants import Global
+from utils.global_synonyms import Synonyms
+
+# values that are not Global strings, including ones equal to 0 and 1
+OTHER_VALUES = [None, 0, 1, 2, -1, 0.0, 1.0, True, False, "", "1", "0",
+                "ON", "Thrown", " on", b"on", (), ("on",), [], ["on"], {},
+                {"on": 1}, set(), object()]
+
+
+def old_is_on(name):
+    """ is_on before the vocabulary tables """
+    rett = False
+    if name in (Global.THROWN, Global.THROW, Global.ON, "1", 1, True):
+        rett = True
+    return rett
+
+
+def old_is_off(name):
+    """ is_off before the vocabulary tables """
+    rett = False
+    if name in (Global.CLOSED, Global.CLOSE, Global.OFF, "0", 0, False):
+        rett = True
+    return rett
+
+
+def old_desired_to_reported(desired=None):
+    """ desired_to_reported before the vocabulary tables """
+    reported = desired
+    if desired == Global.THROW:
+        reported = Global.THROWN
+    if desired == Global.CLOSE:
+        reported = Global.CLOSED
+    return reported
+
+
+def old_reverse(desired=None):
+    """ reverse before the vocabulary tables """
+    reported = desired
+    if desired == Global.THROW:
+        reported = Global.CLOSE
+    if desired == Global.THROWN:
+        reported = Global.CLOSED
+    if desired == Global.ON:
+        reported = Global.OFF
+    if desired == Global.OFF:
+        reported = Global.ON
+    if desired == Global.ON:
+        reported = Global.OFF
+    if desired == Global.CONNECT:
+        reported = Global.DISCONNECT
+    if desired == Global.DISCONNECT:
+        reported = Global.CONNECT
+    if desired == Global.STOP:
+        reported = Global.RUN
+    if desired == Global.RUN:
+        reported = Global.STOP
+    if desired == Global.ACQUIRE:
+        reported = Global.RELEASE
+    if desired == Global.RELEASE:
+        reported = Global.ACQUIRE
+    return reported
+
+
+def old_generate_reversed_list():
+    """ generate_reversed_list before it was built once """
+    global_consts = Global()
+    attributes = dir(global_consts)
+    reversed_consts = {}
+    for _i, value in enumerate(attributes):
+        if (isinstance(value, str) and not value.startswith("_")):
+            attr_value = getattr(global_consts, value)
+            if isinstance(attr_value, str):
+                reversed_consts.update({attr_value: value})
+    return reversed_consts
+
+
+def test_values():
+    """ every Global value, the same values as new strings and others """
+    values = [value for (name, value) in vars(Global).items()
+              if not name.startswith("_") and not callable(value)
+              and not isinstance(value, classmethod)]
+    # equal but not identical strings, as parsed from a message
+    values += ["".join(list(value)) for value in values
+               if isinstance(value, str)]
+    return values + OTHER_VALUES
+
+
+class TestSynonyms(unittest.TestCase):
+    """ Synonyms gives the same answers as before """
+
+    def assert_same(self, new_function, old_function):
+        """ new and old functions agree on every test value """
+        for value in test_values():
+            with self.subTest(value=value):
+                new_result = new_function(value)
+                old_result = old_function(value)
+                self.assertEqual(new_result, old_result)
+                self.assertIs(type(new_result), type(old_result))
+
+    def test_is_on(self):
+        """ synonyms of on """
+        self.assert_same(Synonyms.is_on, old_is_on)
+
+    def test_is_off(self):
+        """ synonyms of off """
+        self.assert_same(Synonyms.is_off, old_is_off)
+
+    def test_desired_to_reported(self):
+        """ past tense of desired states """
+        self.assert_same(Synonyms.desired_to_reported,
+                         old_desired_to_reported)
+
+    def test_reverse(self):
+        """ opposite states """
+        self.assert_same(Synonyms.reverse, old_reverse)
+
+
+class TestReversedList(unittest.TestCase):
+    """ Global.generate_reversed_list gives the same dict as before """
+
+    def test_same_as_reflection(self):
+        """ value -> name of every Global string """
+        self.assertEqual(Global.generate_reversed_list(),
+                         old_generate_reversed_list())
+
+    def test_copy_is_returned(self):
+        """ a caller changing its list does not change the next one """
+        reversed_list = Global.generate_reversed_list()
+        reversed_list[Global.ON] = "changed"
+        reversed_list["not-a-global"] = "added"
+        self.assertEqual(Global.generate_reversed_list(),
+                         old_generate_reversed_list())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+#!/usr/bin/python3
+# test_io_data.py
+"""
+
+    test_io_data.py - every IoData attribute the applications set is one of
+        its slots, messages built like the applications build them encode
+        and parse
+
+    Run from the tests folder:
+
+        python3 -m unittest test_io_data
+
+The MIT License (MIT)
+
+Copyright 2023 richard p hughes
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+and associated documentation files (the "Software"), to deal in the Software without restriction,
+including without limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom the Software
+is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies
+or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""
+
+import os
+import re
+import sys
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+APPS_DIR = os.path.join(TESTS_DIR, '..', '..')
+sys.path.append(os.path.join(TESTS_DIR, '..', 'lib'))
+
+from utils.global_constants import Global
+from structs.io_data import IoData, IO_DATA_ATTRIBUTES
+
+# assignment to an io data attribute of anything but self,
+# self.mqtt_... and self.io_... are attributes of the processes
+ATTRIBUTE_ASSIGNMENT = re.compile(
+    r"(?<![\w.])(?!self\.)[a-z_]+\.((?:mqtt|io)_[a-z_]+)\s*=(?!=)")
+
+
+def attribute_assignments():
+    """ (file, line number, attribute) of each io data attribute
+        assignment in the applications """
+    rett = []
+    for (folder, _dirs, files) in os.walk(APPS_DIR):
+        for file_name in files:
+            if not file_name.endswith(".py"):
+                continue
+            path = os.path.join(folder, file_name)
+            with open(path, encoding="utf-8") as source:
+                for (line_number, line) in enumerate(source, start=1):
+                    for match in ATTRIBUTE_ASSIGNMENT.finditer(line):
+                        rett.append((os.path.relpath(path, APPS_DIR),
+                                     line_number, match.group(1)))
+    return rett
+
+
+class TestIoDataAttributes(unittest.TestCase):
+    """ applications only set attributes IoData has slots for """
+
+    def test_assigned_attributes_are_slots(self):
+        """ every attribute assigned in the applications can be set """
+        assignments = attribute_assignments()
+        self.assertTrue(assignments)
+        io_data = IoData()
+        for (path, line_number, attribute) in assignments:
+            with self.subTest(path=path, line=line_number):
+                self.assertIn(attribute, IO_DATA_ATTRIBUTES)
+                setattr(io_data, attribute, None)
+
+    def test_request_round_trip(self):
+        """ a switch request built like the dispatcher and throttle do """
+        body = IoData()
+        body.mqtt_message_root = Global.SWITCH
+        body.mqtt_port_id = "switch-1"
+        body.mqtt_desired = Global.THROWN
+        body.mqtt_respond_to = "cmd/mqtt-lcp/node/dispatcher/res"
+        body.mqtt_session_id = "REQ:1234"
+        body.mqtt_version = "1.0"
+        body.mqtt_timestamp = 1234
+        topic = "cmd/mqtt-lcp/switch/switch-1/req"
+        parsed = IoData.parse_mqtt_mesage(topic, body.encode_mqtt_message(),
+                                          Global.generate_reversed_list())
+        self.assertEqual(parsed.mqtt_message_category,
+                         Global.MQTT_REQUEST_SWITCH)
+        for attribute in ("mqtt_port_id", "mqtt_desired", "mqtt_respond_to",
+                          "mqtt_session_id", "mqtt_version",
+                          "mqtt_timestamp"):
+            self.assertEqual(getattr(parsed, attribute),
+                             getattr(body, attribute), msg=attribute)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+#!/usr/bin/python3
+# test_metrics_export.py
+"""
+
+    test_metrics_export.py - every process exports its metrics, snapshots
+        are published by the application process
+
+    Run from the tests folder:
+
+        python3 -m unittest test_metrics_export
+
+The MIT License (MIT)
+
+Copyright 2023 richard p hughes
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+and associated documentation files (the "Software"), to deal in the Software without restriction,
+including without limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom the Software
+is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies
+or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+from queue import Queue
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BIN_DIR = os.path.join(TESTS_DIR, '..', 'bin')
+sys.path.append(os.path.join(TESTS_DIR, '..', 'lib'))
+
+from utils.global_constants import Global
+from structs.mqtt_config import MqttConfig
+from processes.base_mqtt_process import BaseMqttProcess
+from processes.mqtt_process import MqttProcess
+
+
+class TestMetricsExport(unittest.TestCase):
+    """ metrics of processes that are not mqtt app processes """
+
+    def setUp(self):
+        # processes load the app config from the bin folder
+        self.cwd = os.getcwd()
+        os.chdir(BIN_DIR)
+        self.queues = {Global.MQTT: Queue(), Global.APPLICATION: Queue(),
+                       Global.LOGGER: Queue()}
+        self.process = MqttProcess(events={Global.SHUTDOWN: None},
+                                   queues=self.queues)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+
+    def test_export_is_opt_in(self):
+        """ metrics are not exported unless configured """
+        self.assertEqual(self.process.metrics_time, 0)
+
+    def test_snapshot_sent_to_application(self):
+        """ mqtt ingress counters reach the application process """
+        self.process.metrics.counter("ingress-dropped").inc()
+        self.process.export_metrics()
+        (message_type, message) = \
+            self.queues[Global.APPLICATION].get_nowait()
+        self.assertEqual(message_type, Global.METRICS)
+        self.assertEqual(message[Global.NAME], "mqtt")
+        self.assertEqual(
+            message[Global.METRICS]["counters"]["ingress-dropped"], 1)
+
+    def test_textfile(self):
+        """ metrics are written to a prometheus textfile """
+        with tempfile.TemporaryDirectory() as metrics_path:
+            self.process.metrics_path = metrics_path
+            self.process.metrics.counter("ingress-dropped").inc()
+            self.process.export_metrics()
+            file_path = os.path.join(
+                metrics_path, str(self.process.node_name) + "-mqtt.prom")
+            with open(file_path, encoding="utf-8") as metrics_file:
+                self.assertIn("mqtt_lcp_ingress_dropped_total",
+                              metrics_file.read())
+
+
+class TestMetricsPublish(unittest.TestCase):
+    """ the application process publishes snapshots of other processes """
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        os.chdir(BIN_DIR)
+        self.mqtt_queue = Queue()
+        self.process = BaseMqttProcess(name="app", events=None,
+                                       in_queue=Queue(),
+                                       mqtt_queue=self.mqtt_queue,
+                                       log_queue=Queue())
+        self.process.mqtt_config = MqttConfig(
+            self.process.config, self.process.node_name,
+            self.process.host_name, self.process.log_queue)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+
+    def test_publish_other_process(self):
+        """ a snapshot from another process is published with its name """
+        snapshot = {"counters": {"ingress-dropped": 1}}
+        self.assertTrue(self.process.process_message(
+            (Global.METRICS, {Global.NAME: "mqtt", Global.METRICS: snapshot})))
+        (_message_type, (topic, body)) = self.mqtt_queue.get_nowait()
+        self.assertTrue(topic.endswith("/mqtt"))
+        self.assertEqual(body.mqtt_port_id, "mqtt")
+        self.assertEqual(body.mqtt_metadata, snapshot)
+
+
+if __name__ == '__main__':
+    unittest.main()
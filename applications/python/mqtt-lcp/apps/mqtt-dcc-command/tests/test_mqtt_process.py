@@ -0,0 +1,256 @@
+#!/usr/bin/python3
+# test_mqtt_process.py
+"""
+
+    test_mqtt_process.py - messages held while not connected are published
+        in order, once each, after the connection is back, memory stays flat
+        when messages are received faster than the application handles them
+
+    Run from the tests folder:
+
+        python3 -m unittest test_mqtt_process
+
+The MIT License (MIT)
+
+Copyright 2023 richard p hughes
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+and associated documentation files (the "Software"), to deal in the Software without restriction,
+including without limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom the Software
+is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies
+or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""
+
+import json
+import os
+import sys
+import tracemalloc
+import unittest
+from queue import Queue
+from threading import Event
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BIN_DIR = os.path.join(TESTS_DIR, '..', 'bin')
+sys.path.append(os.path.join(TESTS_DIR, '..', 'lib'))
+
+from utils.global_constants import Global
+from processes import mqtt_process
+from processes.mqtt_process import MqttProcess, MQTT_ERR_NO_CONN, \
+    MQTT_ERR_SUCCESS, INGRESS_DATA_SIZE, INGRESS_REQUEST_SIZE
+
+# max messages in the application queue in the soak test
+SOAK_QUEUE_SIZE = 100
+# messages received for each one the application handles
+SOAK_OVERLOAD = 5
+# messages handled by the application before memory is first measured,
+# by then held messages have reached their limits
+SOAK_WARM_UP = 2 * (INGRESS_DATA_SIZE + INGRESS_REQUEST_SIZE)
+# messages handled by the application while memory is measured
+SOAK_MESSAGES = 2 * SOAK_WARM_UP
+# bytes memory may grow while the soak test is measuring
+SOAK_MEMORY_GROWTH = 64 * 1024
+# distinct "dt/" topics received in the soak test
+SOAK_DATA_TOPICS = 2 * INGRESS_DATA_SIZE
+
+
+class FakeClient(object):
+    """ paho client stand in, loses its connection after some publishes """
+
+    def __init__(self, publishes_before_failure=None):
+        self.publishes_before_failure = publishes_before_failure
+        self.attempts = 0
+        self.published = []
+
+    def __repr__(self):
+        # return "%s(%r)" % (self.__class__, self.__dict__)
+        fdict = repr(self.__dict__)
+        return f"{self.__class__}({fdict})"
+
+    def publish(self, topic=None, payload=None):
+        """ publish unless the connection has been lost """
+        self.attempts += 1
+        if self.publishes_before_failure is not None and \
+                len(self.published) >= self.publishes_before_failure:
+            return (MQTT_ERR_NO_CONN, None)
+        self.published.append((topic, payload))
+        return (MQTT_ERR_SUCCESS, len(self.published))
+
+
+def held_messages():
+    """ (topic, body) of request and data messages, in publish order """
+    rett = []
+    for number in range(10):
+        rett.append(("cmd/mqtt-lcp/switch/switch-" + str(number) + "/req",
+                     {Global.SWITCH: number}))
+        rett.append(("dt/mqtt-lcp/sensor/sensor-" + str(number),
+                     {Global.SENSOR: number}))
+    return rett
+
+
+class TestOfflineMessages(unittest.TestCase):
+    """ publishing messages held while not connected """
+
+    def setUp(self):
+        # processes load the app config from the bin folder
+        self.cwd = os.getcwd()
+        os.chdir(BIN_DIR)
+        queues = {Global.MQTT: Queue(), Global.APPLICATION: Queue(),
+                  Global.LOGGER: Queue()}
+        self.process = MqttProcess(events={Global.SHUTDOWN: None},
+                                   queues=queues)
+        self.messages = held_messages()
+        self.payloads = [json.dumps(body) for (_topic, body) in self.messages]
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+
+    def publish(self, messages):
+        """ publish messages through the process """
+        for (topic, body) in messages:
+            self.process.process_message(
+                (Global.MQTT_PUBLISH_JSON, (topic, body)))
+
+    def reconnect(self, client):
+        """ connect to the broker again with a new client """
+        self.process.mqtt_client = client
+        self.process.connected_event.set()
+        self.process.process_other()
+
+    def test_lost_connection_during_flush(self):
+        """ a flush stops at the first failure and keeps the rest in order """
+        self.publish(self.messages)
+        failing_client = FakeClient(publishes_before_failure=3)
+        self.reconnect(failing_client)
+        # stopped at the first failed publish, no retries of held messages
+        self.assertEqual(failing_client.attempts, 4)
+        self.assertFalse(self.process.connected_event.is_set())
+        self.assertEqual(len(self.process.offline_messages),
+                         len(self.messages) - 3)
+        client = FakeClient()
+        self.reconnect(client)
+        self.assertEqual(client.attempts, len(self.messages) - 3)
+        payloads = [payload for (_topic, payload) in
+                    failing_client.published + client.published]
+        self.assertEqual(payloads, self.payloads)
+        self.assertFalse(self.process.offline_messages)
+
+    def test_lost_connection_during_publish(self):
+        """ a message that fails to publish is held with the others """
+        self.process.mqtt_client = FakeClient(publishes_before_failure=0)
+        self.process.connected_event.set()
+        self.publish(self.messages)
+        self.assertEqual(self.process.mqtt_client.attempts, 1)
+        client = FakeClient()
+        self.reconnect(client)
+        self.assertEqual([payload for (_topic, payload) in client.published],
+                         self.payloads)
+
+
+class ReceivedMessage(object):
+    """ paho received message stand in """
+
+    def __init__(self, topic=None, payload=None):
+        self.topic = topic
+        self.payload = payload
+
+    def __repr__(self):
+        # return "%s(%r)" % (self.__class__, self.__dict__)
+        fdict = repr(self.__dict__)
+        return f"{self.__class__}({fdict})"
+
+
+def received_message(number):
+    """ a received sensor data message or switch request """
+    if number % 2 == 0:
+        topic = "dt/mqtt-lcp/sensor/sensor-" + \
+            str((number // 2) % SOAK_DATA_TOPICS)
+        body = {Global.SENSOR: {Global.STATE: {Global.REPORTED: Global.ON}}}
+    else:
+        topic = "cmd/mqtt-lcp/switch/switch-" + str(number) + "/req"
+        body = {Global.SWITCH: {Global.STATE: {Global.DESIRED: Global.THROWN}}}
+    return ReceivedMessage(topic, json.dumps(body).encode("utf-8"))
+
+
+class TestIngressSoak(unittest.TestCase):
+    """ received messages at five times the rate the application handles """
+
+    def setUp(self):
+        # processes load the app config from the bin folder
+        self.cwd = os.getcwd()
+        os.chdir(BIN_DIR)
+        self.app_queue = Queue()
+        queues = {Global.MQTT: Queue(), Global.APPLICATION: self.app_queue,
+                  Global.LOGGER: Queue()}
+        self.process = MqttProcess(events={Global.SHUTDOWN: Event()},
+                                   queues=queues)
+        self.process.ingress_queue_size = SOAK_QUEUE_SIZE
+        self.received = 0
+        self.block_time = mqtt_process.INGRESS_BLOCK_TIME
+        # the application never catches up, do not wait for it
+        mqtt_process.INGRESS_BLOCK_TIME = 0
+
+    def tearDown(self):
+        mqtt_process.INGRESS_BLOCK_TIME = self.block_time
+        os.chdir(self.cwd)
+
+    def run_overload(self, handled_messages):
+        """ receive messages, the application handles one in five """
+        for _i in range(handled_messages):
+            for _j in range(SOAK_OVERLOAD):
+                self.process.data_cb(None, None,
+                                     received_message(self.received))
+                self.received += 1
+            self.app_queue.get_nowait()
+            self.process.process_other()
+            self.assertLessEqual(self.app_queue.qsize(), SOAK_QUEUE_SIZE)
+
+    def test_memory_is_flat(self):
+        """ held messages stay within their limits, memory does not grow """
+        # objects allocated before tracing starts are not counted when
+        # they are freed, trace the warm up too
+        tracemalloc.start()
+        try:
+            self.run_overload(SOAK_WARM_UP)
+            before = tracemalloc.get_traced_memory()[0]
+            self.run_overload(SOAK_MESSAGES)
+            growth = tracemalloc.get_traced_memory()[0] - before
+        finally:
+            tracemalloc.stop()
+        self.assertLessEqual(len(self.process.ingress_data),
+                             INGRESS_DATA_SIZE)
+        self.assertLessEqual(len(self.process.ingress_requests),
+                             INGRESS_REQUEST_SIZE)
+        self.assertLess(growth, SOAK_MEMORY_GROWTH)
+        counters = self.process.metrics.counters
+        self.assertGreater(counters["ingress-request-dropped"].value, 0)
+        self.assertGreater(counters["ingress-dropped"].value, 0)
+
+    def test_requests_stay_in_order(self):
+        """ held requests reach the application in the order received """
+        for number in range(1, 4 * SOAK_QUEUE_SIZE, 2):
+            self.process.data_cb(None, None, received_message(number))
+        handled = []
+        while not self.app_queue.empty():
+            while not self.app_queue.empty():
+                (_type, new_message) = self.app_queue.get_nowait()
+                handled.append(new_message.mqtt_topic)
+            self.process.process_other()
+        self.assertEqual(
+            handled,
+            [received_message(number).topic
+             for number in range(1, 4 * SOAK_QUEUE_SIZE, 2)])
+
+
+if __name__ == '__main__':
+    unittest.main()
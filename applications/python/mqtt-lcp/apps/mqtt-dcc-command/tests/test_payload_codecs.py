@@ -0,0 +1,221 @@
+#!/usr/bin/python3
+# test_payload_codecs.py
+"""
+
+    test_payload_codecs.py - random message bodies survive a round trip
+        through the payload codecs, binary payloads decode on any node
+
+    Run from the tests folder:
+
+        python3 -m unittest test_payload_codecs
+
+The MIT License (MIT)
+
+Copyright 2023 richard p hughes
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+and associated documentation files (the "Software"), to deal in the Software without restriction,
+including without limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom the Software
+is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies
+or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""
+
+import json
+import os
+import random
+import sys
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(TESTS_DIR, '..', 'lib'))
+
+from utils.global_constants import Global
+from structs.io_data import IoData
+from utils.payload_codecs import PayloadCodecs, BinaryCodec, \
+    BINARY_FIELDS, BINARY_MARKER, BINARY_ROOTS, BINARY_WORDS
+
+# random bodies generated per property
+PROPERTY_RUNS = 2000
+# deepest nesting of generated maps and lists
+MAX_DEPTH = 3
+# topics configured for the binary codec in the tests
+BINARY_TOPICS = {"dt/mqtt-lcp/sensor": Global.BINARY,
+                 "dt/mqtt-lcp/block": Global.BINARY,
+                 "dt/mqtt-lcp/locator": Global.BINARY}
+
+
+def random_text(generator):
+    """ a word the binary codec packs as an index, or any string """
+    if generator.random() < 0.5:
+        return generator.choice(BINARY_WORDS)
+    length = generator.randint(0, 12)
+    return "".join(generator.choice("abcdef-/ 0123é€") for _ in range(length))
+
+
+def random_value(generator, depth=0):
+    """ a random JSON value """
+    choices = ["none", "bool", "small", "int", "long", "float", "text"]
+    if depth < MAX_DEPTH:
+        choices += ["map", "list"]
+    choice = generator.choice(choices)
+    if choice == "none":
+        return None
+    if choice == "bool":
+        return generator.random() < 0.5
+    if choice == "small":
+        return generator.randint(0, 0xff)
+    if choice == "int":
+        return generator.randint(-0x80000000, 0x7fffffff)
+    if choice == "long":
+        return generator.choice([-1, 1]) * \
+            generator.randint(0x80000000, 0x7fffffffffffffff)
+    if choice == "float":
+        return generator.uniform(-1e6, 1e6)
+    if choice == "text":
+        return random_text(generator)
+    if choice == "map":
+        return {random_text(generator): random_value(generator, depth + 1)
+                for _ in range(generator.randint(0, 4))}
+    return [random_value(generator, depth + 1)
+            for _ in range(generator.randint(0, 4))]
+
+
+def random_body(generator):
+    """ a random data message body with a binary root """
+    fields = [field for field in BINARY_FIELDS if generator.random() < 0.5]
+    if generator.random() < 0.2:
+        # fields are not always in encoded order
+        generator.shuffle(fields)
+    body = {field: random_value(generator) for field in fields}
+    return {generator.choice(BINARY_ROOTS): body}
+
+
+def random_io_data(generator):
+    """ a random sensor, block or locator data message """
+    rett = IoData()
+    rett.mqtt_message_root = generator.choice(BINARY_ROOTS)
+    rett.mqtt_node_id = random_text(generator)
+    rett.mqtt_port_id = random_text(generator)
+    if generator.random() < 0.5:
+        rett.mqtt_block_id = random_text(generator)
+    if generator.random() < 0.5:
+        rett.mqtt_loco_id = generator.randint(1, 9999)
+    rett.mqtt_reported = generator.choice(
+        [Global.ON, Global.OFF, Global.OCCUPIED, Global.CLEAR,
+         {Global.ENTERED: generator.randint(1, 9999)}])
+    rett.mqtt_version = "1.0"
+    rett.mqtt_timestamp = generator.randint(0, 2 ** 42)
+    if generator.random() < 0.5:
+        rett.mqtt_metadata = {Global.TYPE: generator.choice(
+            [Global.RAILCOM, Global.RFID])}
+    return rett
+
+
+class TestPayloadCodecRoundTrip(unittest.TestCase):
+    """ decode(encode(body)) == body for random bodies """
+
+    def setUp(self):
+        self.generator = random.Random(20)
+        self.codecs = PayloadCodecs(BINARY_TOPICS)
+        # a node with no binary topics configured
+        self.json_codecs = PayloadCodecs()
+
+    def test_binary_round_trip(self):
+        """ binary payloads decode to the body they were encoded from """
+        for _ in range(PROPERTY_RUNS):
+            body = random_body(self.generator)
+            payload = self.codecs.encode("dt/mqtt-lcp/sensor/node/port", body)
+            with self.subTest(body=body):
+                self.assertIsInstance(payload, bytes)
+                self.assertEqual(payload[0], BINARY_MARKER)
+                self.assertEqual(self.codecs.decode(payload), body)
+                # a node that does not publish binary still reads it
+                self.assertEqual(self.json_codecs.decode(payload), body)
+
+    def test_json_round_trip(self):
+        """ topics without a binary prefix are encoded as JSON """
+        for _ in range(PROPERTY_RUNS):
+            body = random_body(self.generator)
+            payload = self.codecs.encode("cmd/mqtt-lcp/sensor/node/req", body)
+            with self.subTest(body=body):
+                self.assertEqual(payload, json.dumps(body))
+                self.assertEqual(self.codecs.decode(payload), body)
+
+    def test_fallback_to_json(self):
+        """ bodies the binary codec cannot represent are sent as JSON """
+        bodies = [{Global.SWITCH: {Global.NODE_ID: "node"}},
+                  {Global.SENSOR: {"not-a-field": 1}},
+                  {Global.SENSOR: {Global.NODE_ID: 2 ** 70}},
+                  {Global.SENSOR: {Global.METADATA: {1: "key"}}},
+                  {Global.SENSOR: 1},
+                  {Global.SENSOR: {}, Global.BLOCK: {}}]
+        for body in bodies:
+            payload = self.codecs.encode("dt/mqtt-lcp/sensor/node/port", body)
+            with self.subTest(body=body):
+                self.assertEqual(payload, json.dumps(body))
+                # as json would read it, integer keys become strings
+                self.assertEqual(self.codecs.decode(payload),
+                                 json.loads(json.dumps(body)))
+
+    def test_io_data_round_trip(self):
+        """ data messages parse the same from binary and JSON payloads """
+        reversed_globals = Global.generate_reversed_list()
+        for _ in range(PROPERTY_RUNS):
+            io_data = random_io_data(self.generator)
+            topic = "dt/mqtt-lcp/" + io_data.mqtt_message_root + "/node/port"
+            body_map = io_data.encode_mqtt_map()
+            binary = IoData.parse_mqtt_map(
+                topic, self.codecs.decode(self.codecs.encode(topic, body_map)),
+                reversed_globals)
+            text = IoData.parse_mqtt_mesage(topic, json.dumps(body_map),
+                                            reversed_globals)
+            with self.subTest(body=body_map):
+                self.assertEqual(binary.encode_mqtt_map(),
+                                 text.encode_mqtt_map())
+                self.assertEqual(binary.mqtt_message_category,
+                                 text.mqtt_message_category)
+
+
+class TestBinaryDecodeErrors(unittest.TestCase):
+    """ damaged binary payloads raise ValueError, never anything else """
+
+    def setUp(self):
+        self.generator = random.Random(21)
+        self.codec = BinaryCodec()
+
+    def test_truncated_and_extended(self):
+        """ every truncation and an extra byte are rejected """
+        for _ in range(PROPERTY_RUNS // 10):
+            payload = self.codec.encode_binary(random_body(self.generator))
+            for length in range(len(payload)):
+                with self.subTest(payload=payload, length=length):
+                    self.assertRaises(ValueError, self.codec.decode,
+                                      payload[:length])
+            self.assertRaises(ValueError, self.codec.decode, payload + b"\0")
+
+    def test_random_bytes(self):
+        """ random payloads with a binary marker decode or raise ValueError """
+        for _ in range(PROPERTY_RUNS):
+            length = self.generator.randint(0, 40)
+            payload = bytes([BINARY_MARKER]) + bytes(
+                self.generator.randint(0, 255) for _ in range(length))
+            with self.subTest(payload=payload):
+                try:
+                    self.codec.decode(payload)
+                except ValueError:
+                    pass
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+#!/usr/bin/python3
+# test_process_watchdog.py
+"""
+
+    test_process_watchdog.py - the supervisor restarts a hung process, a process
+        that beats its heartbeat while it waits is left alone
+
+    Run from the tests folder:
+
+        python3 -m unittest test_process_watchdog
+
+The MIT License (MIT)
+
+Copyright 2023 richard p hughes
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+and associated documentation files (the "Software"), to deal in the Software without restriction,
+including without limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom the Software
+is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies
+or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""
+
+import os
+import sys
+import time
+import unittest
+from multiprocessing import Event, Queue
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BIN_DIR = os.path.join(TESTS_DIR, '..', 'bin')
+sys.path.append(os.path.join(TESTS_DIR, '..', 'lib'))
+
+from utils.global_constants import Global
+from processes.base_process import BaseProcess, HEARTBEAT_WAIT_INTERVAL
+from processes.process_utils import ProcessSupervisor
+
+# seconds without a heartbeat before the test supervisor reports a stall,
+# longer than the heartbeat interval of a waiting process
+TEST_STALL_TIME = 2 * HEARTBEAT_WAIT_INTERVAL
+# seconds without a heartbeat before the test supervisor restarts a process
+TEST_RESTART_TIME = 2 * TEST_STALL_TIME
+# seconds between supervisor checks in the tests
+CHECK_INTERVAL = 0.05
+
+
+class WaitProcess(BaseProcess):
+    """ process that hangs, or waits with its heartbeat, when asked """
+
+    def __init__(self, events=None, hang_event=None, wait_event=None,
+                 wait_time=0):
+        super().__init__(name="wait", events=events, in_queue=Queue())
+        self.hang_event = hang_event
+        self.wait_event = wait_event
+        self.wait_time = wait_time
+
+    def process_other(self):
+        """ hang or wait when the test sets an event """
+        super().process_other()
+        if self.hang_event is not None and self.hang_event.is_set():
+            # stuck, no heartbeat
+            time.sleep(60)
+        if self.wait_event is not None and self.wait_event.is_set():
+            self.wait_event.clear()
+            self.sleep_with_heartbeat(self.wait_time)
+
+
+class TestProcessWatchdog(unittest.TestCase):
+    """ supervisor watchdog of process heartbeats """
+
+    def setUp(self):
+        # supervisor and processes load the app config from the bin folder
+        self.cwd = os.getcwd()
+        os.chdir(BIN_DIR)
+        self.supervisor = ProcessSupervisor()
+        self.supervisor.watchdog_stall_time = TEST_STALL_TIME
+        self.supervisor.watchdog_restart_time = TEST_RESTART_TIME
+        self.hang_event = Event()
+        self.wait_event = Event()
+        self.started = []
+
+    def tearDown(self):
+        self.supervisor.events[Global.SHUTDOWN].set()
+        for process in self.started:
+            process.join(2)
+            if process.is_alive():
+                process.kill()
+                process.join()
+        self.supervisor.heartbeat.close()
+        os.chdir(self.cwd)
+
+    def start_wait_process(self, wait_time=0):
+        """ start the test process, restarts call it again """
+        process = WaitProcess(events=self.supervisor.events,
+                              hang_event=self.hang_event,
+                              wait_event=self.wait_event,
+                              wait_time=wait_time)
+        process.start()
+        self.started.append(process)
+        self.supervisor.processes["wait"] = \
+            (lambda: self.start_wait_process(wait_time), process)
+        self.supervisor.wait_for_processes_ready(["wait"])
+
+    def watch(self, seconds, until=None):
+        """ run supervisor checks for a time, or until a condition is met,
+            returns True if a stall of the process was reported """
+        stall_reported = False
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            self.supervisor.check_processes_are_responsive()
+            stall_reported = stall_reported or \
+                "wait" in self.supervisor.stalled_processes
+            if until is not None and until():
+                break
+            time.sleep(CHECK_INTERVAL)
+        return stall_reported
+
+    def current_process(self):
+        """ process the supervisor is running now """
+        return self.supervisor.processes["wait"][1]
+
+    def test_hung_process_is_restarted(self):
+        """ a process that stops beating is reported, then restarted """
+        self.start_wait_process()
+        hung_process = self.current_process()
+        self.assertFalse(self.watch(2 * TEST_STALL_TIME))
+        self.hang_event.set()
+        self.assertTrue(self.watch(
+            10, until=lambda: "wait" in self.supervisor.stalled_processes))
+        # new process must not hang too
+        self.hang_event.clear()
+        self.watch(10, until=lambda: self.current_process() is not hung_process)
+        hung_process.join(2)
+        self.assertIsNot(self.current_process(), hung_process)
+        self.assertFalse(hung_process.is_alive())
+        # new process runs and beats
+        self.assertTrue(self.current_process().is_alive())
+        self.assertFalse(self.watch(2 * TEST_STALL_TIME))
+
+    def test_waiting_process_is_not_restarted(self):
+        """ a process that waits longer than the restart time while
+            beating its heartbeat is neither reported nor restarted """
+        self.start_wait_process(wait_time=2 * TEST_RESTART_TIME)
+        waiting_process = self.current_process()
+        self.wait_event.set()
+        self.assertFalse(self.watch(2 * TEST_RESTART_TIME + 0.5))
+        self.assertFalse(self.wait_event.is_set())
+        self.assertIs(self.current_process(), waiting_process)
+        self.assertTrue(waiting_process.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()
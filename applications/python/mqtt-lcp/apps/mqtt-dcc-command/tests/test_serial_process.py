@@ -0,0 +1,188 @@
+#!/usr/bin/python3
+# test_serial_process.py
+"""
+
+    test_serial_process.py - responses to messages sent back to back are
+        matched to the messages, other lines read are published as input
+
+    Run from the tests folder:
+
+        python3 -m unittest test_serial_process
+
+The MIT License (MIT)
+
+Copyright 2023 richard p hughes
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+and associated documentation files (the "Software"), to deal in the Software without restriction,
+including without limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom the Software
+is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies
+or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""
+
+import os
+import sys
+import time
+import unittest
+from queue import Queue, Empty
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BIN_DIR = os.path.join(TESTS_DIR, '..', 'bin')
+sys.path.append(os.path.join(TESTS_DIR, '..', 'lib'))
+
+from utils.global_constants import Global
+from structs.gui_message import GuiMessage
+from decoders.dccpp_encoder import DccppEncoder
+from processes.serial_process import SerialProcess, RESPONSE_TIME
+
+# queue the serial process sends responses to
+RESPONSE_QUEUE = "test-response"
+
+
+class FakeSerialPort(object):
+    """ serial port that has lines waiting to be read once written to """
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.written = []
+
+    def isOpen(self):
+        """ always open """
+        return True
+
+    def write(self, bytes_to_write):
+        """ record a message, the device starts responding """
+        self.written.append(bytes_to_write)
+        return len(bytes_to_write)
+
+    @property
+    def in_waiting(self):
+        """ bytes of the lines waiting, once something has been written """
+        rett = 0
+        if self.written:
+            rett = sum(len(line) + 2 for line in self.lines)
+        return rett
+
+    def readline(self):
+        """ next line waiting """
+        return (self.lines.pop(0) + "\r\n").encode()
+
+
+def throttle_message(slot_id, sub_command=Global.SPEED):
+    """ a throttle message of a loco in a slot """
+    rett = GuiMessage()
+    rett.command = Global.THROTTLE
+    rett.sub_command = sub_command
+    rett.slot_id = slot_id
+    rett.dcc_id = 3000 + slot_id
+    rett.speed = 50
+    rett.direction = Global.FORWARD
+    rett.function = 0
+    rett.items = {function: 0 for function in range(29)}
+    return rett
+
+
+class TestSerialMessageList(unittest.TestCase):
+    """ send and respond of a list of messages """
+
+    def setUp(self):
+        # processes load the app config from the bin folder
+        self.cwd = os.getcwd()
+        os.chdir(BIN_DIR)
+        self.queues = {Global.DEVICE: Queue(), Global.APPLICATION: Queue(),
+                       Global.LOGGER: Queue(), Global.DRIVER: Queue(),
+                       RESPONSE_QUEUE: Queue()}
+        self.process = SerialProcess(events={Global.SHUTDOWN: None},
+                                     queues=self.queues)
+        self.encoder = DccppEncoder()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+
+    def send_list(self, gui_messages, lines, with_prefixes=True):
+        """ send the encoded messages, returns the response text """
+        self.process.serial_port = FakeSerialPort(lines)
+        send_message_map = {
+            Global.TEXT: [self.encoder.encode_message(message, Global.CLIENT)
+                          for message in gui_messages],
+            Global.RESPONSE_QUEUE: RESPONSE_QUEUE,
+            Global.REQUEST_ID: 1}
+        if with_prefixes:
+            send_message_map[Global.RESPONSE_PREFIXES] = [
+                self.encoder.encode_response_prefix(message)
+                for message in gui_messages]
+        self.assertTrue(self.process.process_message(
+            (Global.DEVICE_SEND_AND_RESPOND, send_message_map)))
+        (message_type, response, request_id) = \
+            self.queues[RESPONSE_QUEUE].get_nowait()
+        self.assertEqual(message_type, Global.DEVICE_RESPONSE)
+        self.assertEqual(request_id, 1)
+        return response
+
+    def device_input(self):
+        """ lines published as unsolicited input """
+        rett = []
+        try:
+            while True:
+                (message_type, line) = \
+                    self.queues[Global.DRIVER].get_nowait()
+                self.assertEqual(message_type, Global.DEVICE_INPUT)
+                rett.append(line)
+        except Empty:
+            pass
+        return rett
+
+    def test_unsolicited_lines(self):
+        """ power and sensor lines between responses are input """
+        response = self.send_list(
+            [throttle_message(1), throttle_message(2)],
+            ["<p1>", "<T 2 50 1>", "<Q 5>", "<T 1 50 1>", "<q 6>"])
+        self.assertEqual(response, ["<T 2 50 1>", "<T 1 50 1>"])
+        self.assertEqual(self.device_input(), ["<p1>", "<Q 5>"])
+        # the line after the responses is read as usual
+        self.process.process_other()
+        self.assertEqual(self.device_input(), ["<q 6>"])
+
+    def test_response_of_other_slot(self):
+        """ a response for a slot not sent to is not taken as a response """
+        started = time.monotonic()
+        response = self.send_list(
+            [throttle_message(1), throttle_message(2)],
+            ["<T 3 50 1>", "<T 1 50 1>"])
+        self.assertGreaterEqual(time.monotonic() - started, RESPONSE_TIME)
+        self.assertEqual(response, ["<T 1 50 1>"])
+        self.assertEqual(self.device_input(), ["<T 3 50 1>"])
+
+    def test_no_response_expected(self):
+        """ functions are not answered, nothing is waited for """
+        started = time.monotonic()
+        response = self.send_list(
+            [throttle_message(1, Global.FUNCTION),
+             throttle_message(2, Global.FUNCTION)], ["<p0>"])
+        self.assertLess(time.monotonic() - started, RESPONSE_TIME)
+        self.assertEqual(response, [])
+        self.process.process_other()
+        self.assertEqual(self.device_input(), ["<p0>"])
+
+    def test_without_prefixes(self):
+        """ with no prefixes any line read is a response """
+        response = self.send_list(
+            [throttle_message(1), throttle_message(2)],
+            ["<p1>", "<T 1 50 1>", "<T 2 50 1>"], with_prefixes=False)
+        self.assertEqual(response, ["<p1>", "<T 1 50 1>"])
+        self.assertEqual(self.device_input(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
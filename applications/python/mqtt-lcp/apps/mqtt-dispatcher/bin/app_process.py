@@ -567,7 +567,7 @@ class AppProcess(BaseMqttProcess):
         body.mqtt_desired = desired
         # response not needed, will monitor "dt" sensor message
         body.mqtt_respond_to = None
-        body.mqtt_session = "REQ:" + str(now)
+        body.mqtt_session_id = "REQ:" + str(now)
         body.mqtt_version = "1.0"
         body.mqtt_timestamp = now
         self.publish_request_message(
@@ -585,7 +585,7 @@ class AppProcess(BaseMqttProcess):
         body.mqtt_desired = desired
         # response not needed, will monitor "dt" sensor message
         body.mqtt_respond_to = None
-        body.mqtt_session = "REQ:" + str(now)
+        body.mqtt_session_id = "REQ:" + str(now)
         body.mqtt_version = "1.0"
         body.mqtt_timestamp = now
         self.publish_request_message(
@@ -603,7 +603,7 @@ class AppProcess(BaseMqttProcess):
         body.mqtt_desired = desired
         # response not needed, will monitor "dt" sensor message
         body.mqtt_respond_to = None
-        body.mqtt_session = "REQ:" + str(now)
+        body.mqtt_session_id = "REQ:" + str(now)
         body.mqtt_version = "1.0"
         body.mqtt_timestamp = now
         self.publish_request_message(
@@ -625,7 +625,7 @@ class AppProcess(BaseMqttProcess):
         body.mqtt_desired = desired
         # response not needed, will monitor "dt" sensor message
         body.mqtt_respond_to = None
-        body.mqtt_session = "REQ:" + str(now)
+        body.mqtt_session_id = "REQ:" + str(now)
         body.mqtt_version = "1.0"
         body.mqtt_timestamp = now
         self.publish_request_message(
@@ -645,7 +645,7 @@ class AppProcess(BaseMqttProcess):
         body.mqtt_desired = desired
         # response not needed, will monitor "dt" sensor message
         body.mqtt_respond_to = None
-        body.mqtt_session = "REQ:" + str(now)
+        body.mqtt_session_id = "REQ:" + str(now)
         body.mqtt_version = "1.0"
         body.mqtt_timestamp = now
         self.publish_request_message(
@@ -667,7 +667,7 @@ class AppProcess(BaseMqttProcess):
         body.mqtt_desired = desired
         # response not needed, will monitor "dt" sensor message
         body.mqtt_respond_to = None
-        body.mqtt_session = "REQ:" + str(now)
+        body.mqtt_session_id = "REQ:" + str(now)
         body.mqtt_version = "1.0"
         body.mqtt_timestamp = now
         self.publish_request_message(
@@ -708,7 +708,7 @@ class AppProcess(BaseMqttProcess):
             body.mqtt_metadata = ({Global.FASTCLOCK: {Global.TIME: gui_message.value}})
         body.mqtt_respond_to = self.mqtt_config.fixed_subscribe_topics.get(
             Global.SELF) + "/res"
-        body.mqtt_session = "REQ:" + str(now)
+        body.mqtt_session_id = "REQ:" + str(now)
         body.mqtt_version = "1.0"
         body.mqtt_timestamp = now
         self.publish_request_message(
@@ -63,6 +63,8 @@ class BaseMqttProcess(BaseProcess):
         self.mqtt_config = None
         self.roster = None
         self.ping_send_after_message = None
+        # (major category, category) -> message handler
+        self.mqtt_message_handlers = None
         print("base mqtt ok: " + str(self.name))
 
     def __repr__(self):
@@ -110,12 +112,17 @@ class BaseMqttProcess(BaseProcess):
         """ process messages from queue """
         msg_consummed = super().process_message(new_message)
         if not msg_consummed:
-            (msg_type, _msg_body) = new_message
+            (msg_type, msg_body) = new_message
             if msg_type == Global.PING:
                 # print(">>> ping...")
                 self.send_after(self.ping_send_after_message)
                 self.publish_ping_message()
                 msg_consummed = True
+            elif msg_type == Global.METRICS:
+                # metrics snapshot of another process of this app
+                self.publish_metrics(msg_body[Global.NAME],
+                                     msg_body[Global.METRICS])
+                msg_consummed = True
         return msg_consummed
 
     def process_other(self):
@@ -142,6 +149,18 @@ class BaseMqttProcess(BaseProcess):
             body.mqtt_metadata = metadata
             self.publish_message(topic, body)
 
+    def publish_metrics(self, process_name, snapshot):
+        """ publish a metrics snapshot of a process of this app """
+        topic = self.mqtt_config.publish_topics.get(
+            Global.METRICS,
+            "dt/mqtt-lcp/" + Global.METRICS + "/" + str(self.node_name))
+        body = IoData()
+        body.mqtt_message_root = Global.METRICS
+        body.mqtt_port_id = process_name
+        body.mqtt_reported = Global.METRICS
+        body.mqtt_metadata = snapshot
+        self.publish_data_message(topic + "/" + str(process_name), body)
+
     def publish_request_message(self, topic=None, message_io_data=None):
         """ format and publish an mqtt request message """
         if topic is None:
@@ -430,129 +449,36 @@ class BaseMqttProcess(BaseProcess):
         # presume msg_body is an instance of IoData
         major_category = msg_body.mqtt_major_category
         # print(">>> Major category: "+str(major_category))
-        if major_category == Global.MQTT_REQUEST:
-            self.parse_mqtt_request_message(msg_body=msg_body)
-        elif major_category == Global.MQTT_RESPONSE:
-            self.parse_mqtt_response_message(msg_body=msg_body)
-        elif major_category == Global.MQTT_DATA:
-            self.parse_mqtt_data_message(msg_body=msg_body)
-        else:
-            self.process_mqtt_other_message(msg_body=msg_body)
+        if self.mqtt_message_handlers is None:
+            self.mqtt_message_handlers = self.__build_mqtt_message_handlers()
+        handler = self.mqtt_message_handlers.get(
+            (major_category, msg_body.mqtt_message_category), None)
+        if handler is None:
+            # unknown category, use default handler for major category
+            handler = self.mqtt_message_handlers.get(
+                (major_category, None), self.parse_mqtt_other_message)
+        handler(msg_body)
 
     def parse_mqtt_request_message(self, msg_body=None):
         """ parse mqtt request message """
-        category = msg_body.mqtt_message_category
-        # print(">>> parse request: "+str(category))
-        if category == Global.MQTT_REQUEST_SHUTDOWN:
-            self.process_request_shutdown_message()
-        elif category == Global.MQTT_REQUEST_REBOOT:
-            self.process_request_reboot_message()
-        elif category == Global.MQTT_REQUEST_BACKUP:
-            self.process_request_backup_message(msg_body=msg_body)
-        elif category == Global.MQTT_REQUEST_NODE:
-            self.process_request_node_message(msg_body=msg_body)
-        elif category == Global.MQTT_REQUEST_TOWER:
-            self.process_request_tower_message(msg_body=msg_body)
-        elif category == Global.MQTT_REQUEST_ROSTER:
-            self.process_request_roster_message(msg_body=msg_body)
-        elif category == Global.MQTT_REQUEST_FASTCLOCK:
-            self.process_request_fastclock_message(msg_body=msg_body)
-        elif category == Global.MQTT_REQUEST_SIGNAL:
-            self.process_request_signal_message(msg_body=msg_body)
-        elif category == Global.MQTT_REQUEST_ROUTE:
-            self.process_request_route_message(msg_body=msg_body)
-        elif category == Global.MQTT_REQUEST_SWITCH:
-            self.process_request_switch_message(msg_body=msg_body)
-        elif category == Global.MQTT_REQUEST_SENSOR:
-            self.process_request_sensor_message(msg_body=msg_body)
-        elif category == Global.MQTT_REQUEST_CAB:
-            self.process_request_cab_message(msg_body=msg_body)
-        else:
-            self.process_request_request_message(msg_body=msg_body)
+        self.parse_mqtt_message_categories(msg_body=msg_body)
 
     def parse_mqtt_response_message(self, msg_body=None):
         """ parse mqtt response message """
-        category = msg_body.mqtt_message_category
-        if category == Global.MQTT_RESPONSE_NODE:
-            self.process_response_node_message(msg_body=msg_body)
-        elif category == Global.MQTT_RESPONSE_TOWER:
-            self.process_response_tower_message(msg_body=msg_body)
-        elif category == Global.MQTT_RESPONSE_ROSTER_REPORT:
-            self.process_response_roster_report_message(msg_body=msg_body)
-        elif category == Global.MQTT_RESPONSE_INVENTORY_REPORT:
-            self.process_response_inventory_message(msg_body=msg_body)
-        elif category == Global.MQTT_RESPONSE_PANELS_REPORT:
-            self.process_response_panels_message(msg_body=msg_body)
-        elif category == Global.MQTT_RESPONSE_DASHBOARD_REPORT:
-            self.process_response_dashboard_message(msg_body=msg_body)
-        elif category == Global.MQTT_RESPONSE_STATES_REPORT:
-            self.process_response_states_message(msg_body=msg_body)
-        elif category == Global.MQTT_RESPONSE_SWITCHES_REPORT:
-            self.process_response_switches_message(msg_body=msg_body)
-        elif category == Global.MQTT_RESPONSE_SENSORS_REPORT:
-            self.process_response_sensors_message(msg_body=msg_body)
-        elif category == Global.MQTT_RESPONSE_ROUTES_REPORT:
-            self.process_response_routes_message(msg_body=msg_body)
-        elif category == Global.MQTT_RESPONSE_SIGNALS_REPORT:
-            self.process_response_signals_message(msg_body=msg_body)
-        elif category == Global.MQTT_RESPONSE_REPORT:
-            self.process_response_report_message(msg_body=msg_body)
-        elif category == Global.MQTT_RESPONSE_TOWER_REPORT:
-            self.process_response_tower_message(msg_body=msg_body)
-        elif category == Global.MQTT_RESPONSE_DCC_COMMAND:
-            self.process_response_dcc_command_report_message(msg_body=msg_body)
-        elif category == Global.MQTT_RESPONSE_FASTCLOCK:
-            self.process_response_fastclock_message(msg_body=msg_body)
-        elif category == Global.MQTT_RESPONSE_SWITCH:
-            self.process_response_switch_message(msg_body=msg_body)
-        elif category == Global.MQTT_RESPONSE_SIGNAL:
-            self.process_response_signal_message(msg_body=msg_body)
-        elif category == Global.MQTT_RESPONSE_SENSOR:
-            self.process_response_sensor_message(msg_body=msg_body)
-        elif category == Global.MQTT_RESPONSE_ROUTE:
-            self.process_response_route_message(msg_body=msg_body)
-        elif category == Global.MQTT_RESPONSE_TRACK:
-            self.process_response_track_message(msg_body=msg_body)
-        elif category == Global.MQTT_RESPONSE_CAB:
-            self.process_response_cab_message(msg_body=msg_body)
-        else:
-            self.process_response_message(msg_body=msg_body)
+        self.parse_mqtt_message_categories(msg_body=msg_body)
 
     def parse_mqtt_data_message(self, msg_body=None):
         """ parse mqtt data message """
-        category = msg_body.mqtt_message_category
-        # print(">>> data cat: " + str(category))
-        if category == Global.MQTT_DATA_PING:
-            self.process_data_ping_message(msg_body=msg_body)
-        elif category == Global.MQTT_DATA_SENSOR:
-            self.process_data_sensor_message(msg_body=msg_body)
-        elif category == Global.MQTT_DATA_SIGNAL:
-            self.process_data_signal_message(msg_body=msg_body)
-        elif category == Global.MQTT_DATA_BLOCK:
-            self.process_data_block_message(msg_body=msg_body)
-        elif category == Global.MQTT_DATA_LOCATOR:
-            self.process_data_locator_message(msg_body=msg_body)
-        elif category == Global.MQTT_DATA_DASHBOARD:
-            self.process_data_dashboard_message(msg_body=msg_body)
-        elif category == Global.MQTT_DATA_ROSTER:
-            self.process_data_roster_message(msg_body=msg_body)
-        elif category == Global.MQTT_DATA_TOWER:
-            if msg_body.mqtt_port_id == Global.FASTCLOCK:
-                self.process_data_fastclock_message(msg_body=msg_body)
-            elif msg_body.mqtt_port_id == Global.CAB_SIGNAL:
-                self.process_data_cab_signal_message(msg_body=msg_body)
-            else:
-                self.process_data_tower_message(msg_body=msg_body)
-        elif category == Global.MQTT_DATA_SWITCH:
-            self.process_data_switch_message(msg_body=msg_body)
-        elif category == Global.MQTT_DATA_ROUTE:
-            self.process_data_route_message(msg_body=msg_body)
-        elif category == Global.MQTT_DATA_BACKUP:
-            self.process_data_backup_message(msg_body=msg_body)
-        elif category == Global.MQTT_DATA_CAB:
-            self.process_data_cab_message(msg_body=msg_body)
+        self.parse_mqtt_message_categories(msg_body=msg_body)
+
+    def parse_mqtt_data_tower_message(self, msg_body=None):
+        """ parse mqtt data tower message by port id """
+        if msg_body.mqtt_port_id == Global.FASTCLOCK:
+            self.process_data_fastclock_message(msg_body=msg_body)
+        elif msg_body.mqtt_port_id == Global.CAB_SIGNAL:
+            self.process_data_cab_signal_message(msg_body=msg_body)
         else:
-            self.process_data_message(msg_body=msg_body)
+            self.process_data_tower_message(msg_body=msg_body)
 
     # the following "process... " functions are expected
     # to be overridden in derived classes, as needed
@@ -656,6 +582,10 @@ class BaseMqttProcess(BaseProcess):
         """ process respons panels message """
         self.log_unexpected_message(msg_body=msg_body)
 
+    def process_response_dashboard_message(self, msg_body=None):
+        """ process respons dashboard message """
+        self.log_unexpected_message(msg_body=msg_body)
+
     def process_response_routes_message(self, msg_body=None):
         """ process respons routes message """
         self.log_unexpected_message(msg_body=msg_body)
@@ -803,7 +733,7 @@ class BaseMqttProcess(BaseProcess):
         body.mqtt_desired = Global.REPORT
         body.mqtt_respond_to = self.mqtt_config.fixed_subscribe_topics.get(
             Global.SELF) + "/res"
-        body.mqtt_session = "REQ:" + str(now)
+        body.mqtt_session_id = "REQ:" + str(now)
         body.mqtt_version = "1.0"
         body.mqtt_timestamp = now
         # print(">>> pub reg: " + str(body))
@@ -828,7 +758,7 @@ class BaseMqttProcess(BaseProcess):
         body.mqtt_port_id = Global.ROSTER
         body.mqtt_desired = Global.REPORT
         body.mqtt_respond_to = resp_topic
-        body.mqtt_session = "REQ:" + str(now)
+        body.mqtt_session_id = "REQ:" + str(now)
         body.mqtt_version = "1.0"
         body.mqtt_timestamp = now
         # print(">>> pub reg: " + str(body))
@@ -903,6 +833,110 @@ class BaseMqttProcess(BaseProcess):
 #   private functions
 #
 
+    def __build_mqtt_message_handlers(self):
+        """ build table of handlers for each mqtt message category """
+        request = Global.MQTT_REQUEST
+        response = Global.MQTT_RESPONSE
+        data = Global.MQTT_DATA
+        return {
+            (request, Global.MQTT_REQUEST_SHUTDOWN):
+                self.process_request_shutdown_message,
+            (request, Global.MQTT_REQUEST_REBOOT):
+                self.process_request_reboot_message,
+            (request, Global.MQTT_REQUEST_BACKUP):
+                self.process_request_backup_message,
+            (request, Global.MQTT_REQUEST_NODE):
+                self.process_request_node_message,
+            (request, Global.MQTT_REQUEST_TOWER):
+                self.process_request_tower_message,
+            (request, Global.MQTT_REQUEST_ROSTER):
+                self.process_request_roster_message,
+            (request, Global.MQTT_REQUEST_FASTCLOCK):
+                self.process_request_fastclock_message,
+            (request, Global.MQTT_REQUEST_SIGNAL):
+                self.process_request_signal_message,
+            (request, Global.MQTT_REQUEST_ROUTE):
+                self.process_request_route_message,
+            (request, Global.MQTT_REQUEST_SWITCH):
+                self.process_request_switch_message,
+            (request, Global.MQTT_REQUEST_SENSOR):
+                self.process_request_sensor_message,
+            (request, Global.MQTT_REQUEST_CAB):
+                self.process_request_cab_message,
+            (request, None):
+                self.process_request_request_message,
+            (response, Global.MQTT_RESPONSE_NODE):
+                self.process_response_node_message,
+            (response, Global.MQTT_RESPONSE_TOWER):
+                self.process_response_tower_message,
+            (response, Global.MQTT_RESPONSE_ROSTER_REPORT):
+                self.process_response_roster_report_message,
+            (response, Global.MQTT_RESPONSE_INVENTORY_REPORT):
+                self.process_response_inventory_message,
+            (response, Global.MQTT_RESPONSE_PANELS_REPORT):
+                self.process_response_panels_message,
+            (response, Global.MQTT_RESPONSE_DASHBOARD_REPORT):
+                self.process_response_dashboard_message,
+            (response, Global.MQTT_RESPONSE_STATES_REPORT):
+                self.process_response_states_message,
+            (response, Global.MQTT_RESPONSE_SWITCHES_REPORT):
+                self.process_response_switches_message,
+            (response, Global.MQTT_RESPONSE_SENSORS_REPORT):
+                self.process_response_sensors_message,
+            (response, Global.MQTT_RESPONSE_ROUTES_REPORT):
+                self.process_response_routes_message,
+            (response, Global.MQTT_RESPONSE_SIGNALS_REPORT):
+                self.process_response_signals_message,
+            (response, Global.MQTT_RESPONSE_REPORT):
+                self.process_response_report_message,
+            (response, Global.MQTT_RESPONSE_TOWER_REPORT):
+                self.process_response_tower_message,
+            (response, Global.MQTT_RESPONSE_DCC_COMMAND):
+                self.process_response_dcc_command_report_message,
+            (response, Global.MQTT_RESPONSE_FASTCLOCK):
+                self.process_response_fastclock_message,
+            (response, Global.MQTT_RESPONSE_SWITCH):
+                self.process_response_switch_message,
+            (response, Global.MQTT_RESPONSE_SIGNAL):
+                self.process_response_signal_message,
+            (response, Global.MQTT_RESPONSE_SENSOR):
+                self.process_response_sensor_message,
+            (response, Global.MQTT_RESPONSE_ROUTE):
+                self.process_response_route_message,
+            (response, Global.MQTT_RESPONSE_TRACK):
+                self.process_response_track_message,
+            (response, Global.MQTT_RESPONSE_CAB):
+                self.process_response_cab_message,
+            (response, None):
+                self.process_response_message,
+            (data, Global.MQTT_DATA_PING):
+                self.process_data_ping_message,
+            (data, Global.MQTT_DATA_SENSOR):
+                self.process_data_sensor_message,
+            (data, Global.MQTT_DATA_SIGNAL):
+                self.process_data_signal_message,
+            (data, Global.MQTT_DATA_BLOCK):
+                self.process_data_block_message,
+            (data, Global.MQTT_DATA_LOCATOR):
+                self.process_data_locator_message,
+            (data, Global.MQTT_DATA_DASHBOARD):
+                self.process_data_dashboard_message,
+            (data, Global.MQTT_DATA_ROSTER):
+                self.process_data_roster_message,
+            (data, Global.MQTT_DATA_TOWER):
+                self.parse_mqtt_data_tower_message,
+            (data, Global.MQTT_DATA_SWITCH):
+                self.process_data_switch_message,
+            (data, Global.MQTT_DATA_ROUTE):
+                self.process_data_route_message,
+            (data, Global.MQTT_DATA_BACKUP):
+                self.process_data_backup_message,
+            (data, Global.MQTT_DATA_CAB):
+                self.process_data_cab_message,
+            (data, None):
+                self.process_data_message
+        }
+
     def __build_common_metadata(self, meta, dev):
         """ build common meta elements """
         if dev.mqtt_port_id is not None:
@@ -0,0 +1,359 @@
+#!/usr/bin/python3
+# payload_codecs.py
+"""
+
+    PayloadCodecs - encode and decode mqtt message bodies by topic prefix
+
+        JSON is used unless a topic prefix is configured for another codec
+        in io.mqtt "payload-codecs", for example:
+
+            "payload-codecs": {"dt/mqtt-lcp/sensor": "binary",
+                               "dt/mqtt-lcp/block": "binary"}
+
+        The binary codec packs sensor, block and locator data bodies with
+        struct.  A binary payload starts with a marker byte that JSON text
+        never starts with, so a receiver can decode either whatever its own
+        configuration.  Bodies the binary codec cannot represent are sent
+        as JSON.  Nodes that predate this module only understand JSON, do
+        not configure binary for topics they subscribe to.
+
+The MIT License (MIT)
+
+Copyright 2023 richard p hughes
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+and associated documentation files (the "Software"), to deal in the Software without restriction,
+including without limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom the Software
+is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies
+or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+
+import json
+import struct
+import sys
+
+sys.path.append('../../lib')
+
+from utils.global_constants import Global
+
+# first byte of a binary payload, a new marker is needed if
+# BINARY_ROOTS, BINARY_FIELDS or BINARY_WORDS are changed
+BINARY_MARKER = 0x01
+
+# message roots encoded by the binary codec
+BINARY_ROOTS = (Global.SENSOR, Global.BLOCK, Global.LOCATOR)
+
+# message body keys encoded by the binary codec, in encoded order,
+# a bit in the header is set for each one present
+BINARY_FIELDS = (Global.NODE_ID, Global.PORT_ID, Global.THROTTLE_ID,
+                 Global.CAB_ID, Global.LOCO_ID, Global.BLOCK_ID,
+                 Global.DIRECTION, Global.IDENTITY, Global.STATE,
+                 Global.RESPOND_TO, Global.PUBLISHER, Global.SESSION_ID,
+                 Global.VERSION, Global.TIMESTAMP, Global.METADATA)
+
+# strings encoded as a one byte index
+BINARY_WORDS = (Global.REPORTED, Global.DESIRED, Global.TYPE, Global.FACING,
+                Global.ON, Global.OFF, Global.OCCUPIED, Global.CLEAR,
+                Global.UNKNOWN, Global.FORWARD, Global.REVERSE, Global.RAILCOM,
+                Global.RFID, Global.LOCATOR, Global.SENSOR, Global.BLOCK,
+                Global.ENTERED, Global.EXITED, Global.DETECTED, Global.THROWN,
+                Global.CLOSED, "1.0")
+
+# marker, root index, field bits
+BINARY_HEADER = struct.Struct(">BBH")
+
+# value type tags
+TAG_NONE = 0
+TAG_FALSE = 1
+TAG_TRUE = 2
+TAG_UINT8 = 3
+TAG_INT32 = 4
+TAG_INT64 = 5
+TAG_FLOAT = 6
+TAG_WORD = 7
+TAG_STR = 8
+TAG_MAP = 9
+TAG_LIST = 10
+
+PACKED_NONE = bytes((TAG_NONE,))
+PACKED_FALSE = bytes((TAG_FALSE,))
+PACKED_TRUE = bytes((TAG_TRUE,))
+TAGGED_UINT8 = struct.Struct(">BB")
+TAGGED_INT32 = struct.Struct(">Bi")
+TAGGED_INT64 = struct.Struct(">Bq")
+TAGGED_FLOAT = struct.Struct(">Bd")
+TAGGED_LENGTH = struct.Struct(">BH")
+INT32 = struct.Struct(">i")
+INT64 = struct.Struct(">q")
+FLOAT = struct.Struct(">d")
+
+# max distinct topics remembered by PayloadCodecs.codec_for_topic
+TOPIC_CACHE_SIZE = 1024
+
+
+class JsonCodec(object):
+    """ message bodies as JSON text """
+
+    def __repr__(self):
+        return f"{self.__class__}()"
+
+    def encode(self, body_map):
+        """ encode a message body map """
+        return json.dumps(body_map)
+
+    def decode(self, payload):
+        """ decode a payload to a message body map """
+        return json.loads(payload)
+
+
+class BinaryCodec(object):
+    """ sensor, block and locator message bodies packed with struct """
+
+    def __init__(self):
+        self.root_codes = {root: code for code, root in enumerate(BINARY_ROOTS)}
+        # field -> (bit, position), fields are encoded in position order
+        self.field_bits = {field: (1 << bit, bit)
+                           for bit, field in enumerate(BINARY_FIELDS)}
+        # values that are always encoded the same, already packed
+        self.packed_words = {word: TAGGED_UINT8.pack(TAG_WORD, code)
+                             for code, word in enumerate(BINARY_WORDS)}
+        self.packed_small_ints = [TAGGED_UINT8.pack(TAG_UINT8, value)
+                                  for value in range(256)]
+        self.json_codec = JsonCodec()
+
+    def __repr__(self):
+        return f"{self.__class__}()"
+
+    def encode(self, body_map):
+        """ encode a message body map, as JSON if it is not one
+            the binary codec can represent """
+        try:
+            return self.encode_binary(body_map)
+        except (ValueError, TypeError, OverflowError, struct.error):
+            return self.json_codec.encode(body_map)
+
+    def encode_binary(self, body_map):
+        """ encode a message body map, ValueError if it cannot be """
+        if type(body_map) is not dict or len(body_map) != 1:
+            raise ValueError("not a single root message")
+        (root, body) = next(iter(body_map.items()))
+        root_code = self.root_codes.get(root, None)
+        if root_code is None or type(body) is not dict:
+            raise ValueError("not a binary message root: " + str(root))
+        field_bits = self.field_bits
+        packed_words = self.packed_words
+        packed_small_ints = self.packed_small_ints
+        parts = [None]
+        bits = 0
+        last_position = -1
+        for (field, value) in body.items():
+            (bit, position) = field_bits.get(field, (None, None))
+            if bit is None:
+                raise ValueError("not a binary message field: " + str(field))
+            if position < last_position:
+                # not in encoded order, IoData bodies always are
+                ordered = {field: body[field] for field in BINARY_FIELDS
+                           if field in body}
+                if len(ordered) != len(body):
+                    raise ValueError("not all binary message fields")
+                return self.encode_binary({root: ordered})
+            last_position = position
+            bits |= bit
+            # common values inline, others by type
+            if value.__class__ is str and value in packed_words:
+                parts.append(packed_words[value])
+            elif value.__class__ is int and 0 <= value <= 0xff:
+                parts.append(packed_small_ints[value])
+            else:
+                self.__encode_value(parts, value)
+        parts[0] = BINARY_HEADER.pack(BINARY_MARKER, root_code, bits)
+        return b"".join(parts)
+
+    def decode(self, payload):
+        """ decode a binary payload to a message body map,
+            ValueError if it is not valid """
+        try:
+            (marker, root_code, bits) = BINARY_HEADER.unpack_from(payload, 0)
+            if marker != BINARY_MARKER or root_code >= len(BINARY_ROOTS):
+                raise ValueError("not a binary payload")
+            offset = BINARY_HEADER.size
+            body = {}
+            for field in BINARY_FIELDS:
+                if bits & 1:
+                    # common values inline, others by tag
+                    tag = payload[offset]
+                    if tag == TAG_WORD:
+                        body[field] = BINARY_WORDS[payload[offset + 1]]
+                        offset += 2
+                    elif tag == TAG_UINT8:
+                        body[field] = payload[offset + 1]
+                        offset += 2
+                    else:
+                        (body[field], offset) = \
+                            self.__decode_value(payload, offset)
+                bits >>= 1
+                if not bits:
+                    break
+        except (struct.error, IndexError) as exc:
+            raise ValueError("binary payload truncated") from exc
+        if offset != len(payload):
+            raise ValueError("binary payload has trailing bytes")
+        return {BINARY_ROOTS[root_code]: body}
+
+    #
+    # private functions
+    #
+
+    def __encode_value(self, parts, value):
+        """ append a tagged value to list of packed parts """
+        value_type = value.__class__
+        if value_type is str:
+            packed = self.packed_words.get(value, None)
+            if packed is not None:
+                parts.append(packed)
+            else:
+                text = value.encode("utf-8")
+                parts.append(TAGGED_LENGTH.pack(TAG_STR, len(text)))
+                parts.append(text)
+        elif value_type is int:
+            if 0 <= value <= 0xff:
+                parts.append(self.packed_small_ints[value])
+            elif -0x80000000 <= value <= 0x7fffffff:
+                parts.append(TAGGED_INT32.pack(TAG_INT32, value))
+            else:
+                parts.append(TAGGED_INT64.pack(TAG_INT64, value))
+        elif value is None:
+            parts.append(PACKED_NONE)
+        elif value_type is bool:
+            parts.append(PACKED_TRUE if value else PACKED_FALSE)
+        elif value_type is float:
+            parts.append(TAGGED_FLOAT.pack(TAG_FLOAT, value))
+        elif value_type is dict:
+            parts.append(TAGGED_LENGTH.pack(TAG_MAP, len(value)))
+            for (key, item) in value.items():
+                if key.__class__ is not str:
+                    raise ValueError("map key is not a string: " + str(key))
+                self.__encode_value(parts, key)
+                self.__encode_value(parts, item)
+        elif value_type is list:
+            parts.append(TAGGED_LENGTH.pack(TAG_LIST, len(value)))
+            for item in value:
+                self.__encode_value(parts, item)
+        else:
+            raise ValueError("value type not supported: " + str(value_type))
+
+    def __decode_value(self, payload, offset):
+        """ decode a tagged value, returns (value, next offset) """
+        tag = payload[offset]
+        offset += 1
+        if tag == TAG_WORD:
+            return (BINARY_WORDS[payload[offset]], offset + 1)
+        if tag == TAG_STR:
+            length = (payload[offset] << 8) | payload[offset + 1]
+            offset += 2
+            if offset + length > len(payload):
+                raise ValueError("binary payload truncated")
+            return (payload[offset:offset + length].decode("utf-8"),
+                    offset + length)
+        if tag == TAG_UINT8:
+            return (payload[offset], offset + 1)
+        if tag == TAG_INT64:
+            return (INT64.unpack_from(payload, offset)[0], offset + 8)
+        if tag == TAG_INT32:
+            return (INT32.unpack_from(payload, offset)[0], offset + 4)
+        if tag == TAG_NONE:
+            return (None, offset)
+        if tag == TAG_FALSE:
+            return (False, offset)
+        if tag == TAG_TRUE:
+            return (True, offset)
+        if tag == TAG_FLOAT:
+            return (FLOAT.unpack_from(payload, offset)[0], offset + 8)
+        if tag == TAG_MAP:
+            count = (payload[offset] << 8) | payload[offset + 1]
+            offset += 2
+            value = {}
+            for _i in range(count):
+                (key, offset) = self.__decode_value(payload, offset)
+                (value[key], offset) = self.__decode_value(payload, offset)
+            return (value, offset)
+        if tag == TAG_LIST:
+            count = (payload[offset] << 8) | payload[offset + 1]
+            offset += 2
+            value = []
+            for _i in range(count):
+                (item, offset) = self.__decode_value(payload, offset)
+                value.append(item)
+            return (value, offset)
+        raise ValueError("unknown binary value tag: " + str(tag))
+
+
+class PayloadCodecs(object):
+    """ registry of payload codecs by topic prefix """
+
+    def __init__(self, topic_codecs=None):
+        self.json_codec = JsonCodec()
+        self.binary_codec = BinaryCodec()
+        self.codecs = {Global.JSON: self.json_codec,
+                       Global.BINARY: self.binary_codec}
+        # (topic prefix, codec), longest prefix first
+        self.prefixes = []
+        self.topic_cache = {}
+        if topic_codecs is not None:
+            for (prefix, codec_name) in topic_codecs.items():
+                self.register(prefix, codec_name)
+
+    def __repr__(self):
+        # return "%s(%r)" % (self.__class__, self.__dict__)
+        fdict = repr(self.__dict__)
+        return f"{self.__class__}({fdict})"
+
+    def register(self, prefix, codec_name):
+        """ use a codec for topics starting with prefix """
+        codec = self.codecs.get(codec_name, None)
+        if codec is None:
+            raise ValueError("unknown payload codec: " + str(codec_name))
+        self.prefixes = [(p, c) for (p, c) in self.prefixes if p != prefix]
+        self.prefixes.append((prefix, codec))
+        self.prefixes.sort(key=lambda item: len(item[0]), reverse=True)
+        self.topic_cache = {}
+
+    def codec_for_topic(self, topic):
+        """ codec used to encode messages published to topic """
+        codec = self.topic_cache.get(topic, None)
+        if codec is None:
+            codec = self.json_codec
+            for (prefix, prefix_codec) in self.prefixes:
+                if topic.startswith(prefix):
+                    codec = prefix_codec
+                    break
+            if len(self.topic_cache) >= TOPIC_CACHE_SIZE:
+                self.topic_cache = {}
+            self.topic_cache[topic] = codec
+        return codec
+
+    def encode(self, topic, body_map):
+        """ encode a message body map for a topic, str if JSON else bytes """
+        if not self.prefixes:
+            return self.json_codec.encode(body_map)
+        return self.codec_for_topic(topic).encode(body_map)
+
+    def is_binary(self, payload):
+        """ was payload encoded by the binary codec """
+        return len(payload) > 0 and payload[0] == BINARY_MARKER
+
+    def decode(self, payload):
+        """ decode a received payload, binary or JSON """
+        if self.is_binary(payload):
+            return self.binary_codec.decode(payload)
+        return self.json_codec.decode(payload)
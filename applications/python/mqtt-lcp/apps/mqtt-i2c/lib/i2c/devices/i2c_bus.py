@@ -33,16 +33,16 @@ import time
 
 
 from smbus2 import SMBus
-from utils.global_constants import Global
 
 
 class I2cBus(SMBus):
     """ Class for an I2C connected mux device"""
 
-    def __init__(self, bus_number, log_queue):
+    def __init__(self, bus_number, logger):
         """ Initialize """
         super().__init__(bus_number)
-        self.log_queue = log_queue
+        # process whose log_* methods are used, they apply its log level
+        self.logger = logger
 
     def __repr__(self):
         # return "%s(%r)" % (self.__class__, self.__dict__)
@@ -62,9 +62,8 @@ class I2cBus(SMBus):
                 time.sleep(0.2)
         if not io_ok:
             # give up, pass along exception
-            self.log_queue.put(
-                (Global.LOG_LEVEL_ERROR, "Exception during i2c_write: " + str(exc) +
-                    " ... " + str(i2c_addr)))
+            self.logger.log_error("Exception during i2c_write: %s ... %s",
+                                  exc, i2c_addr)
 
     def write_i2c_block_data(self, i2c_addr, register, data, force=None):
         """ wrute a block of data """
@@ -80,9 +79,8 @@ class I2cBus(SMBus):
                 time.sleep(0.2)
         if not io_ok:
             # give up, pass along exception
-            self.log_queue.put(
-                (Global.LOG_LEVEL_ERROR, "Exception during i2c_write: " + str(exc) +
-                    " ... " + str(i2c_addr)))
+            self.logger.log_error("Exception during i2c_write: %s ... %s",
+                                  exc, i2c_addr)
 
     def read_i2c_byte_data(self, i2c_addr, register, length):
         """ read a block of data"""
@@ -99,9 +97,8 @@ class I2cBus(SMBus):
                 time.sleep(0.2)
         if not io_ok:
             # give up, pass along exception
-            self.log_queue.put(
-                (Global.LOG_LEVEL_WARNING, "Exception during i2c_read: " + str(exc) +
-                    " ... " + str(i2c_addr)))
+            self.logger.log_warning("Exception during i2c_read: %s ... %s",
+                                    exc, i2c_addr)
             # raise exc
         return rett
 
@@ -120,9 +117,8 @@ class I2cBus(SMBus):
                 time.sleep(0.2)
         if not io_ok:
             # give up, pass along exception
-            self.log_queue.put(
-                (Global.LOG_LEVEL_WARNING, "Exception during i2c_read: " + str(exc) +
-                    " ... " + str(i2c_addr)))
+            self.logger.log_warning("Exception during i2c_read: %s ... %s",
+                                    exc, i2c_addr)
             # raise exc
         return rett
 
@@ -149,8 +145,7 @@ class I2cBus(SMBus):
         except OSError as excp:
             io_ok = False
             exc = excp
-            self.log_queue.put((Global.LOG_LEVEL_DEBUG,
-                                "Exception during i2c_write: " + str(exc)))
+            self.logger.log_debug("Exception during i2c_write: %s", exc)
         return(io_ok, exc)
 
     def __write_block_catch_exception(self, i2c_addr, register, data, force):
@@ -161,8 +156,7 @@ class I2cBus(SMBus):
         except OSError as excp:
             io_ok = False
             exc = excp
-            self.log_queue.put((Global.LOG_LEVEL_DEBUG,
-                                "Exception during i2c_write: " + str(exc)))
+            self.logger.log_debug("Exception during i2c_write: %s", exc)
 
         return (io_ok, exc)
 
@@ -177,8 +171,7 @@ class I2cBus(SMBus):
         except OSError as excp:
             io_ok = False
             exc = excp
-            self.log_queue.put((Global.LOG_LEVEL_DEBUG,
-                                "Exception during i2c_read: " + str(exc)))
+            self.logger.log_debug("Exception during i2c_read: %s", exc)
         return (io_ok, exc, rett)
 
     def __read_block_catch_exception(self, i2c_addr, register, length, force):
@@ -192,6 +185,5 @@ class I2cBus(SMBus):
         except OSError as excp:
             io_ok = False
             exc = excp
-            self.log_queue.put((Global.LOG_LEVEL_DEBUG,
-                                "Exception during i2c_read: " + str(exc)))
+            self.logger.log_debug("Exception during i2c_read: %s", exc)
         return (io_ok, exc, rett)
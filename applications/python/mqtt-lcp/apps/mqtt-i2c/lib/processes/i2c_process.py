@@ -94,7 +94,7 @@ class I2cProcess(BaseProcess):
             else:
                 print("IoConfig: Error: " + message)
         self.i2c_devices_detected = self.__scan_i2c_addresses()
-        self.i2c_bus = I2cBus(self.io_config.i2c_bus_number, self.log_queue)
+        self.i2c_bus = I2cBus(self.io_config.i2c_bus_number, self)
         time.sleep(2)  # wait for i2c bus to "settle"
         self.log_info("... I2C Devices ...")
         self.log_info("I2c Bus: " + str(self.io_config.i2c_bus_number))
@@ -0,0 +1,97 @@
+#!/usr/bin/python3
+# config_utils.py
+"""
+
+    ConfigUtils - load the application configuration once and share it
+
+    The config file(s) and host name are read the first time they are requested.
+    Later requests, including those from processes created later by the
+    supervisor, receive a copy of the parsed data. The data is re-read only if a
+    file in the config folder has been added, removed or changed.
+
+The MIT License (MIT)
+
+Copyright 2023 richard p hughes
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+and associated documentation files (the "Software"), to deal in the Software without restriction,
+including without limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom the Software
+is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies
+or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+
+import sys
+import os
+import locale
+from copy import deepcopy
+
+sys.path.append('../../lib')
+
+from utils.json_utils import JsonUtils
+from utils.yaml_utils import YamlUtils
+
+
+class ConfigUtils(object):
+    """ help class to load and cache config data """
+
+    config = None
+    config_signature = None
+    host_name = None
+
+    def __init__(self):
+        pass
+
+    def __repr__(self):
+        # return "%s(%r)" % (self.__class__, self.__dict__)
+        fdict = repr(self.__dict__)
+        return f"{self.__class__}({fdict})"
+
+    @classmethod
+    def load_config(cls):
+        """ return a copy of the parsed config data,
+            files are only parsed if they have changed since last load """
+        config_root = "."
+        if os.path.exists("configure"):
+            config_root = "configure"
+        signature = cls.__config_signature(config_root)
+        if cls.config is None or signature != cls.config_signature:
+            if os.path.exists(os.path.join(config_root, 'config.yaml')):
+                config = YamlUtils().load_and_parse_file(
+                    os.path.join(config_root, "config.yaml"))
+            elif os.path.exists(os.path.join(config_root, 'config.yml')):
+                config = YamlUtils().load_and_parse_file(
+                    os.path.join(config_root, "config.yml"))
+            else:
+                config = JsonUtils().load_and_parse_file(config_root)
+            #  print(">>> config: "+str(config))
+            cls.config = config
+            cls.config_signature = signature
+        return deepcopy(cls.config)
+
+    @classmethod
+    def load_host_name(cls):
+        """ return unix host name """
+        if cls.host_name is None:
+            with open('/etc/hostname',
+                      encoding=locale.getpreferredencoding(False)) as f:
+                cls.host_name = (f.readlines()[0]).strip()
+        return cls.host_name
+
+    @classmethod
+    def __config_signature(cls, config_root):
+        """ names and modify times of files in config folder """
+        signature = []
+        with os.scandir(config_root) as entries:
+            for entry in entries:
+                signature.append((entry.name, entry.stat().st_mtime))
+        return (config_root, sorted(signature))
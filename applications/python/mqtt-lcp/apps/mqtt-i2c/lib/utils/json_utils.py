@@ -13,7 +13,8 @@
 
               //  "this is a comment"
 
-            Comments are single line only.
+            Comments are single line only. A comment may also follow JSON on
+            the same line.
 
         includes:
 
@@ -49,15 +50,25 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SO
 
 
 """
+import bisect
+import io
 import json
 import locale
 import os
 import sys
 import pathlib
+import re
 
 INCLUDE_TOKEN = "\"...\""
 COMMENT_TOKEN = "//"
 
+# kinds of tokens in a tokenized file
+LINE_JSON = 0
+LINE_INCLUDE = 1
+
+# a json string or the start of a comment
+STRING_OR_COMMENT = re.compile(r'"(?:[^"\\]|\\.)*"|//')
+
 
 sys.path.append('../../lib')
 
@@ -66,6 +77,9 @@ from utils.global_constants import Global
 class JsonUtils(object):
     """ help class for json operations """
 
+    # file name -> (modify time, tokenized lines), shared by all instances
+    file_cache = {}
+
     def __init__(self):
         pass
 
@@ -113,83 +127,161 @@ class JsonUtils(object):
     def parse_one_json_file(self, file_name):
         """ read and parse a json file """
         json_parsed = None
-        json_lines = self.__load_file(file_name, "")
-        # print(">>> JSON: " + str(json_lines))
+        json_text = io.StringIO()
+        # (first json line, source file, first source line, line count)
+        # for each block of lines written to json_text
+        source_map = []
+        self.__load_file(file_name, json_text, source_map, [])
+        json_string = json_text.getvalue()
+        # print(">>> JSON: " + str(json_string))
         try:
-            json_parsed = json.loads(json_lines)
+            json_parsed = json.loads(json_string)
+        except json.JSONDecodeError as ex:
+            (source_file, source_line) = \
+                self.__find_source_line(source_map, ex.lineno, file_name)
+            print("!!!! JSON Parse Error: File: " + str(source_file) + ":" +
+                  str(source_line))
+            print(" ... " + str(ex.msg))
+            lines = json_string.splitlines()
+            if 0 < ex.lineno <= len(lines):
+                print(" ... " + lines[ex.lineno - 1])
         except Exception as ex:
             print("!!!! JSON Parse Error: File: " + str(file_name))
             print(" ... " + str(ex))
-            print(" ... " + str(json_lines))
         return json_parsed
 
     #
     # private functions
     #
 
-
-
-    def __load_file(self, file_name, indent):
-        """ load a file for all file in a folder """
-        json_lines = ""
-        # print("Loading JSON: " + file_name)
+    def __load_file(self, file_name, json_text, source_map, including):
+        """ write a file, or all json files in a folder as a list,
+            to json_text """
         if os.path.isdir(file_name):
-            comma = ""
+            comma = False
             for sub_file_name in os.listdir(file_name):
                 extension = pathlib.Path(sub_file_name).suffix
                 if extension.lower() in [".json"]:
-                    incl_dir_file_name = file_name + os.path.sep + sub_file_name
-                    json_lines += comma
-                    comma = ","
-                    json_lines += indent + self.__load_file(
-                        incl_dir_file_name, indent)
+                    if comma:
+                        self.__write_lines(json_text, source_map, ",\n",
+                                           file_name, 0, 1)
+                    comma = True
+                    self.__load_file(
+                        os.path.join(file_name, sub_file_name), json_text,
+                        source_map, including)
         else:
-            json_lines += self.__load_one_file(file_name, indent)
-        return json_lines
-
-    def __load_one_file(self, file_name, indent):
-        """ load just one file """
-        json_lines = ""
+            self.__load_one_file(file_name, json_text, source_map, including)
+
+    def __load_one_file(self, file_name, json_text, source_map, including):
+        """ write just one file to json_text, expanding includes """
+        if file_name in including:
+            raise ValueError("JSON include loop: " +
+                             " -> ".join(including + [file_name]))
+        including = including + [file_name]
         # print("Loading JSON: " + file_name)
+        (fpath, _fname) = os.path.split(file_name)
+        for (kind, line_number, text, extra) in \
+                self.__tokenize_file(file_name):
+            if kind == LINE_INCLUDE:
+                include_file_name = text
+                if os.path.sep not in include_file_name and fpath != "":
+                    # file name without a dir path is relative to this file
+                    include_file_name = os.path.join(fpath, include_file_name)
+                # print("Include JSON file: " + str(include_file_name))
+                self.__load_file(include_file_name, json_text, source_map,
+                                 including)
+                if extra:
+                    # include line ended with a comma
+                    self.__write_lines(json_text, source_map, ",\n",
+                                       file_name, line_number, 1)
+            else:
+                self.__write_lines(json_text, source_map, text, file_name,
+                                   line_number, extra)
+
+    def __write_lines(self, json_text, source_map, text, file_name,
+                      line_number, line_count):
+        """ write a block of lines and remember where they came from """
+        first_json_line = 1
+        if source_map:
+            (last_json_line, _file, _line, last_count) = source_map[-1]
+            first_json_line = last_json_line + last_count
+        json_text.write(text)
+        source_map.append((first_json_line, file_name, line_number,
+                           line_count))
+
+    def __find_source_line(self, source_map, json_line, file_name):
+        """ file name and line number a line of parsed json came from """
+        first_json_lines = [block[0] for block in source_map]
+        index = bisect.bisect_right(first_json_lines, json_line) - 1
+        if index < 0:
+            return (file_name, 0)
+        (first_json_line, source_file, source_line, line_count) = \
+            source_map[index]
+        if json_line >= first_json_line + line_count:
+            # error is past the end of the file
+            return (source_file, source_line + line_count)
+        if source_line == 0:
+            # a comma added between files of an included folder
+            return (source_file, 0)
+        return (source_file, source_line + json_line - first_json_line)
+
+    def __tokenize_file(self, file_name):
+        """ split a file into blocks of json lines and include lines,
+            comments are removed, results are kept until the file changes """
+        modify_time = os.path.getmtime(file_name)
+        cached = JsonUtils.file_cache.get(file_name, None)
+        if cached is not None and cached[0] == modify_time:
+            return cached[1]
         with open(file_name,
                   encoding=locale.getpreferredencoding(False)) as json_file:
-            json_line_list = json_file.readlines()
-            for json_line in json_line_list:
-                new_line = json_line.rstrip()
-                # print(">>> line: {"+str(sline)+"}")
-                trim_new_line = new_line.strip()
-                # print(">>> time line: " + str(trim_new_line))
-                if trim_new_line.startswith(INCLUDE_TOKEN):
-                    (include_file_name, new_indent) = \
-                        self.__parse_include_file_name(new_line, indent)
-                    if os.path.sep in include_file_name:
-                        # file name include a dir path, leave it alone
-                        pass
-                    else:
-                        (fpath, _fname) = os.path.split(file_name)
-                        if fpath != "":
-                            include_file_name = fpath + os.path.sep + include_file_name
-                    # print("Include JSON file: " + str(include_file_name))
-                    json_lines += new_indent + self.__load_file(
-                        include_file_name, new_indent)
-                    if new_line.endswith(","):
-                        json_lines += new_indent + ","
+            file_text = json_file.read()
+        if not file_text.endswith("\n"):
+            file_text += "\n"
+        tokens = []
+        if INCLUDE_TOKEN not in file_text and COMMENT_TOKEN not in file_text:
+            # plain json, no need to look at each line
+            tokens.append((LINE_JSON, 1, file_text, file_text.count("\n")))
+        else:
+            block = []
+            block_line_number = 1
+            for line_number, json_line in \
+                    enumerate(file_text.splitlines(), start=1):
+                trim_line = json_line.strip()
+                if trim_line.startswith(INCLUDE_TOKEN):
+                    if block:
+                        tokens.append((LINE_JSON, block_line_number,
+                                       "\n".join(block) + "\n", len(block)))
+                    tokens.append((LINE_INCLUDE, line_number,
+                                   self.__parse_include_file_name(json_line),
+                                   trim_line.endswith(",")))
+                    block = []
+                    block_line_number = line_number + 1
                 else:
-                    if not trim_new_line.startswith(COMMENT_TOKEN):
-                        # ignore comments
-                        #print(">>> Json Line: "+ str(json_line))
-                        json_lines += indent + new_line
-        #print(">>> json lines: "+str(json_lines))
-        return json_lines
-
-    def __parse_include_file_name(self, json_line, indent):
+                    if trim_line.startswith(COMMENT_TOKEN):
+                        # ignore comments, blank line keeps line numbers
+                        json_line = ""
+                    elif COMMENT_TOKEN in json_line:
+                        json_line = self.__strip_comment(json_line)
+                    block.append(json_line)
+            if block:
+                tokens.append((LINE_JSON, block_line_number,
+                               "\n".join(block) + "\n", len(block)))
+        JsonUtils.file_cache[file_name] = (modify_time, tokens)
+        return tokens
+
+    def __strip_comment(self, json_line):
+        """ remove a // comment that is not inside a string """
+        for match in STRING_OR_COMMENT.finditer(json_line):
+            if match.group() == COMMENT_TOKEN:
+                return json_line[:match.start()].rstrip()
+        return json_line
+
+    def __parse_include_file_name(self, json_line):
         """ parse out include file name from "...": "file_name" """
-        include_indent = json_line.split(INCLUDE_TOKEN)[0]
         include_file_name = json_line.split(":")[1].strip()
         if include_file_name[:1] == "\"":
             # name is quoted, strip quotes
             endq = include_file_name.rfind("\"")
             include_file_name = include_file_name[1:endq]
             # print(">>> inc file: [" + str(include_file_name) + "]")
-        new_indent = include_indent + indent
-        return (include_file_name, new_indent)
+        return include_file_name
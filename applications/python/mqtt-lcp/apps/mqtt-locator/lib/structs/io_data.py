@@ -35,10 +35,120 @@ from utils.global_constants import Global
 
 # import time
 
+# attributes of an IoData instance
+IO_DATA_ATTRIBUTES = (
+    "io_type", "io_device_key", "io_address", "io_sub_address", "io_device",
+    "io_device_type", "io_device_state", "io_mux_address", "io_sub_devices",
+    "io_metadata", "mqtt_major_category", "mqtt_message_category",
+    "mqtt_topic", "mqtt_body", "mqtt_message_root", "mqtt_node_id",
+    "mqtt_port_id", "mqtt_throttle_id", "mqtt_cab_id", "mqtt_loco_id",
+    "mqtt_block_id", "mqtt_direction", "mqtt_identity", "mqtt_type",
+    "mqtt_send_sensor_message", "mqtt_state", "mqtt_desired",
+    "mqtt_reported", "mqtt_respond_to", "mqtt_publisher", "mqtt_session_id",
+    "mqtt_description", "data_topic", "mqtt_version", "mqtt_command_topic",
+    "mqtt_data_topic", "mqtt_roster_topic", "mqtt_data_type",
+    "mqtt_timestamp", "mqtt_metadata")
+
+# (attribute, message key) of fields encoded before the "state" map
+MESSAGE_HEAD_FIELDS = (
+    ("mqtt_node_id", Global.NODE_ID),
+    ("mqtt_port_id", Global.PORT_ID),
+    ("mqtt_throttle_id", Global.THROTTLE_ID),
+    ("mqtt_cab_id", Global.CAB_ID),
+    ("mqtt_loco_id", Global.LOCO_ID),
+    ("mqtt_block_id", Global.BLOCK_ID),
+    ("mqtt_direction", Global.DIRECTION),
+    ("mqtt_identity", Global.IDENTITY))
+
+# (attribute, message key) of fields encoded after the "state" map
+MESSAGE_TAIL_FIELDS = (
+    ("mqtt_respond_to", Global.RESPOND_TO),
+    ("mqtt_publisher", Global.PUBLISHER),
+    ("mqtt_session_id", Global.SESSION_ID),
+    ("mqtt_version", Global.VERSION),
+    ("mqtt_timestamp", Global.TIMESTAMP),
+    ("mqtt_metadata", Global.METADATA))
+
+# (attribute, message key) of fields parsed from a message body
+MESSAGE_PARSE_FIELDS = ((("mqtt_reported", Global.REPORTED),) +
+                        MESSAGE_HEAD_FIELDS + MESSAGE_TAIL_FIELDS)
+
+# first topic segment -> last topic segment -> major category, "#" matches any
+TOPIC_CATEGORIES = {
+    "dt": {"#": Global.MQTT_DATA},
+    "cmd": {"req": Global.MQTT_REQUEST, "res": Global.MQTT_RESPONSE}
+}
+
+# message root -> request category
+REQUEST_CATEGORIES = {
+    Global.NODE: Global.MQTT_REQUEST_NODE,
+    Global.TOWER: Global.MQTT_REQUEST_TOWER,
+    Global.ROSTER: Global.MQTT_REQUEST_ROSTER,
+    Global.FASTCLOCK: Global.MQTT_REQUEST_FASTCLOCK,
+    Global.SWITCH: Global.MQTT_REQUEST_SWITCH,
+    Global.ROUTE: Global.MQTT_REQUEST_ROUTE,
+    Global.SENSOR: Global.MQTT_REQUEST_SENSOR,
+    Global.SIGNAL: Global.MQTT_REQUEST_SIGNAL,
+    Global.CAB: Global.MQTT_REQUEST_CAB
+}
+
+# desired state of a node request -> request category
+NODE_REQUEST_CATEGORIES = {
+    Global.SHUTDOWN: Global.MQTT_REQUEST_SHUTDOWN,
+    Global.REBOOT: Global.MQTT_REQUEST_REBOOT,
+    Global.BACKUP: Global.MQTT_REQUEST_BACKUP
+}
+
+# message root -> response category
+RESPONSE_CATEGORIES = {
+    Global.NODE: Global.MQTT_RESPONSE_NODE,
+    Global.TOWER: Global.MQTT_RESPONSE_TOWER,
+    Global.ROSTER: Global.MQTT_RESPONSE_ROSTER_REPORT,
+    Global.DCC_COMMAND: Global.MQTT_RESPONSE_DCC_COMMAND,
+    Global.SWITCH: Global.MQTT_RESPONSE_SWITCH,
+    Global.SIGNAL: Global.MQTT_RESPONSE_SIGNAL,
+    Global.ROUTE: Global.MQTT_RESPONSE_ROUTE,
+    Global.SENSOR: Global.MQTT_RESPONSE_SENSOR,
+    Global.CAB: Global.MQTT_RESPONSE_CAB
+}
+
+# port id of a tower report response -> response category
+TOWER_RESPONSE_CATEGORIES = {
+    Global.INVENTORY: Global.MQTT_RESPONSE_INVENTORY_REPORT,
+    Global.PANEL: Global.MQTT_RESPONSE_PANELS_REPORT,
+    Global.DASHBOARD: Global.MQTT_RESPONSE_DASHBOARD_REPORT,
+    Global.FASTCLOCK: Global.MQTT_RESPONSE_FASTCLOCK
+}
+
+# message root -> data category
+DATA_CATEGORIES = {
+    Global.PING: Global.MQTT_DATA_PING,
+    Global.SENSOR: Global.MQTT_DATA_SENSOR,
+    Global.SIGNAL: Global.MQTT_DATA_SIGNAL,
+    Global.BLOCK: Global.MQTT_DATA_BLOCK,
+    Global.LOCATOR: Global.MQTT_DATA_LOCATOR,
+    Global.SWITCH: Global.MQTT_DATA_SWITCH,
+    Global.ROUTE: Global.MQTT_DATA_ROUTE,
+    Global.BACKUP: Global.MQTT_DATA_BACKUP,
+    Global.CAB: Global.MQTT_DATA_CAB,
+    Global.ROSTER: Global.MQTT_DATA_ROSTER,
+    Global.DASHBOARD: Global.MQTT_DATA_DASHBOARD,
+    Global.TOWER: Global.MQTT_DATA_TOWER
+}
+
+# Global name -> Global value, used to encode the message root
+MESSAGE_ROOTS = {
+    name: value
+    for (name, value) in vars(Global).items()
+    if not name.startswith("_") and isinstance(value, str)
+}
+
 
 class IoData(object):
     """ Data structure used to store i2c device data """
 
+    __slots__ = IO_DATA_ATTRIBUTES
+
     def __init__(self):
         """ Initialize """
         self.io_type = None
@@ -74,8 +184,6 @@ class IoData(object):
         self.mqtt_publisher = None
         self.mqtt_session_id = None
         self.mqtt_description = None
-        self.mqtt_block_id = None
-        self.mqtt_direction = None
         self.data_topic = None
         self.mqtt_version = None
         self.mqtt_command_topic = None
@@ -87,59 +195,49 @@ class IoData(object):
 
     def __repr__(self):
         # return "%s(%r)" % (self.__class__, self.__dict__)
-        fdict = repr(self.__dict__)
+        fdict = repr({
+            attribute: getattr(self, attribute)
+            for attribute in IO_DATA_ATTRIBUTES
+        })
         return f"{self.__class__}({fdict})"
 
     @classmethod
     def parse_mqtt_mesage(cls, topic=None, body=None, reversed_globals=None):
-        """ parse a mqtt message body dictionary, returns a io_data object """
-        new_io_data = IoData()
-        new_io_data.mqtt_body = body
+        """ parse a mqtt message JSON body, returns a io_data object """
         try:
             body_map = json.loads(body)
         except Exception as exc:
             body_map = None
             print("Exception during JSON parsing: " + str(exc) + "\n" +
                   str(body))
+        return cls.parse_mqtt_map(topic, body_map, reversed_globals, body)
+
+    @classmethod
+    def parse_mqtt_map(cls, topic=None, body_map=None, reversed_globals=None,
+                       body=None):
+        """ parse a decoded mqtt message body, returns a io_data object """
+        new_io_data = IoData()
+        new_io_data.mqtt_body = body
         if body_map is not None:
             if not isinstance(body_map, dict):
                 # opps, mqtt bost is a value, not a map, build a amp for it
                 body_map = {Global.UNKNOWN: {
                     Global.STATE: {Global.DESIRED: body_map}}}
             # get root key of dict
-            mroot = list(body_map.keys())[0]
+            mroot = next(iter(body_map))
             mbody = body_map[mroot]
             if mbody is not None and isinstance(mbody, dict):
                 new_io_data.mqtt_message_root = reversed_globals.get(
                     mroot, mroot).lower()
 
                 new_io_data.mqtt_topic = topic
-                new_io_data.mqtt_reported = mbody.get(Global.REPORTED, None)
-                new_io_data.mqtt_node_id = mbody.get(Global.NODE_ID, None)
-                new_io_data.mqtt_port_id = mbody.get(Global.PORT_ID, None)
-                new_io_data.mqtt_throttle_id = mbody.get(
-                    Global.THROTTLE_ID, None)
-                new_io_data.mqtt_cab_id = mbody.get(Global.CAB_ID, None)
-                new_io_data.mqtt_loco_id = mbody.get(Global.LOCO_ID, None)
-                new_io_data.mqtt_block_id = mbody.get(Global.BLOCK_ID, None)
-                new_io_data.mqtt_direction = mbody.get(Global.DIRECTION, None)
-                new_io_data.mqtt_identity = mbody.get(Global.IDENTITY, None)
-                new_io_data.mqtt_session_id = mbody.get(
-                    Global.SESSION_ID, None)
-                new_io_data.mqtt_version = mbody.get(Global.VERSION, None)
-                new_io_data.mqtt_timestamp = mbody.get(Global.TIMESTAMP, None)
-                new_io_data.mqtt_respond_to = mbody.get(
-                    Global.RESPOND_TO, None)
-                new_io_data.mqtt_publisher = mbody.get(
-                    Global.PUBLISHER, None)
-                new_io_data.mqtt_metadata = mbody.get(Global.METADATA, None)
-                if ((new_io_data.mqtt_metadata is not None)
-                        and (isinstance(new_io_data.mqtt_metadata, dict))):
+                for (attribute, key) in MESSAGE_PARSE_FIELDS:
+                    setattr(new_io_data, attribute, mbody.get(key, None))
+                if isinstance(new_io_data.mqtt_metadata, dict):
                     new_io_data.mqtt_type = new_io_data.mqtt_metadata.get(
                         Global.TYPE, None)
                 new_io_data.mqtt_state = mbody.get(Global.STATE, None)
-                if ((new_io_data.mqtt_state is not None)
-                        and (isinstance(new_io_data.mqtt_state, dict))):
+                if isinstance(new_io_data.mqtt_state, dict):
                     new_io_data.mqtt_desired = new_io_data.mqtt_state.get(
                         Global.DESIRED, None)
                     new_io_data.mqtt_reported = new_io_data.mqtt_state.get(
@@ -250,64 +348,38 @@ class IoData(object):
 
     def encode_mqtt_message(self):
         """ encode a new message """
+        return json.dumps(self.encode_mqtt_map())
+
+    def encode_mqtt_map(self):
+        """ encode a new message as a body map, see utils/payload_codecs.py """
         body_map = {}
-        if self.mqtt_node_id is not None:
-            body_map.update({Global.NODE_ID: self.mqtt_node_id})
-        if self.mqtt_port_id is not None:
-            body_map.update({Global.PORT_ID: self.mqtt_port_id})
-        if self.mqtt_throttle_id is not None:
-            body_map.update({Global.THROTTLE_ID: self.mqtt_throttle_id})
-        if self.mqtt_cab_id is not None:
-            body_map.update({Global.CAB_ID: self.mqtt_cab_id})
-        if self.mqtt_loco_id is not None:
-            body_map.update({Global.LOCO_ID: self.mqtt_loco_id})
-        if self.mqtt_block_id is not None:
-            body_map.update({Global.BLOCK_ID: self.mqtt_block_id})
-        if self.mqtt_direction is not None:
-            body_map.update({Global.DIRECTION: self.mqtt_direction})
-        if self.mqtt_identity is not None:
-            body_map.update({Global.IDENTITY: self.mqtt_identity})
+        for (attribute, key) in MESSAGE_HEAD_FIELDS:
+            value = getattr(self, attribute)
+            if value is not None:
+                body_map[key] = value
         if self.mqtt_desired is not None or self.mqtt_reported is not None:
             state_map = {}
             if self.mqtt_desired is not None:
-                state_map.update({Global.DESIRED: self.mqtt_desired})
+                state_map[Global.DESIRED] = self.mqtt_desired
             if self.mqtt_reported is not None:
-                state_map.update({Global.REPORTED: self.mqtt_reported})
-            body_map.update({Global.STATE: state_map})
-        if self.mqtt_respond_to is not None:
-            body_map.update({Global.RESPOND_TO: self.mqtt_respond_to})
-        if self.mqtt_publisher is not None:
-            body_map.update({Global.PUBLISHER: self.mqtt_publisher})
-        if self.mqtt_session_id is not None:
-            body_map.update({Global.SESSION_ID: self.mqtt_session_id})
-        if self.mqtt_version is not None:
-            body_map.update({Global.VERSION: self.mqtt_version})
-        if self.mqtt_timestamp is not None:
-            body_map.update({Global.TIMESTAMP: self.mqtt_timestamp})
-        if self.mqtt_metadata is not None:
-            body_map.update({Global.METADATA: self.mqtt_metadata})
+                state_map[Global.REPORTED] = self.mqtt_reported
+            body_map[Global.STATE] = state_map
+        for (attribute, key) in MESSAGE_TAIL_FIELDS:
+            value = getattr(self, attribute)
+            if value is not None:
+                body_map[key] = value
         if self.mqtt_type is not None:
             if self.mqtt_metadata is None:
-                body_map.update(
-                    {Global.METADATA: {
-                        Global.TYPE: self.mqtt_type
-                    }})
+                body_map[Global.METADATA] = {Global.TYPE: self.mqtt_type}
             elif isinstance(self.mqtt_metadata, dict):
-                body_map[Global.METADATA].update(
-                    {Global.METADATA: self.mqtt_metadata})
+                metadata = dict(self.mqtt_metadata)
+                metadata[Global.TYPE] = self.mqtt_type
+                body_map[Global.METADATA] = metadata
 
-        mqtt_root = None
         if self.mqtt_message_root is not None:
-            global_instance = Global()
-            try:
-                mqtt_root = getattr(global_instance,
-                                    self.mqtt_message_root.upper())
-            except Exception:
-                pass
+            mqtt_root = MESSAGE_ROOTS.get(self.mqtt_message_root.upper(), None)
             body_map = {mqtt_root: body_map}
-        # print(">>> !!! enoode JSON: " + str(body_map))
-        json_string = json.dumps(body_map)
-        return json_string
+        return body_map
 
     def encode_inventory_map(self):
         """ encode an io_data instance as as a map """
@@ -375,20 +447,12 @@ class IoData(object):
 
     def categorize_message(self, topic=None):
         """ determine the category of message """
-
-        topic_list = topic.split('/')
-        first_topic = topic_list[0].lower()
-        last_topic = topic_list[-1].lower()
         major_category = Global.MQTT_OTHER
-        if first_topic == "dt":
-            major_category = Global.MQTT_DATA
-        elif first_topic == "cmd":
-            if last_topic == "req":
-                major_category = Global.MQTT_REQUEST
-            elif last_topic == "res":
-                major_category = Global.MQTT_RESPONSE
-            else:
-                major_category = Global.MQTT_OTHER
+        topic_list = topic.split('/')
+        last_topics = TOPIC_CATEGORIES.get(topic_list[0].lower(), None)
+        if last_topics is not None:
+            major_category = last_topics.get(
+                topic_list[-1].lower(), last_topics.get("#", Global.MQTT_OTHER))
         #  print(">>> major >>> "+str(major_category))
         category = major_category
         if major_category == Global.MQTT_REQUEST:
@@ -402,115 +466,28 @@ class IoData(object):
 
     def categorize_request_message(self):
         """ categorize a request message """
-        category = Global.MQTT_REQUEST
         # print(">>> root >>> "+str(self.mqtt_message_root))
-        if self.mqtt_message_root == Global.NODE:
-            if self.mqtt_desired == Global.SHUTDOWN:
-                category = Global.MQTT_REQUEST_SHUTDOWN
-            elif self.mqtt_desired == Global.REBOOT:
-                category = Global.MQTT_REQUEST_REBOOT
-            elif self.mqtt_desired == Global.BACKUP:
-                category = Global.MQTT_REQUEST_BACKUP
-            else:
-                category = Global.MQTT_REQUEST_NODE
-        elif self.mqtt_message_root == Global.TOWER:
-            category = Global.MQTT_REQUEST_TOWER
-        elif self.mqtt_message_root == Global.ROSTER:
-            category = Global.MQTT_REQUEST_ROSTER
-        elif self.mqtt_message_root == Global.FASTCLOCK:
-            category = Global.MQTT_REQUEST_FASTCLOCK
-        elif self.mqtt_message_root == Global.SWITCH:
-            category = Global.MQTT_REQUEST_SWITCH
-        elif self.mqtt_message_root == Global.ROUTE:
-            category = Global.MQTT_REQUEST_ROUTE
-        elif self.mqtt_message_root == Global.SENSOR:
-            category = Global.MQTT_REQUEST_SENSOR
-        elif self.mqtt_message_root == Global.SIGNAL:
-            category = Global.MQTT_REQUEST_SIGNAL
-        elif self.mqtt_message_root == Global.CAB:
-            category = Global.MQTT_REQUEST_CAB
-        else:
-            category = Global.MQTT_REQUEST
+        category = REQUEST_CATEGORIES.get(self.mqtt_message_root,
+                                          Global.MQTT_REQUEST)
+        if category == Global.MQTT_REQUEST_NODE and \
+                isinstance(self.mqtt_desired, str):
+            category = NODE_REQUEST_CATEGORIES.get(self.mqtt_desired,
+                                                   category)
         return category
 
     def categorize_response_message(self):
         """ categorize a response message """
         # print(">>> response root: " + str(self.mqtt_message_root))
-        category = Global.MQTT_RESPONSE
-        if self.mqtt_message_root == Global.NODE:
-            category = Global.MQTT_RESPONSE_NODE
-        elif self.mqtt_message_root == Global.TOWER:
-            #            if isinstance(self.mqtt_reported, dict):
-            #                report = self.mqtt_reported.get(Global.REPORT, None)
-            #                if report is None:
-            #                    category = Global.MQTT_RESPONSE_TOWER
-            #                elif report == Global.ROSTER:
-            #                    category = Global.MQTT_RESPONSE_ROSTER_REPORT
-            #                elif report == Global.INVENTORY:
-            #                    category = Global.MQTT_RESPONSE_INVENTORY_REPORT
-            #                else:
-            #                    category = Global.MQTT_RESPONSE_REPORT
-            #            else:
-            #                category = Global.MQTT_RESPONSE_TOWER_REPORT
-            report = self.mqtt_reported
-            port_id = self.mqtt_port_id
-            if report is None:
-                category = Global.MQTT_RESPONSE_TOWER
-            elif port_id == Global.INVENTORY:
-                category = Global.MQTT_RESPONSE_INVENTORY_REPORT
-            elif port_id == Global.PANEL:
-                category = Global.MQTT_RESPONSE_PANELS_REPORT
-            elif port_id == Global.DASHBOARD:
-                category = Global.MQTT_RESPONSE_DASHBOARD_REPORT
-            elif port_id == Global.FASTCLOCK:
-                category = Global.MQTT_RESPONSE_FASTCLOCK
-            else:
-                category = Global.MQTT_RESPONSE_TOWER_REPORT
-        elif self.mqtt_message_root == Global.ROSTER:
-            category = Global.MQTT_RESPONSE_ROSTER_REPORT
-        elif self.mqtt_message_root == Global.DCC_COMMAND:
-            category = Global.MQTT_RESPONSE_DCC_COMMAND
-        elif self.mqtt_message_root == Global.SWITCH:
-            category = Global.MQTT_RESPONSE_SWITCH
-        elif self.mqtt_message_root == Global.SIGNAL:
-            category = Global.MQTT_RESPONSE_SIGNAL
-        elif self.mqtt_message_root == Global.ROUTE:
-            category = Global.MQTT_RESPONSE_ROUTE
-        elif self.mqtt_message_root == Global.SENSOR:
-            category = Global.MQTT_RESPONSE_SENSOR
-        elif self.mqtt_message_root == Global.CAB:
-            category = Global.MQTT_RESPONSE_CAB
-        else:
-            category = Global.MQTT_RESPONSE
+        category = RESPONSE_CATEGORIES.get(self.mqtt_message_root,
+                                           Global.MQTT_RESPONSE)
+        if category == Global.MQTT_RESPONSE_TOWER and \
+                self.mqtt_reported is not None:
+            category = Global.MQTT_RESPONSE_TOWER_REPORT
+            if isinstance(self.mqtt_port_id, str):
+                category = TOWER_RESPONSE_CATEGORIES.get(
+                    self.mqtt_port_id, category)
         return category
 
     def categorize_data_message(self):
         """ categorize a data message """
-        category = Global.MQTT_DATA
-        if self.mqtt_message_root == Global.PING:
-            category = Global.MQTT_DATA_PING
-        elif self.mqtt_message_root == Global.SENSOR:
-            category = Global.MQTT_DATA_SENSOR
-        elif self.mqtt_message_root == Global.SIGNAL:
-            category = Global.MQTT_DATA_SIGNAL
-        elif self.mqtt_message_root == Global.BLOCK:
-            category = Global.MQTT_DATA_BLOCK
-        elif self.mqtt_message_root == Global.LOCATOR:
-            category = Global.MQTT_DATA_LOCATOR
-        elif self.mqtt_message_root == Global.SWITCH:
-            category = Global.MQTT_DATA_SWITCH
-        elif self.mqtt_message_root == Global.ROUTE:
-            category = Global.MQTT_DATA_ROUTE
-        elif self.mqtt_message_root == Global.BACKUP:
-            category = Global.MQTT_DATA_BACKUP
-        elif self.mqtt_message_root == Global.CAB:
-            category = Global.MQTT_DATA_CAB
-        elif self.mqtt_message_root == Global.ROSTER:
-            category = Global.MQTT_DATA_ROSTER
-        elif self.mqtt_message_root == Global.DASHBOARD:
-            category = Global.MQTT_DATA_DASHBOARD
-        elif self.mqtt_message_root == Global.TOWER:
-            category = Global.MQTT_DATA_TOWER
-        else:
-            category = Global.MQTT_DATA
-        return category
+        return DATA_CATEGORIES.get(self.mqtt_message_root, Global.MQTT_DATA)
@@ -0,0 +1,127 @@
+#!/usr/bin/python3
+# heartbeat.py
+"""
+
+    Heartbeat - per process liveness slots in shared memory
+
+    Each process stamps its slot with a monotonic time and loop count every
+    time around its main loop.  The supervisor reads the slots to find
+    processes that are still alive but no longer making progress.
+
+The MIT License (MIT)
+
+Copyright 2023 richard p hughes
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+and associated documentation files (the "Software"), to deal in the Software without restriction,
+including without limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom the Software
+is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies
+or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+
+import atexit
+import faulthandler
+import os
+import signal
+import struct
+import time
+from multiprocessing import shared_memory
+
+# max processes watched at one time
+MAX_SLOTS = 32
+
+# slot: monotonic time of last beat (0 == not started), loop count
+SLOT = struct.Struct("dQ")
+
+# signal that makes a process dump the stacks of all of its threads
+STACK_DUMP_SIGNAL = getattr(signal, "SIGUSR1", None)
+
+
+class Heartbeat(object):
+    """ shared memory array of heartbeat slots """
+
+    def __init__(self, slot_count=MAX_SLOTS):
+        self.slot_count = slot_count
+        self.memory = shared_memory.SharedMemory(create=True,
+                                                 size=slot_count * SLOT.size)
+        self.memory.buf[:slot_count * SLOT.size] = \
+            bytes(slot_count * SLOT.size)
+        # slot -> name of process using it, kept in supervisor
+        self.slots = {}
+        self.owner = True
+        atexit.register(self.close)
+
+    def __repr__(self):
+        # return "%s(%r)" % (self.__class__, self.__dict__)
+        fdict = repr(self.__dict__)
+        return f"{self.__class__}({fdict})"
+
+    def __getstate__(self):
+        return {"slot_count": self.slot_count, "name": self.memory.name,
+                "slots": self.slots}
+
+    def __setstate__(self, state):
+        self.slot_count = state["slot_count"]
+        self.memory = shared_memory.SharedMemory(name=state["name"])
+        self.slots = state["slots"]
+        self.owner = False
+
+    def allocate_slot(self, name):
+        """ reserve a cleared slot for a process, None if all in use """
+        for slot in range(self.slot_count):
+            if slot not in self.slots:
+                self.slots[slot] = name
+                SLOT.pack_into(self.memory.buf, slot * SLOT.size, 0.0, 0)
+                return slot
+        return None
+
+    def free_slot(self, slot):
+        """ release a slot of a process that has exited """
+        if slot is not None:
+            self.slots.pop(slot, None)
+
+    def free_all_slots(self):
+        """ release all slots """
+        self.slots = {}
+
+    def beat(self, slot, loop_count):
+        """ stamp a slot with the current time """
+        SLOT.pack_into(self.memory.buf, slot * SLOT.size,
+                       time.monotonic(), loop_count)
+
+    def read(self, slot):
+        """ (time of last beat, loop count) of a slot """
+        return SLOT.unpack_from(self.memory.buf, slot * SLOT.size)
+
+    def close(self):
+        """ detach from shared memory, remove it if we created it """
+        if self.memory is not None:
+            self.memory.close()
+            if self.owner:
+                self.memory.unlink()
+            self.memory = None
+
+
+def enable_stack_dump():
+    """ dump stacks of all threads to stderr when signaled """
+    if STACK_DUMP_SIGNAL is not None:
+        faulthandler.register(STACK_DUMP_SIGNAL, all_threads=True)
+
+
+def request_stack_dump(pid):
+    """ ask a process to dump its stacks, see enable_stack_dump """
+    if STACK_DUMP_SIGNAL is not None and pid is not None:
+        try:
+            os.kill(pid, STACK_DUMP_SIGNAL)
+        except OSError:
+            pass
@@ -114,7 +114,8 @@ class AppProcess(BaseMqttProcess):
         self.log_critical(
             "Shutdown Request received, shutting down, waiting for other apps to terminate ..."
         )
-        time.sleep(30)
+        # beat while waiting, the watchdog would restart a silent process
+        self.sleep_with_heartbeat(30)
         self.log_critical("Shutdown computer ...")
         call(self.shutdown_command, shell=True)
         # call super method to do default processing
@@ -126,7 +127,8 @@ class AppProcess(BaseMqttProcess):
         self.log_critical(
             "Reboot Request received, rebooting, waiting for other apps to terminate ..."
         )
-        time.sleep(30)
+        # beat while waiting, the watchdog would restart a silent process
+        self.sleep_with_heartbeat(30)
         self.log_critical("Rebooting computer ...")
         call(self.reboot_command, shell=True)
         # call super method to do default processing
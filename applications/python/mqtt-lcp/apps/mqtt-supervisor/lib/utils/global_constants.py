@@ -47,10 +47,12 @@ class Global(object):
     APPROACH = "approach"
     AUTO_SIGNALS = "auto-signals"
     AVAILABLE = "available"
+    BATCH_TIME = "batch-time"
     BAUDRATE = "baudrate"
     BACKUP = "backup"
     BACKUP_PATH = "backup-path"
     BELL = "bell"
+    BINARY = "binary"
     BLANK = "blank"
     BLINK = "blink"
     BLOCK = "block"
@@ -79,6 +81,7 @@ class Global(object):
     CLOSE = "close"
     CLOSED = "closed"
     CMD = "cmd"
+    COALESCE_TIME = "coalesce-time"
     COL = "col"
     COLS = "cols"
     COLOR = "color"
@@ -126,6 +129,8 @@ class Global(object):
     DESIRED = "desired"
     DOWN = "down"
     DRIVER = "driver"
+    DROP_NEWEST = "drop-newest"
+    DROP_OLDEST = "drop-oldest"
     DUPLEX = "duplex"
     EAST = "east"
     ECHO = "echo"
@@ -147,6 +152,8 @@ class Global(object):
     FASTCLOCK = "fastclock"
     FILE = "file"
     FLASHER = "flasher"
+    FLIGHT_RECORDER = "flight-recorder"
+    FLUSH_TIME = "flush-time"
     FORCE = "force"
     FULL = "full"
     FORWARD = "forward"
@@ -157,6 +164,7 @@ class Global(object):
     GROUP = "group"
     GROUPS = "groups"
     HEAD = "head"
+    HEARTBEAT = "heartbeat"
     HEX = "hex"
     HIGH = "high"
     HOME = "home"
@@ -170,6 +178,8 @@ class Global(object):
     IDS = "ids"
     INFO = "info"
     INFO_COMMAND = "info-command"
+    INGRESS_QUEUE_SIZE = "ingress-queue-size"
+    INGRESS_REQUEST_POLICY = "ingress-request-policy"
     INCONSISTENT = "inconsistent"
     INTERVAL = "interval"
     IO = "io"
@@ -201,6 +211,7 @@ class Global(object):
     INVENTORY = "inventory"
     IO_DEVICES = "io-devices"
     ITEMS = "items"
+    JSON = "json"
     KEY = "key"
     KEYBOARD = "keyboard"
     KEYPAD = "keypad"
@@ -230,8 +241,12 @@ class Global(object):
     MEDIUM = "medium"
     MENU = "menu"
     MESSAGE = "message"
+    MESSAGE_BLOCK = "message-block"
     MESSAGES = "messages"
     METADATA = "metadata"
+    METRICS = "metrics"
+    METRICS_PATH = "metrics-path"
+    METRICS_TIME = "metrics-time"
     MIN = "min"
     MINUTES = "minutes"
     MODE = "mode"
@@ -258,6 +273,7 @@ class Global(object):
     OPEN = "open"
     OPENED = "opened"
     OPTIONS = "options"
+    OTHER_INTERVAL = "other-interval"
     OTHER_TOPICS = "other-topics"
     PACKET = "packet"
     PAGE = "page"
@@ -269,6 +285,7 @@ class Global(object):
     PATHS = "paths"
     PAUSE = "pause"
     PAUSED = "paused"
+    PAYLOAD_CODECS = "payload-codecs"
     PING = "ping"
     PING_TIME = "ping-time"
     PIPE = "pipe"
@@ -295,6 +312,7 @@ class Global(object):
     REBOOT = "reboot"
     REBOOT_COMMAND = "reboot-command"
     RECEIVED = "rcv"
+    RECORD_PATH = "record-path"
     RED = "red"
     REFRESH = "refresh"
     REGISTRY = "registry"
@@ -305,11 +323,13 @@ class Global(object):
     REPORT = "report"
     REPORTED = "reported"
     REQUEST = "request"
+    REQUEST_ID = "request-id"
     REQ = "req"
     RES = "res"
     RESPOND_TO = "respond-to"
     RESET = "reset"
     RESPONSE = "response"
+    RESPONSE_PREFIXES = "response-prefixes"
     RESPONSE_QUEUE = "response_queue"
     RESTART = "restart"
     REVERSE = "reverse"
@@ -424,6 +444,8 @@ class Global(object):
     WARNING = "warning"
     WARRANT = "warrant"
     WARRANTS = "warrants"
+    WATCHDOG_RESTART_TIME = "watchdog-restart-time"
+    WATCHDOG_STALL_TIME = "watchdog-stall-time"
     WEST = "west"
     WHITE = "white"
     WIFI = "wifi"
@@ -439,6 +461,7 @@ class Global(object):
 
     MQTT_PUBLISH_JSON = "publish-json"
     MQTT_PUBLISH_IODATA = "publish-iodata"
+    MQTT_PUBLISH_COALESCED = "publish-coalesced"
     MQTT_SUBSCRIBE = "subscribe"
     MQTT_UNSUBSCRIBE = "unsubscribe"
     MQTT_OTHER = "mqtt-other"
@@ -572,17 +595,23 @@ class Global(object):
     def __init__(self):
         pass
 
+    # reversed list is built once, see generate_reversed_list
+    _reversed_list = None
+
     @classmethod
     def generate_reversed_list(cls):
-        """ generate a dictionary of Global values with value as the key """
-        global_consts = Global()
-        attributes = dir(global_consts)
-        reversed_consts = {}
-        for _i, value in enumerate(attributes):
-            # print(type(value))
-            if (isinstance(value, str) and not value.startswith("_")):
-                attr_value = getattr(global_consts, value)
-                if isinstance(attr_value, str):
-                    # print(" ... "+str(type(attr_value)))
-                    reversed_consts.update({attr_value: value})
-        return reversed_consts
+        """ generate a dictionary of Global values with value as the key,
+            a new copy of a dictionary built the first time it is asked for """
+        if cls._reversed_list is None:
+            global_consts = Global()
+            attributes = dir(global_consts)
+            reversed_consts = {}
+            for _i, value in enumerate(attributes):
+                # print(type(value))
+                if (isinstance(value, str) and not value.startswith("_")):
+                    attr_value = getattr(global_consts, value)
+                    if isinstance(attr_value, str):
+                        # print(" ... "+str(type(attr_value)))
+                        reversed_consts.update({attr_value: value})
+            cls._reversed_list = reversed_consts
+        return dict(cls._reversed_list)
@@ -76,6 +76,7 @@ class GuiMessage(object):
         self.reported = None
         self.respond_to = None
         self.response_queue = None
+        self.request_id = None
 
     def __repr__(self):
         # return "%s(%r)" % (self.__class__, self.__dict__)
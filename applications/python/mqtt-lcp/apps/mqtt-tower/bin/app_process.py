@@ -209,7 +209,7 @@ class AppProcess(BaseMqttProcess):
         body.mqtt_desired = desired
         # response not needed, will monitor "dt" sensor message
         body.mqtt_respond_to = None
-        body.mqtt_session = "REQ:" + str(now)
+        body.mqtt_session_id = "REQ:" + str(now)
         body.mqtt_version = "1.0"
         body.mqtt_timestamp = now
         self.publish_request_message(
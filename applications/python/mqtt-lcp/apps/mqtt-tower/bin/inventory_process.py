@@ -171,7 +171,7 @@ class InventoryProcess(BaseProcess):
         """ process request a device change message """
         new_message = IoData()
         new_message.mqtt_message_root = group
-        new_message.node_id = node
+        new_message.mqtt_node_id = node
         new_message.mqtt_port_id = port
         new_message.mqtt_desired = desired
         # set responsd_to topic to none, don't care about response
@@ -26,17 +26,19 @@ OUT OFSOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 """
 import traceback
-import locale
+import heapq
+import os
 import time
-import os.path
-from multiprocessing import Process
+from collections import deque
+from multiprocessing import Process, Event
+from queue import Empty
 import sys
 
 sys.path.append('../../lib')
 
-from utils.utility import Utility
-from utils.json_utils import JsonUtils
-from utils.yaml_utils import YamlUtils
+from utils.config_utils import ConfigUtils
+from utils.metrics import Metrics
+from utils.heartbeat import enable_stack_dump
 from utils.global_constants import Global
 from structs.io_config import IoConfig
 
@@ -44,6 +46,25 @@ from structs.io_config import IoConfig
 INACTIVE_LOOP_WAIT = 0.025
 # INACTIVE_LOOP_WAIT = 1
 MAX_MESSAGE_BLOCK = 5
+# default milliseconds between calls to process_other
+PROCESS_OTHER_INTERVAL = 100
+# default milliseconds log messages are held before being sent to logger
+# 0 == send each message as it is logged
+LOG_BATCH_TIME = 0
+# default number of recent debug records kept below the log level,
+# sent to the logger when an error is logged, 0 == none kept,
+# set flight-recorder in logger config to turn it on
+FLIGHT_RECORDER_SIZE = 0
+# default seconds between metrics exports, 0 == not exported,
+# set metrics-time in options to turn it on
+METRICS_TIME = 0
+# handler latency is measured for one in this many messages,
+# keeps the cost of timing well under the cost of handling messages
+HANDLER_SAMPLE_INTERVAL = 16
+# handler latency message type of messages that are lists of records
+HANDLER_BATCH_TYPE = "batch"
+# seconds between heartbeats while a process waits outside its main loop
+HEARTBEAT_WAIT_INTERVAL = 0.5
 
 
 class SendAfterMessage(object):
@@ -54,7 +75,7 @@ class SendAfterMessage(object):
         self.topic = topic
         self.message_body = message_body
         self.send_after = send_after  # delay in milliseconds
-        self.expires = 0
+        self.expires = 0  # monotonic milliseconds
 
     def __repr__(self):
         # return "%s(%r)" % (self.__class__, self.__dict__)
@@ -87,8 +108,54 @@ class BaseProcess(Process):
         # store at this level so all process can see it
         self.log_level = Global.LOG_LEVEL_INFO
         self.is_logging_debug = False
-        self.send_after_message_queue = {}
+        self.log_batch_time = LOG_BATCH_TIME
+        self.log_batch = []
+        self.log_batch_started = 0
+        # recent debug records not logged because of log level
+        self.flight_recorder = None
+        # pending send after messages, heap of (expires, key, message)
+        self.send_after_timers = []
+        # key -> message for timers not yet fired or cancelled
+        self.send_after_pending = {}
+        self.send_after_next_key = 0
+        # process_other is called at least this often, messages or not
+        self.process_other_interval = PROCESS_OTHER_INTERVAL
+        self.process_other_due = 0
+        # max messages to process in a row, allows other processing
+        # to happen even if messages are waiting to be processed
+        self.max_message_block = MAX_MESSAGE_BLOCK
+        # starvation counters
+        self.message_block_full_count = 0
+        self.process_other_late_count = 0
+        self.messages_processed_count = 0
+        # runtime metrics, handler latency is kept per message type
+        self.metrics = Metrics(self.name)
+        self.handler_latency = {}
+        self.handler_sample_countdown = HANDLER_SAMPLE_INTERVAL
+        # metrics are exported every metrics time seconds, published by
+        # the application process and written to a prometheus textfile
+        # in metrics path if set
+        self.metrics_time = METRICS_TIME
+        self.metrics_path = None
+        self.metrics_export_due = 0
+        # set once initialize_process has completed, used by supervisor
+        # to start dependent processes as soon as this one is ready
+        self.launch_time = time.monotonic()
+        self.ready_event = Event()
+        if self.events is not None:
+            self.events[Global.READY + ":" + str(self.name)] = self.ready_event
+        # main loop stamps a shared memory slot so the supervisor
+        # can tell a process that is alive but stuck
+        self.heartbeat = None
+        self.heartbeat_slot = None
+        self.loop_count = 0
+        if self.events is not None and Global.HEARTBEAT in self.events:
+            self.heartbeat = self.events[Global.HEARTBEAT]
+            self.heartbeat_slot = self.heartbeat.allocate_slot(self.name)
         self.__load_config_file()
+        self.__parse_log_config()
+        self.__parse_loop_config()
+        self.__parse_metrics_config()
         self.__load_host_name()
         self.__parse_node_name()
         self.io_config = IoConfig(self.config, self.log_queue)
@@ -103,49 +170,50 @@ class BaseProcess(Process):
         """ loop reading input from queue """
         # print(">>> run: " + str(self.name))
         try:
+            enable_stack_dump()
             self.initialize_process()
-            # max messages to process in a row
-            # alows other processing to happen
-            # even if a messages are waiting to be processed
+            self.ready_event.set()
+            self.process_other_due = self.__now_monotonic_milliseconds()
+            self.metrics_export_due = self.process_other_due + \
+                self.metrics_time * 1000
             while not self.events[Global.SHUTDOWN].is_set():
-                new_message = None
-                try:
-                    new_message = self.in_queue.get(True, 0.1)  # was 0.03
-                    #if self.in_queue.empty():
-                    #    time.speep(0.01)
-                    #else:
-                    #    new_message = self.in_queue.get()
-                except Exception as _error:
-                    # ignore exception from timeout on get
-                    pass
-                if new_message is not None:
-                    # print(">>> queue " + str(self.name) + ": " + str(new_message))
-                    if not self.preprocess_message(new_message):
-                        self.process_message(new_message)
-                else:
+                self.beat_heartbeat()
+                # wait for a message, but no longer than the next
+                # timer or process_other deadline
+                messages_processed = self.__process_message_block(
+                    self.__time_to_deadline())
+                now = self.__now_monotonic_milliseconds()
+                if now >= self.process_other_due:
+                    if now - self.process_other_due > self.process_other_interval:
+                        # process_other ran more than an interval late
+                        self.process_other_late_count += 1
                     self.process_other()
-                    self.__process_send_after_messages()
+                    self.process_other_due = now + self.process_other_interval
+                    self.__sample_metrics()
+                    if self.metrics_time > 0 and \
+                            now >= self.metrics_export_due:
+                        self.metrics_export_due = now + self.metrics_time * 1000
+                        self.export_metrics()
+                self.__process_send_after_messages()
+                if self.log_batch and (messages_processed == 0 or \
+                        now - self.log_batch_started >= self.log_batch_time):
+                    self.flush_log_messages()
 
             # print(">>> shutdown from base: " + str(self.name))
             self.shutdown_process()
+            self.flush_log_messages()
         except Exception as exc:
             print("!!! Exception: " + str(exc))
             traceback.print_exc()
+            self.__dump_flight_recorder()
+            self.flush_log_messages()
 
     def initialize_process(self):
         """ initialize the process
         --- override in derived class """
         print("base init start: [ " + str(self.node_name) + " ] ... [ " +
               str(self.name) + " ]")
-        if Global.CONFIG in self.config:
-            if Global.LOGGER in self.config[Global.CONFIG]:
-                log_level = self.config[Global.CONFIG][Global.LOGGER].get(
-                    Global.LEVEL, None)
-        self.log_level = self.__set_log_level(log_level)
-        #print(">>> log level:"+str(self.log_level))
-        if self.log_level == Global.LOG_LEVEL_DEBUG:
-            self.is_logging_debug = True
-        #print(">>> log level:"+str(self.is_logging_debug))
+        self.__parse_log_config()
 
     def preprocess_message(self, _new_message):
         """ preprocess message before normal process.
@@ -167,58 +235,114 @@ class BaseProcess(Process):
         --- override in derived class """
         pass
 
+    def export_metrics(self):
+        """ publish a snapshot of process metrics,
+            also write them to a prometheus textfile if configured """
+        if self.metrics_path is not None:
+            file_path = os.path.join(
+                self.metrics_path,
+                str(self.node_name) + "-" + str(self.name) + ".prom")
+            try:
+                self.metrics.write_prometheus_file(
+                    file_path, {"node": self.node_name})
+            except Exception as exc:
+                self.log_warning("metrics file not written: " +
+                                 str(file_path) + ": " + str(exc))
+        self.publish_metrics(self.name, self.metrics.snapshot())
+
+    def publish_metrics(self, process_name, snapshot):
+        """ publish a metrics snapshot of a process, sent to the application
+            process to be published
+        --- override in derived class that can publish """
+        if self.app_queue is not None:
+            self.app_queue.put((Global.METRICS, {Global.NAME: process_name,
+                                                 Global.METRICS: snapshot}))
+
     def send_after(self, send_after_message):
-        """ queue message to be send after a delay """
+        """ queue message to be send after a delay,
+            returns a key that can be used to cancel the message """
         # print(">>> send after: "+str(topic)+" ... "+str(send_after))
-        key = Utility.now_milliseconds()
-        loop = 10
-        while loop > 0:
-            if key in self.send_after_message_queue:
-                # key already in use, try again
-                key += 1
-                loop -= 1
-            else:
-                # print(">>> add to send after queue: " +
-                #     str(send_after_message.topic))
-                send_after_message.key = key
-                send_after_message.expires = Utility.now_milliseconds(
-                ) + send_after_message.send_after
-                self.send_after_message_queue[key] = send_after_message
+        self.send_after_next_key += 1
+        key = self.send_after_next_key
+        send_after_message.key = key
+        send_after_message.expires = self.__now_monotonic_milliseconds() + \
+            send_after_message.send_after
+        self.send_after_pending[key] = send_after_message
+        heapq.heappush(self.send_after_timers,
+                       (send_after_message.expires, key, send_after_message))
+        return key
+
+    def cancel_send_after(self, key):
+        """ cancel a pending send after message,
+            returns True if the message had not yet been sent """
+        cancelled = self.send_after_pending.pop(key, None) is not None
+        if cancelled and \
+                len(self.send_after_timers) > 2 * len(self.send_after_pending) + 64:
+            # too many cancelled entries left in heap, compact it
+            self.send_after_timers = [
+                timer for timer in self.send_after_timers
+                if timer[1] in self.send_after_pending
+            ]
+            heapq.heapify(self.send_after_timers)
+        return cancelled
+
+    def beat_heartbeat(self):
+        """ tell the supervisor this process is alive, see sleep_with_heartbeat """
+        if self.heartbeat_slot is not None:
+            self.loop_count += 1
+            self.heartbeat.beat(self.heartbeat_slot, self.loop_count)
+
+    def sleep_with_heartbeat(self, seconds):
+        """ sleep, beating the heartbeat so a long wait is not
+            taken as a stalled process by the supervisor """
+        expires = time.monotonic() + seconds
+        while True:
+            self.beat_heartbeat()
+            time_left = expires - time.monotonic()
+            if time_left <= 0:
                 break
-        if loop == 0:
-            # could not add message to queue
-            self.log_error("Error: can not add send after message to queue: " +
-                           str(send_after_message.topic))
-
-    def log_debug(self, message=None):
+            time.sleep(min(time_left, HEARTBEAT_WAIT_INTERVAL))
+
+    def get_with_heartbeat(self, from_queue, timeout):
+        """ get a message from a queue, beating the heartbeat while waiting,
+            raises queue.Empty if none arrives within timeout seconds """
+        expires = time.monotonic() + timeout
+        while True:
+            self.beat_heartbeat()
+            time_left = expires - time.monotonic()
+            try:
+                return from_queue.get(
+                    True, max(0, min(time_left, HEARTBEAT_WAIT_INTERVAL)))
+            except Empty:
+                if time_left <= HEARTBEAT_WAIT_INTERVAL:
+                    raise
+
+    def log_debug(self, message=None, *args):
         """ log a debug message """
-        if self.log_queue is not None:
-            self.log_queue.put(
-                (Global.LOG_LEVEL_DEBUG, self.name + ": " + message))
+        self.__log_message(Global.LOG_LEVEL_DEBUG, message, args)
 
-    def log_info(self, message=None):
+    def log_info(self, message=None, *args):
         """ log an info message """
-        if self.log_queue is not None:
-            self.log_queue.put(
-                (Global.LOG_LEVEL_INFO, self.name + ": " + message))
+        self.__log_message(Global.LOG_LEVEL_INFO, message, args)
 
-    def log_warning(self, message=None):
+    def log_warning(self, message=None, *args):
         """ log an warn message """
-        if self.log_queue is not None:
-            self.log_queue.put(
-                (Global.LOG_LEVEL_WARNING, self.name + ": " + message))
+        self.__log_message(Global.LOG_LEVEL_WARNING, message, args)
 
-    def log_error(self, message=None):
+    def log_error(self, message=None, *args):
         """ log an error message """
-        if self.log_queue is not None:
-            self.log_queue.put(
-                (Global.LOG_LEVEL_ERROR, self.name + ": " + message))
+        self.__log_message(Global.LOG_LEVEL_ERROR, message, args)
 
-    def log_critical(self, message=None):
+    def log_critical(self, message=None, *args):
         """ log an critical message """
-        if self.log_queue is not None:
-            self.log_queue.put(
-                (Global.LOG_LEVEL_CRITICAL, self.name + ": " + message))
+        self.__log_message(Global.LOG_LEVEL_CRITICAL, message, args)
+
+    def flush_log_messages(self):
+        """ send any held log messages to the logger as a list """
+        if self.log_batch:
+            if self.log_queue is not None:
+                self.log_queue.put(self.log_batch)
+            self.log_batch = []
 
     def log_unexpected_message(self, msg_body=None):
         """ log an unexpected message """
@@ -232,70 +356,164 @@ class BaseProcess(Process):
     # private functions
     #
 
+    def __log_message(self, level, message, args):
+        """ format and send a log message if it passes the log level,
+            message is formatted with "%" and args only if it will be logged,
+            messages below the log level are kept in the flight recorder """
+        if self.log_queue is None:
+            return
+        if level < self.log_level:
+            if self.flight_recorder is not None:
+                # rendered now, args may change before the record is dumped
+                self.flight_recorder.append(
+                    (time.time(), level, self.__render_log_message(message, args)))
+            return
+        if level >= Global.LOG_LEVEL_ERROR:
+            self.__dump_flight_recorder()
+        log_record = (level, self.__render_log_message(message, args))
+        if self.log_batch_time <= 0:
+            self.log_queue.put(log_record)
+        else:
+            now = time.monotonic() * 1000
+            if not self.log_batch:
+                self.log_batch_started = now
+            self.log_batch.append(log_record)
+            if level >= Global.LOG_LEVEL_ERROR or \
+                    now - self.log_batch_started >= self.log_batch_time:
+                self.flush_log_messages()
+
+    def __dump_flight_recorder(self):
+        """ send recent unlogged records to the logger, they are
+            written to the log file whatever its level """
+        if self.flight_recorder and self.log_queue is not None:
+            records = list(self.flight_recorder)
+            self.flight_recorder.clear()
+            # keep held records ahead of the error that caused the dump
+            self.flush_log_messages()
+            self.log_queue.put((Global.FLIGHT_RECORDER, records))
+
+    def __render_log_message(self, message, args):
+        """ log message text with its args, as it would have been logged """
+        try:
+            if args:
+                message = message % args
+        except (TypeError, ValueError):
+            message = str(message) + " " + str(args)
+        return self.name + ": " + str(message)
+
     def __reverse_globals(self):
         return Global.generate_reversed_list()
 
     def __process_send_after_messages(self):
         """ process expired send after message to message queue """
-        # check to see if send after  queue has any messages in it
-        now = Utility.now_milliseconds()
-        if self.send_after_message_queue:
-            message_keys = list(self.send_after_message_queue.keys())
-            for key in message_keys:
-                send_after_message = self.send_after_message_queue[key]
-                if send_after_message.expires < now:
-                    # print(">>> process send after:" +
-                    #      str(send_after_message.topic))
-                    # message wait time has expired, post it to message queue
-                    self.in_queue.put((send_after_message.topic,
-                                       send_after_message.message_body))
-                    # clean up, remove message from send_after queue
-                    del self.send_after_message_queue[key]
+        # timers are kept in a heap, only expired timers are looked at
+        now = self.__now_monotonic_milliseconds()
+        timers = self.send_after_timers
+        while timers and timers[0][0] <= now:
+            (_expires, key, send_after_message) = heapq.heappop(timers)
+            if self.send_after_pending.pop(key, None) is not None:
+                # print(">>> process send after:" +
+                #      str(send_after_message.topic))
+                # message wait time has expired, post it to message queue
+                self.in_queue.put((send_after_message.topic,
+                                   send_after_message.message_body))
+
+    def __process_message_block(self, wait_time):
+        """ process up to max_message_block messages from the in queue,
+            waits up to wait_time seconds for the first message,
+            returns count of messages processed """
+        messages_processed = 0
+        block = True
+        while messages_processed < self.max_message_block:
+            new_message = None
+            try:
+                new_message = self.in_queue.get(block, wait_time)
+            except Exception as _error:
+                # ignore exception from timeout on get
+                pass
+            if new_message is None:
+                break
+            # print(">>> queue " + str(self.name) + ": " + str(new_message))
+            self.handler_sample_countdown -= 1
+            if self.handler_sample_countdown > 0:
+                if not self.preprocess_message(new_message):
+                    self.process_message(new_message)
+            else:
+                self.handler_sample_countdown = HANDLER_SAMPLE_INTERVAL
+                started = time.perf_counter_ns()
+                if not self.preprocess_message(new_message):
+                    self.process_message(new_message)
+                self.__record_handler_latency(
+                    new_message[0], time.perf_counter_ns() - started)
+            messages_processed += 1
+            # don't wait for any more messages in this block
+            block = False
+            if self.__now_monotonic_milliseconds() >= self.process_other_due:
+                break
+        if messages_processed >= self.max_message_block:
+            self.message_block_full_count += 1
+        self.messages_processed_count += messages_processed
+        return messages_processed
+
+    def __record_handler_latency(self, msg_type, elapsed_ns):
+        """ record time spent handling a sampled message, in microseconds """
+        if not isinstance(msg_type, str):
+            # batched messages, a list of records, not (type, body)
+            msg_type = HANDLER_BATCH_TYPE
+        histogram = self.handler_latency.get(msg_type, None)
+        if histogram is None:
+            histogram = self.metrics.histogram("handler-latency-us:" +
+                                               str(msg_type))
+            self.handler_latency[msg_type] = histogram
+        histogram.record(elapsed_ns // 1000)
+
+    def __sample_metrics(self):
+        """ sample queue depth and timer backlog """
+        metrics = self.metrics
+        try:
+            metrics.gauge("in-queue-depth").set(self.in_queue.qsize())
+        except NotImplementedError:
+            # qsize is not available on all platforms
+            pass
+        metrics.gauge("send-after-backlog").set(len(self.send_after_pending))
+        metrics.counter("messages-processed").value = \
+            self.messages_processed_count
+        metrics.counter("message-block-full").value = \
+            self.message_block_full_count
+        metrics.counter("process-other-late").value = \
+            self.process_other_late_count
+
+    def __time_to_deadline(self):
+        """ seconds until the next timer, process_other or log flush is due """
+        deadline = self.process_other_due
+        if self.send_after_timers and self.send_after_timers[0][0] < deadline:
+            deadline = self.send_after_timers[0][0]
+        if self.log_batch:
+            log_deadline = self.log_batch_started + self.log_batch_time
+            if log_deadline < deadline:
+                deadline = log_deadline
+        wait_time = (deadline - self.__now_monotonic_milliseconds()) / 1000
+        return min(max(wait_time, 0), self.process_other_interval / 1000)
+
+    def __now_monotonic_milliseconds(self):
+        """ milliseconds from a clock that is not affected by time changes """
+        return time.monotonic() * 1000
 
     def __load_config_file(self):
         """ load  configuration file """
-        config_root = "."
-        if os.path.exists("configure"):
-            config_root = "configure"
-        if os.path.exists(os.path.join(config_root, 'config.yaml')):
-            self.__load_yaml_config_file(file=os.path.join(config_root, "config.yaml"))
-        elif os.path.exists(os.path.join(config_root,'config.yml')):
-            self.__load_yaml_config_file(file=os.path.join(config_root,"config.yml"))
-        else:
-            self.__load_json_config_file(config_root)
-        #  print(">>> config: "+str(self.config))
-
-    def __load_yaml_config_file(self, file="config.yaml"):
-        """ load config.yaml configuration file """
-        config = None
-        yaml_helper = YamlUtils()
-        try:
-            config = yaml_helper.load_and_parse_file(file)
-        except Exception as exc:
-            message = "Exception during YAML parsing, exiting: " \
-                + str(exc) + "\n" + str("config.yaml")
-            print(message)
-            self.log_critical(message)
-            # wait a few seconds to error to be logged
-            time.sleep(2)
-            self.events[Global.SHUTDOWN].set()
-        self.config = config
-
-    def __load_json_config_file(self, file="config.json"):
-        """ load config.json configuration file """
         config = None
-        json_helper = JsonUtils()
         try:
-            config = json_helper.load_and_parse_file(file)
+            config = ConfigUtils.load_config()
         except Exception as exc:
-            message = "Exception during JSON parsing, exiting: "\
-                + str(exc) + "\n" + str(file)
+            message = "Exception during config parsing, exiting: " \
+                + str(exc)
             print(message)
             self.log_critical(message)
             # wait a few seconds to error to be logged
             time.sleep(2)
             self.events[Global.SHUTDOWN].set()
         self.config = config
+        #  print(">>> config: "+str(self.config))
 
     def __parse_node_name(self):
         """ parse node_name from config data """
@@ -314,12 +532,47 @@ class BaseProcess(Process):
 
     def __load_host_name(self):
         """ load unix host name """
-        response = None
-        with open('/etc/hostname',
-                  encoding=locale.getpreferredencoding(False)) as f:
-            response = (f.readlines()[0]).strip()
-            # print(str(response))
-            self.host_name = response
+        self.host_name = ConfigUtils.load_host_name()
+
+    def __parse_log_config(self):
+        """ parse log level and batch time from config data """
+        log_level = None
+        flight_recorder_size = FLIGHT_RECORDER_SIZE
+        if self.config is not None and Global.CONFIG in self.config:
+            if Global.LOGGER in self.config[Global.CONFIG]:
+                log_level = self.config[Global.CONFIG][Global.LOGGER].get(
+                    Global.LEVEL, None)
+                self.log_batch_time = self.config[Global.CONFIG][
+                    Global.LOGGER].get(Global.BATCH_TIME, LOG_BATCH_TIME)
+                flight_recorder_size = self.config[Global.CONFIG][
+                    Global.LOGGER].get(Global.FLIGHT_RECORDER, FLIGHT_RECORDER_SIZE)
+        self.log_level = self.__set_log_level(log_level)
+        self.flight_recorder = None
+        if flight_recorder_size > 0:
+            self.flight_recorder = deque(maxlen=flight_recorder_size)
+        #print(">>> log level:"+str(self.log_level))
+        self.is_logging_debug = self.log_level == Global.LOG_LEVEL_DEBUG
+        #print(">>> log level:"+str(self.is_logging_debug))
+
+    def __parse_loop_config(self):
+        """ parse message block size and process_other interval from config data """
+        if self.config is not None and Global.CONFIG in self.config:
+            options = self.config[Global.CONFIG].get(Global.OPTIONS, None)
+            if isinstance(options, dict):
+                self.max_message_block = max(1, options.get(
+                    Global.MESSAGE_BLOCK, self.max_message_block))
+                self.process_other_interval = options.get(
+                    Global.OTHER_INTERVAL, self.process_other_interval)
+
+    def __parse_metrics_config(self):
+        """ parse metrics export time and textfile path from config data """
+        if self.config is not None and Global.CONFIG in self.config:
+            options = self.config[Global.CONFIG].get(Global.OPTIONS, None)
+            if isinstance(options, dict):
+                self.metrics_time = options.get(Global.METRICS_TIME,
+                                                self.metrics_time)
+                self.metrics_path = options.get(Global.METRICS_PATH,
+                                                self.metrics_path)
 
     def __set_log_level(self, level):
         """ set log level """
@@ -30,7 +30,9 @@ import sys
 sys.path.append('../../lib')
 
 import time
-from random import randrange
+import threading
+from collections import OrderedDict, deque
+from random import randrange, uniform
 
 import json
 
@@ -56,11 +58,40 @@ MQTT_ERR_UNKNOWN = 13
 MQTT_ERR_ERRNO = 14
 MQTT_ERR_QUEUE_SIZE = 15
 
+# seconds to wait for the initial connection to the broker
+CONNECT_TIMEOUT = 20
+# seconds between reconnect attempts, doubled after each failure
+RECONNECT_MIN_DELAY = 1
+RECONNECT_MAX_DELAY = 60
+# max messages held while not connected to broker
+OFFLINE_BUFFER_SIZE = 1000
+# max messages waiting in the application queue, beyond this:
+#   "dt/" messages are held, only the latest per topic is kept
+#   other messages wait briefly for room, then are held in order,
+#   shutdown and reboot requests never wait
+INGRESS_QUEUE_SIZE = 1000
+# max "dt/" messages held, the oldest is dropped when full
+INGRESS_DATA_SIZE = 1000
+# max other messages held, dropped by the ingress request policy when full
+INGRESS_REQUEST_SIZE = 1000
+# max seconds a received message waits for room in the application queue,
+# the wait holds up the paho network thread, keep it well below keepalive
+INGRESS_BLOCK_TIME = 0.05
+# seconds between checks for room while waiting
+INGRESS_BLOCK_INTERVAL = 0.005
+# seconds between reports of held or dropped received messages
+INGRESS_REPORT_TIME = 10
+# seconds between flushes of recorded mqtt traffic to disk
+RECORD_FLUSH_TIME = 5
+
 from structs.io_data import IoData
 from structs.mqtt_config import MqttConfig
 from utils.global_constants import Global
+from utils.mqtt_recorder import MqttRecorder, DIRECTION_IN, DIRECTION_OUT
+from utils.payload_codecs import PayloadCodecs
 
 from processes.base_process import BaseProcess
+from processes.base_process import SendAfterMessage
 
 
 class MqttProcess(BaseProcess):
@@ -77,7 +108,32 @@ class MqttProcess(BaseProcess):
         self.alt_mqtt_client_name = None
         self.mqtt_client = None
         self.connected = False
+        self.connected_event = threading.Event()
         self.mqtt_config = None
+        # topics subscribed to, resubscribed after a reconnect
+        self.subscribed_topics = {}
+        # messages published while not connected, sent after reconnect
+        # "dt/" topics are keyed by topic so only the last value is kept
+        self.offline_messages = {}
+        self.offline_message_count = 0
+        # "dt/" messages held during coalesce time, keyed by topic
+        self.coalesced_messages = {}
+        self.coalesced_count = 0
+        self.sent_count = 0
+        # received "dt/" messages waiting for room in application queue,
+        # shared by paho network thread and process thread
+        self.ingress_queue_size = INGRESS_QUEUE_SIZE
+        self.ingress_data = OrderedDict()
+        # received other messages waiting for room, in order received
+        self.ingress_requests = deque()
+        self.ingress_request_policy = Global.DROP_OLDEST
+        self.ingress_lock = threading.Lock()
+        self.ingress_reported = 0
+        self.ingress_report_due = 0
+        self.recorder = None
+        self.recorder_flush_due = 0
+        # encode published messages by topic, decode json or binary
+        self.payload_codecs = PayloadCodecs()
 
     def __repr__(self):
         # return "%s(%r)" % (self.__class__, self.__dict__)
@@ -92,21 +148,24 @@ class MqttProcess(BaseProcess):
     def shutdown_process(self):
         """ shutdown the process """
         self.__shutdown_mqtt_client()
+        if self.recorder is not None:
+            self.recorder.close()
 
     def process_message(self, new_message=None):
         """ process messages from in queue """
         #  mqtt: " + str(new_message))
         (message_type, message) = new_message
-        if message_type == Global.MQTT_PUBLISH_JSON:
-            # message body is already in JSON format
-            (topic, message_body) = message
-            payload = json.dumps(message_body)
-            self.__send_to_mqtt(topic, payload)
-        elif message_type == Global.MQTT_PUBLISH_IODATA:
-            # message body id iodata instance
+        if message_type in (Global.MQTT_PUBLISH_JSON,
+                            Global.MQTT_PUBLISH_IODATA):
             (topic, message_body) = message
-            payload = message_body.encode_mqtt_message()
-            self.__send_to_mqtt(topic, payload)
+            if self.mqtt_config is not None and \
+                    self.mqtt_config.coalesce_time > 0 and \
+                    topic.startswith("dt/"):
+                self.__coalesce_message(topic, message_type, message_body)
+            else:
+                self.__publish_message(topic, message_type, message_body)
+        elif message_type == Global.MQTT_PUBLISH_COALESCED:
+            self.__publish_coalesced_messages()
         elif message_type == Global.MQTT_SUBSCRIBE:
             self.__subscribe_to_topic(message)
         elif message_type == Global.MQTT_UNSUBSCRIBE:
@@ -117,7 +176,15 @@ class MqttProcess(BaseProcess):
 
     def process_other(self):
         """ proceesses not related to messages to in_queue """
-        pass
+        if self.offline_messages and self.connected_event.is_set():
+            self.__send_offline_messages()
+        if self.ingress_data or self.ingress_requests:
+            self.__send_ingress_data()
+        self.__report_ingress()
+        if self.recorder is not None and \
+                time.monotonic() >= self.recorder_flush_due:
+            self.recorder.flush()
+            self.recorder_flush_due = time.monotonic() + RECORD_FLUSH_TIME
 
 
 
@@ -131,6 +198,23 @@ class MqttProcess(BaseProcess):
         self.mqtt_config = MqttConfig(self.config, self.node_name,
                                       self.host_name, self.log_queue)
         self.node_name = self.mqtt_config.node_name
+        if self.mqtt_config.ingress_queue_size is not None:
+            self.ingress_queue_size = self.mqtt_config.ingress_queue_size
+        if self.mqtt_config.ingress_request_policy in (Global.DROP_OLDEST,
+                                                       Global.DROP_NEWEST):
+            self.ingress_request_policy = \
+                self.mqtt_config.ingress_request_policy
+        else:
+            self.log_error("Bad ingress request policy, using " +
+                           str(Global.DROP_OLDEST) + ": " +
+                           str(self.mqtt_config.ingress_request_policy))
+        if self.mqtt_config.record_path is not None:
+            self.recorder = MqttRecorder(self.mqtt_config.record_path,
+                                         str(self.node_name))
+        try:
+            self.payload_codecs = PayloadCodecs(self.mqtt_config.payload_codecs)
+        except ValueError as exc:
+            self.log_error("Bad payload codecs config, using json: " + str(exc))
 
         if self.mqtt_config.broker is None or self.mqtt_config.user_name is None or\
                 self.mqtt_config.user_password is None or self.node_name is None:
@@ -156,19 +240,22 @@ class MqttProcess(BaseProcess):
             self.mqtt_client.on_connect = self.connect_cb
             self.mqtt_client.on_subscribe = self.subscribe_cb
             self.mqtt_client.on_disconnect = self.disconnect_cb
+            # paho reconnects in its network thread, backing off up to
+            # max delay. start delay is randomized so all nodes do not
+            # reconnect at the same time after a broker restart
+            self.mqtt_client.reconnect_delay_set(
+                min_delay=uniform(RECONNECT_MIN_DELAY, 2 * RECONNECT_MIN_DELAY),
+                max_delay=RECONNECT_MAX_DELAY)
             self.log_info('connecting ...')
-            # connect to broker
-            self.mqtt_client.connect(self.mqtt_config.broker)
+            # connect to broker, network loop retries until connected
+            self.mqtt_client.connect_async(self.mqtt_config.broker,
+                                           self.mqtt_config.port)
             # start the loop
             self.mqtt_client.loop_start()
-            time.sleep(4)
-            loop = 0
-            while not self.connected:
-                # Wait for connection
-                time.sleep(0.1)
-                loop = loop + 1
-                if loop > 200:
-                    raise OSError(" Timeout on connection")
+            # Wait for connection
+            if not self.connected_event.wait(CONNECT_TIMEOUT):
+                # messages are held until the connection is made
+                raise OSError(" Timeout on connection, still trying ...")
             self.log_info("Connected to MQTT Broker")
         except OSError as exc:
             self.log_info("Error during MQTT init")
@@ -181,23 +268,26 @@ class MqttProcess(BaseProcess):
             self.log_debug('connect cb: ' + str(rcode))
         if rcode == 0:
             self.log_info("... MQTT Connected...")
+            # subscriptions are lost on reconnect, subscribe again
+            for topic in list(self.subscribed_topics):
+                self.mqtt_client.subscribe(topic)
             # Signal connection
             self.connected = True
+            self.connected_event.set()
         else:
             self.log_critical("Connection failed: " + str(rcode))
             # raise OSError("MQTT Connettion Failed")
             self.log_critical("Reconnecting ...")
-            time.sleep(3)
-            self.close()
 
     def disconnect_cb(self, client, userdata, rcode=0):
         """ callback from paho modile during disconnection """
+        self.connected = False
+        self.connected_event.clear()
         if not self.events[Global.SHUTDOWN].is_set():
             # raise OSError("MQTT Connettion Failed")
+            # paho network loop will reconnect
             self.log_critical("DisConnected result code " + str(rcode))
             self.log_critical("Reconnecting ...")
-            time.sleep(3)
-            self.close()
         else:
             self.mqtt_client.loop_stop()
 
@@ -208,20 +298,139 @@ class MqttProcess(BaseProcess):
 
     def data_cb(self, client, userdata, message):
         """ callback from paho module. A new message has been received """
-        payload = str(message.payload.decode("utf-8"))
+        if self.recorder is not None:
+            self.recorder.record(DIRECTION_IN, message.topic, message.payload)
         # print("message received ", payloady)
         # print("message topic=", message.topic)
         # print("message qos=", message.qos)
         # print("message retain flag=", message.retain)
-        new_message = IoData.parse_mqtt_mesage(message.topic, payload,
-                                               self.reversed_globals)
-        self.send_to_application((Global.MQTT_MESSAGE, new_message))
+        if self.payload_codecs.is_binary(message.payload):
+            new_message = self.__parse_binary_message(message.topic,
+                                                      message.payload)
+        else:
+            payload = str(message.payload.decode("utf-8"))
+            new_message = IoData.parse_mqtt_mesage(message.topic, payload,
+                                                   self.reversed_globals)
+        if self.ingress_queue_size <= 0:
+            self.send_to_application((Global.MQTT_MESSAGE, new_message))
+        elif message.topic.startswith("dt/"):
+            self.__hold_ingress_data(message.topic, new_message)
+        elif self.__is_shutdown_message(new_message):
+            self.send_to_application((Global.MQTT_MESSAGE, new_message))
+        else:
+            self.__send_ingress_request(new_message)
 
     def restart_and_reconnect(self):
         """ restart mqtt connection """
         print("Failed to connect to MQTT broker. Reconnecting...")
         time.sleep(10)
 
+    def __parse_binary_message(self, topic, payload):
+        """ parse a message sent with the binary payload codec """
+        try:
+            body_map = self.payload_codecs.decode(payload)
+        except ValueError as exc:
+            body_map = None
+            print("Exception during binary payload parsing: " + str(exc) +
+                  "\n" + str(payload))
+        return IoData.parse_mqtt_map(topic, body_map, self.reversed_globals,
+                                     payload)
+
+    def __hold_ingress_data(self, topic, new_message):
+        """ hold a received "dt/" message until there is room for it
+            in application queue, only the latest message per topic is kept """
+        metrics = self.metrics
+        with self.ingress_lock:
+            if topic in self.ingress_data:
+                metrics.counter("ingress-coalesced").inc()
+            elif len(self.ingress_data) >= INGRESS_DATA_SIZE:
+                self.ingress_data.popitem(last=False)
+                metrics.counter("ingress-dropped").inc()
+            self.ingress_data[topic] = new_message
+        self.__send_ingress_data()
+
+    def __send_ingress_request(self, new_message):
+        """ send a received request to application queue, if there is no
+            room after a brief wait it is held behind earlier requests """
+        if not self.ingress_requests and self.__wait_for_ingress_room():
+            self.send_to_application((Global.MQTT_MESSAGE, new_message))
+            return
+        metrics = self.metrics
+        with self.ingress_lock:
+            if len(self.ingress_requests) >= INGRESS_REQUEST_SIZE:
+                metrics.counter("ingress-request-dropped").inc()
+                if self.ingress_request_policy == Global.DROP_NEWEST:
+                    return
+                self.ingress_requests.popleft()
+            metrics.counter("ingress-held").inc()
+            self.ingress_requests.append(new_message)
+        self.__send_ingress_data()
+
+    def __send_ingress_data(self):
+        """ move held messages to application queue, requests
+            first, then "dt/" messages, oldest first """
+        with self.ingress_lock:
+            room = self.ingress_queue_size - self.__application_queue_depth()
+            while self.ingress_requests and room > 0:
+                new_message = self.ingress_requests.popleft()
+                self.send_to_application((Global.MQTT_MESSAGE, new_message))
+                room -= 1
+            while self.ingress_data and room > 0:
+                (_topic, new_message) = self.ingress_data.popitem(last=False)
+                self.send_to_application((Global.MQTT_MESSAGE, new_message))
+                room -= 1
+
+    def __wait_for_ingress_room(self):
+        """ wait briefly for room in application queue, this holds up the
+            paho network thread which slows down reads from the broker,
+            returns False if there is no room in time """
+        if self.__application_queue_depth() < self.ingress_queue_size:
+            return True
+        self.metrics.counter("ingress-blocked").inc()
+        give_up = time.monotonic() + INGRESS_BLOCK_TIME
+        while self.__application_queue_depth() >= self.ingress_queue_size:
+            if self.events[Global.SHUTDOWN].is_set() or \
+                    time.monotonic() >= give_up:
+                self.metrics.counter("ingress-block-timeout").inc()
+                return False
+            time.sleep(INGRESS_BLOCK_INTERVAL)
+        return True
+
+    def __application_queue_depth(self):
+        """ number of messages waiting in application queue """
+        depth = 0
+        try:
+            depth = self.app_queue.qsize()
+        except NotImplementedError:
+            # qsize is not available on all platforms, no limit applied
+            pass
+        return depth
+
+    def __is_shutdown_message(self, new_message):
+        """ is message a node shutdown or reboot request """
+        return new_message.mqtt_message_root == Global.NODE and \
+            new_message.mqtt_desired in (Global.SHUTDOWN, Global.REBOOT)
+
+    def __report_ingress(self):
+        """ report held back or dropped received messages """
+        now = time.monotonic()
+        if now >= self.ingress_report_due:
+            counters = self.metrics.counters
+            reported = 0
+            for name in ("ingress-dropped", "ingress-coalesced",
+                         "ingress-blocked", "ingress-held",
+                         "ingress-request-dropped"):
+                if name in counters:
+                    reported += counters[name].value
+            if reported != self.ingress_reported:
+                self.ingress_reported = reported
+                self.log_warning(
+                    "Application queue full, received messages: " +
+                    str({name: counter.value
+                         for name, counter in counters.items()
+                         if name.startswith("ingress-")}))
+            self.ingress_report_due = now + INGRESS_REPORT_TIME
+
     def __shutdown_mqtt_client(self):
         """ stop the mqtt client """
         if self.mqtt_client is not None:
@@ -230,24 +439,100 @@ class MqttProcess(BaseProcess):
     def __subscribe_to_topic(self, topic=None):
         """ subrecibe to a new topic """
         self.log_info("Subscribing to: " + topic)
+        self.subscribed_topics[topic] = topic
         self.mqtt_client.subscribe(topic)
 
     def __unsubscribe_from_topic(self, topic=None):
         """ unsubrecibe to a new topic """
         self.log_info("Unsubscribing to: " + topic)
+        self.subscribed_topics.pop(topic, None)
         self.mqtt_client.unsubscribe(topic)
 
     #def __is_connected(self):
     #    """ return connection status """
     #    return self.connected
 
+    def __publish_message(self, topic, message_type, message_body):
+        """ encode and publish a message """
+        if message_type == Global.MQTT_PUBLISH_JSON:
+            # message body is already in JSON format
+            payload = json.dumps(message_body)
+        else:
+            # message body id iodata instance
+            payload = self.payload_codecs.encode(
+                topic, message_body.encode_mqtt_map())
+        self.sent_count += 1
+        self.__send_to_mqtt(topic, payload)
+
+    def __coalesce_message(self, topic, message_type, message_body):
+        """ hold a data message, only the latest message
+            for a topic is published at the end of coalesce time """
+        if not self.coalesced_messages:
+            self.send_after(
+                SendAfterMessage(Global.MQTT_PUBLISH_COALESCED, None,
+                                 self.mqtt_config.coalesce_time))
+        elif topic in self.coalesced_messages:
+            self.coalesced_count += 1
+        self.coalesced_messages[topic] = (message_type, message_body)
+
+    def __publish_coalesced_messages(self):
+        """ publish held data messages """
+        held_messages = self.coalesced_messages
+        self.coalesced_messages = {}
+        for topic, (message_type, message_body) in held_messages.items():
+            self.__publish_message(topic, message_type, message_body)
+
     def __send_to_mqtt(self, topic=None, payload=None):
-        """ publish a new message """
+        """ publish a new message, held if it cannot be sent """
         # print(">>>"+message_topic)
+        if not self.connected_event.is_set() or \
+                (self.offline_messages and
+                 not self.__send_offline_messages()) or \
+                not self.__publish_payload(topic, payload):
+            self.__hold_offline_message(topic, payload)
+
+    def __publish_payload(self, topic, payload):
+        """ publish a payload to the broker,
+            returns False if not connected """
+        if self.recorder is not None:
+            self.recorder.record(DIRECTION_OUT, topic, payload)
         (rc, _mid) = self.mqtt_client.publish(topic=topic, payload=payload)
         if rc == MQTT_ERR_NO_CONN:
             self.log_error("Error Sendng MQTT Message: MQTT_ERR_NO_CONN: " +
                            str(rc) + ' .. ' + topic)
-        elif rc != 0:
+            # connection lost before paho noticed, hold messages
+            # until connect_cb is called again
+            self.connected = False
+            self.connected_event.clear()
+            return False
+        if rc != 0:
             self.log_error("Error Sendng MQTT Message: " + str(rc) + ' .. ' +
                            topic)
+        return True
+
+    def __hold_offline_message(self, topic, payload):
+        """ hold a message to be published when connected """
+        if topic.startswith("dt/"):
+            # data message, only latest value is needed, move to end
+            self.offline_messages.pop(topic, None)
+            key = topic
+        else:
+            self.offline_message_count += 1
+            key = (topic, self.offline_message_count)
+        self.offline_messages[key] = (topic, payload)
+        if len(self.offline_messages) > OFFLINE_BUFFER_SIZE:
+            # buffer full, drop oldest message
+            del self.offline_messages[next(iter(self.offline_messages))]
+
+    def __send_offline_messages(self):
+        """ publish messages held while not connected, oldest first,
+            returns False if they could not all be sent """
+        self.log_info("Sending held messages: " + str(len(self.offline_messages)))
+        held_messages = list(self.offline_messages.items())
+        self.offline_messages = {}
+        for (index, (_key, (topic, payload))) in enumerate(held_messages):
+            if not self.__publish_payload(topic, payload):
+                # keep the unsent messages, in order, for the next connect
+                self.offline_messages = dict(held_messages[index:])
+                return False
+        return True
@@ -30,64 +30,48 @@ import sys
 
 sys.path.append('../../lib')
 
-from utils.global_constants import Global
+from utils.global_vocabulary import ON_SYNONYMS, OFF_SYNONYMS, REPORTED, REVERSE
 
 
 class Synonyms(object):
-    """ help class for synonyms of global terms """
+    """ help class for synonyms of global terms,
+        see global_vocabulary.py for the lookup tables """
     def __init__(self):
         pass
 
     @classmethod
     def is_on(cls, name):
         """ is value a synonym for on """
-        rett = False
-        if name in (Global.THROWN, Global.THROW, Global.ON, "1", 1, True):
-            rett = True
-        return rett
+        try:
+            return name in ON_SYNONYMS
+        except TypeError:
+            # unhashable, not a synonym
+            return False
 
     @classmethod
     def is_off(cls, name):
         """ is value a synonym for off """
-        rett = False
-        if name in (Global.CLOSED, Global.CLOSE, Global.OFF, "0", 0, False):
-            rett = True
-        return rett
+        try:
+            return name in OFF_SYNONYMS
+        except TypeError:
+            return False
 
     @classmethod
     def desired_to_reported(cls, desired=None):
         """ convert synonyms to past tense reported """
-        reported = desired
-        if desired == Global.THROW:
-            reported = Global.THROWN
-        if desired == Global.CLOSE:
-            reported = Global.CLOSED
-        return reported
+        try:
+            if desired in REPORTED:
+                return REPORTED[desired]
+        except TypeError:
+            pass
+        return desired
 
     @classmethod
     def reverse(cls, desired=None):
         """ convert synonyms to opposite """
-        reported = desired
-        if desired == Global.THROW:
-            reported = Global.CLOSE
-        if desired == Global.THROWN:
-            reported = Global.CLOSED
-        if desired == Global.ON:
-            reported = Global.OFF
-        if desired == Global.OFF:
-            reported = Global.ON
-        if desired == Global.ON:
-            reported = Global.OFF
-        if desired == Global.CONNECT:
-            reported = Global.DISCONNECT
-        if desired == Global.DISCONNECT:
-            reported = Global.CONNECT
-        if desired == Global.STOP:
-            reported = Global.RUN
-        if desired == Global.RUN:
-            reported = Global.STOP
-        if desired == Global.ACQUIRE:
-            reported = Global.RELEASE
-        if desired == Global.RELEASE:
-            reported = Global.ACQUIRE
-        return reported
+        try:
+            if desired in REVERSE:
+                return REVERSE[desired]
+        except TypeError:
+            pass
+        return desired
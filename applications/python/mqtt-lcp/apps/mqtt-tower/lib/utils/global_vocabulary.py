@@ -0,0 +1,60 @@
+#!/usr/bin/python3
+# global_vocabulary.py
+"""
+
+    global_vocabulary.py - lookup tables built once from global_constants.py
+
+        Synonyms of on/off and the reported and reverse forms of desired
+        states are set and dictionary lookups instead of comparisons
+        against lists of synonyms.
+
+The MIT License (MIT)
+
+Copyright 2023 richard p hughes
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+and associated documentation files (the "Software"), to deal in the Software without restriction,
+including without limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom the Software
+is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies
+or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+import sys
+from types import MappingProxyType
+
+sys.path.append('../../lib')
+
+from utils.global_constants import Global
+
+
+# synonyms of on and off, 1 and 0 also match True and False as they hash the same
+ON_SYNONYMS = frozenset((Global.THROWN, Global.THROW, Global.ON, "1", 1))
+OFF_SYNONYMS = frozenset((Global.CLOSED, Global.CLOSE, Global.OFF, "0", 0))
+
+# desired state -> reported (past tense) state
+REPORTED = MappingProxyType({
+    Global.THROW: Global.THROWN,
+    Global.CLOSE: Global.CLOSED})
+
+# state -> opposite state
+REVERSE = MappingProxyType({
+    Global.THROW: Global.CLOSE,
+    Global.THROWN: Global.CLOSED,
+    Global.ON: Global.OFF,
+    Global.OFF: Global.ON,
+    Global.CONNECT: Global.DISCONNECT,
+    Global.DISCONNECT: Global.CONNECT,
+    Global.STOP: Global.RUN,
+    Global.RUN: Global.STOP,
+    Global.ACQUIRE: Global.RELEASE,
+    Global.RELEASE: Global.ACQUIRE})
+
@@ -0,0 +1,150 @@
+#!/usr/bin/python3
+# mqtt_recorder.py
+"""
+
+    MqttRecorder - record mqtt traffic to compressed capture files
+
+    Each record is a fixed header (monotonic time stamp, direction, topic length,
+    payload length) followed by the topic and payload bytes. Records are written
+    to gzip files which are rotated by size, only the newest files are kept.
+
+    read_capture_files() returns the records of one or more capture files in order.
+
+The MIT License (MIT)
+
+Copyright 2023 richard p hughes
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+and associated documentation files (the "Software"), to deal in the Software without restriction,
+including without limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom the Software
+is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies
+or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+
+import os
+import glob
+import gzip
+import struct
+import threading
+import time
+
+# time stamp (seconds), direction, topic length, payload length
+RECORD_HEADER = struct.Struct(">dBHI")
+
+DIRECTION_IN = 0
+DIRECTION_OUT = 1
+
+CAPTURE_FILE_SUFFIX = ".mqtt.gz"
+# uncompressed bytes written to a capture file before a new file is started
+CAPTURE_FILE_SIZE = 16 * 1024 * 1024
+# number of capture files kept, oldest are removed
+CAPTURE_FILE_COUNT = 10
+
+
+class MqttRecorder(object):
+    """ write mqtt messages to rotating capture files """
+
+    def __init__(self,
+                 path=".",
+                 name="mqtt",
+                 file_size=CAPTURE_FILE_SIZE,
+                 file_count=CAPTURE_FILE_COUNT):
+        self.path = path
+        self.name = name
+        self.file_size = file_size
+        self.file_count = file_count
+        self.capture_file = None
+        self.bytes_written = 0
+        self.file_sequence = 0
+        # messages are recorded from paho network thread and process thread
+        self.lock = threading.Lock()
+
+    def __repr__(self):
+        # return "%s(%r)" % (self.__class__, self.__dict__)
+        fdict = repr(self.__dict__)
+        return f"{self.__class__}({fdict})"
+
+    def record(self, direction, topic, payload):
+        """ add a message to the capture file """
+        if isinstance(topic, str):
+            topic = topic.encode("utf-8")
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        elif payload is None:
+            payload = b""
+        header = RECORD_HEADER.pack(time.monotonic(), direction, len(topic),
+                                    len(payload))
+        with self.lock:
+            if self.capture_file is None or \
+                    self.bytes_written >= self.file_size:
+                self.__start_new_file()
+            self.capture_file.write(header + topic + payload)
+            self.bytes_written += len(header) + len(topic) + len(payload)
+
+    def flush(self):
+        """ flush recorded messages to disk,
+            files can then be read even if the process does not exit cleanly """
+        with self.lock:
+            if self.capture_file is not None:
+                self.capture_file.flush()
+
+    def close(self):
+        """ close the capture file """
+        with self.lock:
+            if self.capture_file is not None:
+                self.capture_file.close()
+                self.capture_file = None
+
+    def __start_new_file(self):
+        """ close current file, start a new one and remove old files """
+        if self.capture_file is not None:
+            self.capture_file.close()
+        os.makedirs(self.path, exist_ok=True)
+        self.file_sequence += 1
+        file_name = self.name + "-" + time.strftime("%Y%m%d-%H%M%S") + \
+            "-" + str(self.file_sequence).zfill(4) + CAPTURE_FILE_SUFFIX
+        self.capture_file = gzip.open(os.path.join(self.path, file_name), "wb")
+        self.bytes_written = 0
+        old_files = find_capture_files(self.path, self.name)
+        for old_file in old_files[:-self.file_count]:
+            os.remove(old_file)
+
+
+def find_capture_files(path, name="*"):
+    """ capture files in a folder, oldest first """
+    return sorted(
+        glob.glob(os.path.join(path, name + "-*" + CAPTURE_FILE_SUFFIX)))
+
+
+def read_capture_files(file_names):
+    """ generator of (time stamp, direction, topic, payload) records,
+        a capture file that was not closed cleanly is read up to the
+        last complete record """
+    if isinstance(file_names, str):
+        file_names = [file_names]
+    for file_name in file_names:
+        with gzip.open(file_name, "rb") as capture_file:
+            while True:
+                try:
+                    header = capture_file.read(RECORD_HEADER.size)
+                    if len(header) < RECORD_HEADER.size:
+                        break
+                    (time_stamp, direction, topic_length,
+                     payload_length) = RECORD_HEADER.unpack(header)
+                    topic = capture_file.read(topic_length)
+                    payload = capture_file.read(payload_length)
+                except EOFError:
+                    break
+                if len(payload) < payload_length:
+                    break
+                yield (time_stamp, direction, topic.decode("utf-8"), payload)
@@ -29,7 +29,6 @@ import sys
 
 sys.path.append('../lib')
 
-import os
 import select
 import time
 from random import randrange
@@ -37,12 +36,26 @@ import multiprocessing
 from multiprocessing import Event
 
 # from utils.utility import Utility
-from utils.json_utils import JsonUtils
-from utils.yaml_utils import YamlUtils
+from utils.config_utils import ConfigUtils
+from utils.heartbeat import Heartbeat, request_stack_dump
 from utils.global_constants import Global
 
-#  program normmally start at boot, wait for other services to start
-time.sleep(3)
+# max seconds to wait for a process to become ready
+STARTUP_TIMEOUT = 30
+# max seconds to wait for processes to exit before terminating them
+SHUTDOWN_TIMEOUT = 5
+# seconds to wait before restarting the application
+RESTART_WAIT = 5
+# seconds between checks of process ready/exit state
+POLL_INTERVAL = 0.01
+# seconds between checks of process heartbeats while monitoring
+WATCHDOG_CHECK_INTERVAL = 0.1
+# default seconds without a heartbeat before a process is reported as stalled,
+# longer than device and driver response waits
+WATCHDOG_STALL_TIME = 5
+# default seconds without a heartbeat before a process is restarted, 0 == never,
+# processes that wait longer call sleep_with_heartbeat
+WATCHDOG_RESTART_TIME = 60
 
 
 class ProcessSupervisor(object):
@@ -56,7 +69,20 @@ class ProcessSupervisor(object):
             Global.RESTART: self.restart_event
         }
         self.processes = {}
+        # processes stamp their slot in shared memory, see check_processes_are_responsive
+        self.heartbeat = Heartbeat()
+        self.events[Global.HEARTBEAT] = self.heartbeat
+        self.watchdog_stall_time = WATCHDOG_STALL_TIME
+        self.watchdog_restart_time = WATCHDOG_RESTART_TIME
+        # process key -> monotonic time its last heartbeat was seen
+        self.stalled_processes = {}
+        # process key -> process instance that has reported ready
+        self.ready_processes = {}
+        # list of (process name, state, seconds) for timeline report
+        self.timeline = []
+        self.timeline_started = time.monotonic()
         self.__load_config_file()
+        self.__parse_watchdog_config()
 
     def __repr__(self):
         # return "%s(%r)" % (self.__class__, self.__dict__)
@@ -71,7 +97,8 @@ class ProcessSupervisor(object):
         while not self.shutdown_event.is_set() \
             and not self.restart_event.is_set():
             # non blobking check for keyboard input
-            keyb_input = select.select([sys.stdin], [], [], 1)[0]
+            keyb_input = select.select([sys.stdin], [], [],
+                                       WATCHDOG_CHECK_INTERVAL)[0]
             if keyb_input:
                 value = sys.stdin.readline().rstrip()
                 if value == "quit":
@@ -81,7 +108,7 @@ class ProcessSupervisor(object):
                     print(f"You entered: {value}, unknown command")
             else:
                 self.check_processes_are_running()
-            time.sleep(0.5)
+                self.check_processes_are_responsive()
 
     def check_processes_are_running(self):
         """ check that each process is running, if not restart"""
@@ -94,25 +121,115 @@ class ProcessSupervisor(object):
                     if not process_pid.is_alive():
                         print("supervisor: process " + str(process_key) +
                               " crashed, restarting")
-                        process_func()
-                        time.sleep(1)
+                        self.__restart_process(process_key)
+
+    def check_processes_are_responsive(self):
+        """ check that each process is stamping its heartbeat,
+            dump the stack of a stalled process and restart it if it stays stalled """
+        now = time.monotonic()
+        for process_key, process_info in list(self.processes.items()):
+            if self.shutdown_event.is_set():
+                break
+            (_process_func, process_pid) = process_info
+            slot = getattr(process_pid, "heartbeat_slot", None)
+            if slot is None or not process_pid.is_alive():
+                continue
+            (beat_time, loop_count) = self.heartbeat.read(slot)
+            if beat_time == 0:
+                # still initializing
+                continue
+            # an idle process beats at least once per process_other interval
+            stall_time = max(self.watchdog_stall_time,
+                             2 * process_pid.process_other_interval / 1000)
+            stalled = now - beat_time
+            if stalled < stall_time:
+                if process_key in self.stalled_processes:
+                    print("supervisor: process " + str(process_key) +
+                          f" responding again after {stalled:.3f} s")
+                    del self.stalled_processes[process_key]
+            elif process_key not in self.stalled_processes:
+                self.stalled_processes[process_key] = beat_time
+                print("supervisor: process " + str(process_key) +
+                      f" not responding for {stalled:.3f} s, loop: " +
+                      str(loop_count) + ", dumping stack")
+                request_stack_dump(process_pid.pid)
+            elif 0 < self.watchdog_restart_time <= stalled:
+                print("supervisor: process " + str(process_key) +
+                      f" not responding for {stalled:.3f} s, restarting")
+                self.__restart_process(process_key)
+
+    def wait_for_processes_ready(self, process_keys=None, timeout=STARTUP_TIMEOUT):
+        """ wait for started processes to report they are ready """
+        if process_keys is None:
+            process_keys = list(self.processes.keys())
+        waiting = {}
+        for process_key in process_keys:
+            process_info = self.processes.get(process_key, None)
+            if process_info is not None:
+                (_process_func, process_pid) = process_info
+                if getattr(process_pid, "ready_event", None) is not None and \
+                        self.ready_processes.get(process_key, None) is not process_pid:
+                    waiting[process_key] = process_pid
+        deadline = time.monotonic() + timeout
+        while waiting and not self.shutdown_event.is_set():
+            for process_key, process_pid in list(waiting.items()):
+                if process_pid.ready_event.is_set():
+                    self.ready_processes[process_key] = process_pid
+                    self.__add_to_timeline(process_pid, "ready")
+                    del waiting[process_key]
+                elif not process_pid.is_alive():
+                    self.__add_to_timeline(process_pid, "exited")
+                    del waiting[process_key]
+            if waiting and time.monotonic() >= deadline:
+                for process_key, process_pid in waiting.items():
+                    print("supervisor: process " + str(process_key) +
+                          " not ready after " + str(timeout) + " seconds")
+                    self.__add_to_timeline(process_pid, "not ready")
+                break
+            time.sleep(POLL_INTERVAL)
 
     def shutdown_all_processes(self):
         """ shutdown all processes """
         print("Shutting down ...")
+        self.start_timeline()
         self.shutdown_event.set()
-        time.sleep(2)
-
-        for process in multiprocessing.active_children():
+        running = multiprocessing.active_children()
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+        while running and time.monotonic() < deadline:
+            for process in list(running):
+                if not process.is_alive():
+                    self.__add_to_timeline(process, "stopped")
+                    running.remove(process)
+            time.sleep(POLL_INTERVAL)
+        for process in running:
             print("Shutting down process %r", process)
             process.terminate()
             process.join()
+            self.__add_to_timeline(process, "terminated")
+        self.ready_processes = {}
+        self.stalled_processes = {}
+        self.heartbeat.free_all_slots()
+        self.report_timeline("shutdown")
 
         if self.restart_event.is_set():
-            print("restarting application in 15 seconds")
+            print("restarting application in " + str(RESTART_WAIT) + " seconds")
             self.shutdown_event.clear()
             self.restart_event.clear()
-            time.sleep(15)
+            time.sleep(RESTART_WAIT)
+
+    def start_timeline(self):
+        """ start a new startup/shutdown timeline """
+        self.timeline = []
+        self.timeline_started = time.monotonic()
+
+    def report_timeline(self, title="startup"):
+        """ print the time taken by each process to start or stop """
+        print("supervisor: " + str(title) + " timeline:")
+        for (process_name, state, seconds) in self.timeline:
+            print(f"supervisor: ... {process_name:<20} {state:<10} {seconds:7.3f} s")
+        total = time.monotonic() - self.timeline_started
+        print(f"supervisor: ... {title} total: {total:7.3f} s")
+
     def perform_wait_countdown(self, wait_range):
         """ wait a random time within a range """
         wait_seconds = randrange(wait_range) + 3
@@ -130,47 +247,53 @@ class ProcessSupervisor(object):
     # private functions
     #
 
+    def __restart_process(self, process_key):
+        """ stop a process if it is still running and start a new one """
+        (process_func, process_pid) = self.processes[process_key]
+        self.stalled_processes.pop(process_key, None)
+        self.start_timeline()
+        if process_pid.is_alive():
+            process_pid.terminate()
+            process_pid.join(SHUTDOWN_TIMEOUT)
+            if process_pid.is_alive():
+                process_pid.kill()
+                process_pid.join()
+            self.__add_to_timeline(process_pid, "terminated")
+        self.heartbeat.free_slot(getattr(process_pid, "heartbeat_slot", None))
+        process_func()
+        self.wait_for_processes_ready([process_key])
+        self.report_timeline("restart")
+
+    def __add_to_timeline(self, process, state):
+        """ add a process state change to the timeline """
+        started = getattr(process, "launch_time", self.timeline_started)
+        if state != "ready":
+            started = self.timeline_started
+        self.timeline.append(
+            (process.name, state, time.monotonic() - started))
+
     def __load_config_file(self):
         """ load  configuration file """
-        config_root = "."
-        if os.path.exists("configure"):
-            config_root = "configure"
-        if os.path.exists(os.path.join(config_root, 'config.yaml')):
-            self.__load_yaml_config_file(file=os.path.join(config_root, "config.yaml"))
-        elif os.path.exists(os.path.join(config_root,'config.yml')):
-            self.__load_yaml_config_file(file=os.path.join(config_root,"config.yml"))
-        else:
-            self.__load_json_config_file(file=os.path.join(config_root, "config.json"))
-        #  print(">>> config: "+str(self.config))
-
-    def __load_yaml_config_file(self, file="config.yaml"):
-        """ load config.yaml configuration file """
         config = None
-        yaml_helper = YamlUtils()
         try:
-            config = yaml_helper.load_and_parse_file(file)
+            config = ConfigUtils.load_config()
         except Exception as exc:
-            message = "Exception during YAML parsing, exiting: " \
-                + str(exc) + "\n" + str("config.yaml")
+            message = "Exception during config parsing, exiting: " \
+                + str(exc)
             print(message)
             self.log_critical(message)
             # wait a few seconds to error to be logged
             time.sleep(2)
             self.events[Global.SHUTDOWN].set()
         self.config = config
+        #  print(">>> config: "+str(self.config))
 
-    def __load_json_config_file(self,file="config.json"):
-        """ load config.json configuration file """
-        config = None
-        json_helper = JsonUtils()
-        try:
-            config = json_helper.load_and_parse_file(file)
-        except Exception as exc:
-            message = "Exception during JSON parsing, exiting: "\
-                + str(exc) + "\n" + str(file)
-            print(message)
-            self.log_critical(message)
-            # wait a few seconds to error to be logged
-            time.sleep(2)
-            self.events[Global.SHUTDOWN].set()
-        self.config = config
+    def __parse_watchdog_config(self):
+        """ parse process watchdog times from config options """
+        if self.config is not None and Global.CONFIG in self.config:
+            options = self.config[Global.CONFIG].get(Global.OPTIONS, None)
+            if isinstance(options, dict):
+                self.watchdog_stall_time = options.get(
+                    Global.WATCHDOG_STALL_TIME, self.watchdog_stall_time)
+                self.watchdog_restart_time = options.get(
+                    Global.WATCHDOG_RESTART_TIME, self.watchdog_restart_time)
@@ -48,6 +48,8 @@ from utils.global_constants import Global
 from processes.base_process import BaseProcess
 
 MAX_BUFFER = 120
+# seconds to wait for the response to a message sent to the device
+RESPONSE_TIME = 0.1
 
 
 class SerialProcess(BaseProcess):
@@ -177,10 +179,15 @@ class SerialProcess(BaseProcess):
             elif msg_type == Global.DEVICE_SEND_AND_RESPOND:
                 if self.serial_port is not None and self.serial_port.isOpen():
                     # print(">>> send/respond: " + str(encoded_msg_text))
-                    self.send_serial_message(encoded_msg_text)
-                    message = self.__perform_async_io(0.1)
+                    if isinstance(msg_text, list):
+                        message = self.__send_serial_message_list(
+                            msg_text, msg_map.get(Global.RESPONSE_PREFIXES, None))
+                    else:
+                        self.send_serial_message(encoded_msg_text)
+                        message = self.__perform_async_io(RESPONSE_TIME)
                     # print(">>> response: " + str(message))
-                    self.publish_response(message, msg_map[Global.RESPONSE_QUEUE])
+                    self.publish_response(message, msg_map[Global.RESPONSE_QUEUE],
+                                          msg_map.get(Global.REQUEST_ID, None))
                     msg_consummed = True
                 else:
                     self.publish_response({Global.TEXT: Global.ERROR},
@@ -208,10 +215,13 @@ class SerialProcess(BaseProcess):
         else:
             self.send_to_application(message)
 
-    def publish_response(self, serial_data, response_queue):
-        """ publish serial input """
+    def publish_response(self, serial_data, response_queue, request_id=None):
+        """ publish serial input, request_id of the request is
+            returned with the response, if the request had one """
         #print(">>> response to: " + str(response_queue) + " ... " + str(serial_data))
         message = (Global.DEVICE_RESPONSE, serial_data)
+        if request_id is not None:
+            message = (Global.DEVICE_RESPONSE, serial_data, request_id)
         resp_queue = self.queues.get(response_queue, None)
         if resp_queue is not None:
             resp_queue.put(message)
@@ -242,6 +252,45 @@ class SerialProcess(BaseProcess):
     # private functions
     #
 
+    def __send_serial_message_list(self, message_list, response_prefixes=None):
+        """ send messages back to back, then read responses until each
+            message has one or the response time is up, a shared
+            response time instead of one per message,
+            response_prefixes has the start of the response to each
+            message, None if the device does not respond to it,
+            lines read that are not a response are published as input """
+        for message in message_list:
+            self.send_serial_message(self.encode_message(message))
+        if response_prefixes is None or self.serial_mode != Global.TEXT:
+            # any line read is a response
+            response_prefixes = [""] * len(message_list)
+        waiting_prefixes = [prefix for prefix in response_prefixes
+                            if prefix is not None]
+        rett = []
+        expires = time.monotonic() + RESPONSE_TIME
+        while waiting_prefixes:
+            time_left = expires - time.monotonic()
+            if time_left <= 0:
+                break
+            response = self.__perform_async_io(time_left)
+            if response is not None:
+                for response_line in response:
+                    if self.__match_response(response_line, waiting_prefixes):
+                        rett.append(response_line)
+                    else:
+                        self.publish_input(response_line)
+        return rett
+
+    def __match_response(self, response_line, waiting_prefixes):
+        """ remove the prefix of the first waiting response a line starts
+            with, returns False if the line is not a waiting response """
+        line = str(response_line).strip()
+        for index, prefix in enumerate(waiting_prefixes):
+            if line.startswith(prefix):
+                del waiting_prefixes[index]
+                return True
+        return False
+
     def __perform_async_io(self, timeout):
         """ perform async I/O: read from serial device without first sending data """
         # check for unsolicited input from serial device
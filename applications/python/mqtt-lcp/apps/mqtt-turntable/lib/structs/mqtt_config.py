@@ -29,6 +29,9 @@ sys.path.append('../../lib')
 
 from utils.global_constants import Global
 
+# broker port used if none is configured
+DEFAULT_PORT = 1883
+
 
 class MqttConfig(object):
     """ Data class for Mqtt Config data """
@@ -42,8 +45,21 @@ class MqttConfig(object):
         self.host_name = host_name
         self.log_queue = log_queue
         self.broker = None
+        self.port = DEFAULT_PORT
         self.user_name = None
         self.user_password = None
+        # milliseconds to hold "dt/" messages, only latest is published
+        self.coalesce_time = 0
+        # max messages waiting in application queue before received
+        # messages are held, coalesced or dropped, 0 == no limit
+        self.ingress_queue_size = None
+        # received requests held when application queue is full are
+        # dropped by this policy once too many are held
+        self.ingress_request_policy = Global.DROP_OLDEST
+        # folder to record mqtt traffic to, None == not recorded
+        self.record_path = None
+        # topic prefix -> payload codec name, see utils/payload_codecs.py
+        self.payload_codecs = {}
         self.subscribe_topics = {}
         self.publish_topics = {}
         self.other_topics = {}
@@ -62,10 +78,24 @@ class MqttConfig(object):
                 if Global.MQTT in self.config[Global.CONFIG][Global.IO]:
                     self.broker = self.config[Global.CONFIG][Global.IO][
                         Global.MQTT].get(Global.BROKER, None)
+                    self.port = int(self.config[Global.CONFIG][Global.IO][
+                        Global.MQTT].get(Global.PORT, DEFAULT_PORT))
                     self.user_name = self.config[Global.CONFIG][Global.IO][
                         Global.MQTT].get(Global.USER, None)
                     self.user_password = self.config[Global.CONFIG][Global.IO][
                         Global.MQTT].get(Global.PASSWORD, None)
+                    self.coalesce_time = self.config[Global.CONFIG][Global.IO][
+                        Global.MQTT].get(Global.COALESCE_TIME, 0)
+                    self.ingress_queue_size = self.config[Global.CONFIG][
+                        Global.IO][Global.MQTT].get(Global.INGRESS_QUEUE_SIZE,
+                                                    None)
+                    self.ingress_request_policy = self.config[Global.CONFIG][
+                        Global.IO][Global.MQTT].get(
+                            Global.INGRESS_REQUEST_POLICY, Global.DROP_OLDEST)
+                    self.record_path = self.config[Global.CONFIG][Global.IO][
+                        Global.MQTT].get(Global.RECORD_PATH, None)
+                    self.payload_codecs = self.config[Global.CONFIG][Global.IO][
+                        Global.MQTT].get(Global.PAYLOAD_CODECS, {})
         if Global.CONFIG in self.config:
             if Global.IO in self.config[Global.CONFIG]:
                 if Global.MQTT in self.config[Global.CONFIG][Global.IO]:
@@ -0,0 +1,252 @@
+#!/usr/bin/python3
+# metrics.py
+"""
+
+    Metrics - lightweight runtime counters, gauges and latency histograms
+
+    Histograms use log-linear buckets (in the style of HDR histograms): each
+    power of two range is split into a fixed number of sub buckets, so any
+    recorded value is kept to within about 12% using a small number of buckets.
+
+The MIT License (MIT)
+
+Copyright 2023 richard p hughes
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+and associated documentation files (the "Software"), to deal in the Software without restriction,
+including without limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom the Software
+is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies
+or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+
+import os
+import re
+
+# sub buckets per power of two, must be a power of two
+SUB_BUCKET_COUNT = 8
+SUB_BUCKET_BITS = 3
+
+# percentiles reported in snapshots
+PERCENTILES = (50, 90, 99)
+
+
+class Counter(object):
+    """ a value that only goes up """
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def __repr__(self):
+        return f"{self.__class__}({self.value})"
+
+    def inc(self, amount=1):
+        """ increment the counter """
+        self.value += amount
+
+
+class Gauge(object):
+    """ a value that can go up and down """
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def __repr__(self):
+        return f"{self.__class__}({self.value})"
+
+    def set(self, value):
+        """ set the gauge value """
+        self.value = value
+
+
+class Histogram(object):
+    """ distribution of positive integer values,
+        usually latency in microseconds """
+    __slots__ = ("buckets", "count", "total", "max")
+
+    def __init__(self):
+        # bucket index -> count, only buckets with values are kept
+        self.buckets = {}
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def __repr__(self):
+        return f"{self.__class__}({self.snapshot()})"
+
+    def record(self, value):
+        """ record a value, kept short as it is called on hot paths """
+        if value < 2 * SUB_BUCKET_COUNT:
+            index = value
+        else:
+            shift = value.bit_length() - SUB_BUCKET_BITS - 1
+            index = ((shift + 1) << SUB_BUCKET_BITS) + \
+                (value >> shift) - SUB_BUCKET_COUNT
+        buckets = self.buckets
+        buckets[index] = buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percent):
+        """ value at or below which percent of recorded values fall """
+        if self.count == 0:
+            return 0
+        wanted = self.count * percent / 100
+        seen = 0
+        value = self.max
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= wanted:
+                value = min(self.__bucket_upper_value(index), self.max)
+                break
+        return value
+
+    def snapshot(self):
+        """ summary of recorded values """
+        summary = {
+            "count": self.count,
+            "mean": round(self.total / self.count) if self.count else 0,
+            "max": self.max
+        }
+        for percent in PERCENTILES:
+            summary["p" + str(percent)] = self.percentile(percent)
+        return summary
+
+    def __bucket_upper_value(self, index):
+        """ largest value that falls in a bucket """
+        if index < 2 * SUB_BUCKET_COUNT:
+            return index
+        shift = index // SUB_BUCKET_COUNT - 1
+        sub_bucket = index % SUB_BUCKET_COUNT + SUB_BUCKET_COUNT
+        return ((sub_bucket + 1) << shift) - 1
+
+
+class Metrics(object):
+    """ registry of named metrics for one process """
+
+    def __init__(self, name=None):
+        self.name = name
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def __repr__(self):
+        # return "%s(%r)" % (self.__class__, self.__dict__)
+        fdict = repr(self.__dict__)
+        return f"{self.__class__}({fdict})"
+
+    def counter(self, name):
+        """ get a counter, create it if needed """
+        counter = self.counters.get(name, None)
+        if counter is None:
+            counter = Counter()
+            self.counters[name] = counter
+        return counter
+
+    def gauge(self, name):
+        """ get a gauge, create it if needed """
+        gauge = self.gauges.get(name, None)
+        if gauge is None:
+            gauge = Gauge()
+            self.gauges[name] = gauge
+        return gauge
+
+    def histogram(self, name):
+        """ get a histogram, create it if needed """
+        histogram = self.histograms.get(name, None)
+        if histogram is None:
+            histogram = Histogram()
+            self.histograms[name] = histogram
+        return histogram
+
+    def snapshot(self):
+        """ compact dict of all metrics values """
+        snapshot = {}
+        if self.counters:
+            snapshot["counters"] = \
+                {name: counter.value for name, counter in self.counters.items()}
+        if self.gauges:
+            snapshot["gauges"] = \
+                {name: gauge.value for name, gauge in self.gauges.items()}
+        if self.histograms:
+            snapshot["histograms"] = \
+                {name: histogram.snapshot()
+                 for name, histogram in self.histograms.items()}
+        return snapshot
+
+    def prometheus_text(self, labels=None):
+        """ format metrics in prometheus text exposition format,
+            a name of "metric:type" is written as metric{type="type"} """
+        if labels is None:
+            labels = {}
+        if self.name is not None and "process" not in labels:
+            labels = dict(labels, process=self.name)
+        lines = []
+        typed = set()
+        for name, counter in sorted(self.counters.items()):
+            (metric, metric_labels) = self.__metric_name(name, labels)
+            self.__add_type(lines, typed, metric + "_total", "counter")
+            lines.append(metric + "_total" + self.__labels(metric_labels) +
+                         " " + str(counter.value))
+        for name, gauge in sorted(self.gauges.items()):
+            (metric, metric_labels) = self.__metric_name(name, labels)
+            self.__add_type(lines, typed, metric, "gauge")
+            lines.append(metric + self.__labels(metric_labels) + " " +
+                         str(gauge.value))
+        for name, histogram in sorted(self.histograms.items()):
+            (metric, metric_labels) = self.__metric_name(name, labels)
+            self.__add_type(lines, typed, metric, "summary")
+            for percent in PERCENTILES:
+                quantile_labels = dict(metric_labels,
+                                       quantile=str(percent / 100))
+                lines.append(metric + self.__labels(quantile_labels) + " " +
+                             str(histogram.percentile(percent)))
+            lines.append(metric + "_sum" + self.__labels(metric_labels) +
+                         " " + str(histogram.total))
+            lines.append(metric + "_count" + self.__labels(metric_labels) +
+                         " " + str(histogram.count))
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus_file(self, file_path, labels=None):
+        """ write metrics to a prometheus textfile collector file,
+            the file is replaced in one step so it is never seen half written """
+        temp_path = file_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as metrics_file:
+            metrics_file.write(self.prometheus_text(labels))
+        os.replace(temp_path, file_path)
+
+    def __metric_name(self, name, labels):
+        """ convert a metric name into a valid prometheus name and labels """
+        (name, _sep, metric_type) = str(name).partition(":")
+        if metric_type:
+            labels = dict(labels, type=metric_type)
+        return ("mqtt_lcp_" + re.sub(r"[^a-zA-Z0-9_]", "_", name), labels)
+
+    def __add_type(self, lines, typed, metric, metric_type):
+        """ add a TYPE line the first time a metric is seen """
+        if metric not in typed:
+            typed.add(metric)
+            lines.append("# TYPE " + metric + " " + metric_type)
+
+    def __labels(self, labels):
+        """ format prometheus labels """
+        if not labels:
+            return ""
+        label_list = []
+        for key, value in labels.items():
+            value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+            label_list.append(key + '="' + value + '"')
+        return "{" + ",".join(label_list) + "}"
@@ -114,8 +114,8 @@ class WithrottleDriver(BaseProcess):
         self.fastclock_ratio = 1
         self.roster = roster
         self.switches = switches
-        self.decoder = WithrottleDecoder(log_queue=log_queue)
-        self.encoder = WithrottleEncoder(log_queue=log_queue)
+        self.decoder = WithrottleDecoder(logger=self)
+        self.encoder = WithrottleEncoder(logger=self)
         self.fastclock_send_after_message = None
         self.roster_locos = []
         self.roster_locos_by_name = {}
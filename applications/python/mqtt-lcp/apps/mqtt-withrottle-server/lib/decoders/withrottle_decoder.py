@@ -55,8 +55,9 @@ PORT_SEP = ":"
 class WithrottleDecoder:
     """ decode withrottle messages """
 
-    def __init__(self, log_queue=None):
-        self.log_queue = log_queue
+    def __init__(self, logger=None):
+        # process whose log_* methods are used, they apply its log level
+        self.logger = logger
 
     def __repr__(self):
         # return "%s(%r)" % (self.__class__, self.__dict__)
@@ -65,9 +66,7 @@ class WithrottleDecoder:
 
     def decode_message(self, message, source=Global.CLIENT):
         """ parse a withtottle command """
-        self.log_queue.put(
-            (Global.LOG_LEVEL_DEBUG,
-             "Decode: [" + str(source) + "] ... [" + str(message) + "]"))
+        self.logger.log_debug("Decode: [%s] ... [%s]", source, message)
         rett = {Global.COMMAND: Global.UNKNOWN, Global.TEXT: str(message)}
         # print(">>> Decode: " + str(message))
         in_message = message.strip()
@@ -138,13 +137,12 @@ class WithrottleDecoder:
             elif first_byte == "Q":
                 rett = self.decode_quit_command(command, command_parts)
             else:
-                self.log_queue.put(
-                    (Global.LOG_LEVEL_WARNING, "!!! Unrecognized Command[" +
-                     str(command) + "]...[" + str(command_parts) + "]"))
+                self.logger.log_warning("!!! Unrecognized Command[%s]...[%s]",
+                                        command, command_parts)
                 rett = GuiMessage()
                 rett.command = Global.UNKNOWN
                 rett.text = message
-        self.log_queue.put((Global.LOG_LEVEL_DEBUG, " .... : " + str(rett)))
+        self.logger.log_debug(" .... : %s", rett)
         return rett
 
     def decode_roster_list_command(self, _command, command_parts):
@@ -428,7 +426,7 @@ class WithrottleDecoder:
                 fast_time = datetime.datetime.fromtimestamp(
                     int(clock_epoch_seconds)).isoformat()
             except Exception as ex:
-                self.log_queue.put(("warning", "Fastclock exception: " + ex))
+                self.logger.log_warning("Fastclock exception: %s", ex)
         fastclock_command = GuiMessage()
         fastclock_command.command = Global.FASTCLOCK
         fastclock_command.value = clock_epoch_seconds
@@ -38,8 +38,9 @@ from utils.withrottle_const import WithrottleConst
 
 class WithrottleEncoder:
     """ encode withrottle messages """
-    def __init__(self, log_queue=None):
-        self.log_queue = log_queue
+    def __init__(self, logger=None):
+        # process whose log_* methods are used, they apply its log level
+        self.logger = logger
 
     def __repr__(self):
         # return "%s(%r)" % (self.__class__, self.__dict__)
@@ -48,9 +49,7 @@ class WithrottleEncoder:
 
     def encode_message(self, message, source=Global.CLIENT):
         """ parse a withtottle command """
-        self.log_queue.put(
-            (Global.LOG_LEVEL_DEBUG,
-             "Encode: [" + str(message) + "]"))
+        self.logger.log_debug("Encode: [%s]", message)
         rett = {Global.COMMAND: Global.UNKNOWN, Global.TEXT: str(message)}
         if message:
             command = message.command
@@ -98,11 +97,8 @@ class WithrottleEncoder:
             elif command == Global.DISCONNECT:
                 rett = self.encode_quit_command(message)
             else:
-                self.log_queue.put(
-                    (Global.LOG_LEVEL_WARNING,
-                     "!!! Unrecognized Command[" + str(command)))
-        self.log_queue.put(
-            (Global.LOG_LEVEL_DEBUG, " .. : [" + str(rett) + "]"))
+                self.logger.log_warning("!!! Unrecognized Command[%s", command)
+        self.logger.log_debug(" .. : [%s]", rett)
         return rett
 
     def encode_roster_list_command(self, message):
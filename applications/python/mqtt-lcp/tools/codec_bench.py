@@ -0,0 +1,156 @@
+#!/usr/bin/python3
+# codec_bench.py
+"""
+
+codec_bench.py - micro benchmarks of mqtt message encoding and parsing
+
+    Run from the bin folder of any application so its lib is used:
+
+        cd mqtt-dcc-command/bin
+        python3 ../../../tools/codec_bench.py iodata --messages 20000
+
+    iodata: IoData encode and parse operations per second for request, response
+            and data messages, against plain json.dumps/json.loads of the same
+            bodies, and the memory of one IoData against the same attributes
+            kept in an instance dict as the class did before __slots__
+
+The MIT License (MIT)
+
+Copyright 2023 richard p hughes
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+and associated documentation files (the "Software"), to deal in the Software without restriction,
+including without limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom the Software
+is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies
+or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+
+import sys
+
+sys.path.append('../lib')
+
+import argparse
+import json
+import time
+import tracemalloc
+
+from utils.global_constants import Global
+from structs.io_data import IoData, IO_DATA_ATTRIBUTES
+
+# objects allocated to measure the memory of one
+MEMORY_SAMPLE = 1000
+
+
+class DictIoData(object):
+    """ the IoData attributes in an instance dict, as before __slots__ """
+
+    def __init__(self):
+        for attribute in IO_DATA_ATTRIBUTES:
+            setattr(self, attribute, None)
+
+    def __repr__(self):
+        # return "%s(%r)" % (self.__class__, self.__dict__)
+        fdict = repr(self.__dict__)
+        return f"{self.__class__}({fdict})"
+
+
+def sample_messages():
+    """ (topic, io data) of typical request, response and data messages """
+    request = IoData()
+    request.mqtt_message_root = Global.CAB
+    request.mqtt_node_id = "throttle-1"
+    request.mqtt_throttle_id = "throttle-1"
+    request.mqtt_cab_id = "cab-1"
+    request.mqtt_loco_id = 3001
+    request.mqtt_desired = {Global.SPEED: 42}
+    request.mqtt_respond_to = "cmd/mqtt-lcp/node/throttle-1/res"
+    request.mqtt_session_id = "REQ:1700000000000"
+    request.mqtt_version = "1.0"
+    request.mqtt_timestamp = 1700000000000
+    response = IoData()
+    response.mqtt_message_root = Global.SWITCH
+    response.mqtt_node_id = "tower"
+    response.mqtt_port_id = "switch-1"
+    response.mqtt_desired = Global.THROWN
+    response.mqtt_reported = Global.THROWN
+    response.mqtt_session_id = "REQ:1700000000000"
+    response.mqtt_version = "1.0"
+    response.mqtt_timestamp = 1700000000000
+    data = IoData()
+    data.mqtt_message_root = Global.SENSOR
+    data.mqtt_node_id = "i2c-1"
+    data.mqtt_port_id = "sensor-12"
+    data.mqtt_reported = Global.ON
+    data.mqtt_version = "1.0"
+    data.mqtt_timestamp = 1700000000000
+    data.mqtt_metadata = {Global.TYPE: Global.SENSOR}
+    return [("cmd/mqtt-lcp/cab/cab-1/req", request),
+            ("cmd/mqtt-lcp/node/tower/res", response),
+            ("dt/mqtt-lcp/sensor/i2c-1/sensor-12", data)]
+
+
+def ops_per_second(function, count):
+    """ calls of function per second """
+    start = time.perf_counter()
+    for _i in range(count):
+        function()
+    return count / (time.perf_counter() - start)
+
+
+def bytes_per_object(factory):
+    """ memory allocated per object made by factory, including its dict """
+    keep = []
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for _i in range(MEMORY_SAMPLE):
+        keep.append(factory())
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # the list itself is a small part of the total
+    return (after - before) // len(keep)
+
+
+def bench_iodata(args):
+    """ encode, parse and memory of IoData """
+    reversed_globals = Global.generate_reversed_list()
+    print(f"{'message':<40} {'encode/s':>10} {'dumps/s':>10}"
+          f" {'parse/s':>10} {'loads/s':>10}")
+    for (topic, io_data) in sample_messages():
+        body = io_data.encode_mqtt_message()
+        body_map = io_data.encode_mqtt_map()
+        encode = ops_per_second(io_data.encode_mqtt_message, args.messages)
+        dumps = ops_per_second(lambda: json.dumps(body_map), args.messages)
+        parse = ops_per_second(
+            lambda: IoData.parse_mqtt_mesage(topic, body, reversed_globals),
+            args.messages)
+        loads = ops_per_second(lambda: json.loads(body), args.messages)
+        print(f"{topic:<40} {encode:>10.0f} {dumps:>10.0f}"
+              f" {parse:>10.0f} {loads:>10.0f}")
+    print(f"bytes per IoData: {bytes_per_object(IoData)}")
+    print(f"bytes per IoData with instance dict: "
+          f"{bytes_per_object(DictIoData)}")
+
+
+def main():
+    """ run a benchmark """
+    parser = argparse.ArgumentParser(description="message codec benchmarks")
+    parser.add_argument("bench", choices=["iodata"])
+    parser.add_argument("--messages", type=int, default=20000,
+                        help="messages encoded and parsed per measurement")
+    args = parser.parse_args()
+    if args.bench == "iodata":
+        bench_iodata(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,536 @@
+#!/usr/bin/python3
+# mqtt_bench.py
+"""
+
+mqtt_bench.py - end to end latency benchmarks against a local broker
+
+    The real processes of an application are started against
+    tools/mqtt_broker.py on localhost, no network or layout hardware is needed.
+    Requests are published by a paho client, latencies are reported as
+    percentiles. Exits with status 1 if any request was not answered.
+
+    Run from the bin folder of the application so its config and lib are used:
+
+        cd mqtt-dcc-command/bin
+        python3 ../../../tools/mqtt_bench.py throttle --throttles 8 --requests 50
+        python3 ../../../tools/mqtt_bench.py throttle --rate 50 --requests 50
+
+        cd mqtt-tower/bin
+        python3 ../../../tools/mqtt_bench.py signal --requests 200
+
+    throttle: cab speed requests, from publish to the <t ...> command written to
+              a fake dcc++ command station on a pty, and to the mqtt response,
+              with --rate throttles send like a turning knob, see how many
+              commands reach the command station
+    signal:   block data changes, from publish to the signal change request
+              published by the tower
+
+The MIT License (MIT)
+
+Copyright 2023 richard p hughes
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+and associated documentation files (the "Software"), to deal in the Software without restriction,
+including without limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom the Software
+is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies
+or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+
+import os
+import sys
+
+sys.path.append('../lib')
+sys.path.append(os.getcwd())
+
+import argparse
+import json
+import pty
+import shutil
+import tempfile
+import threading
+import time
+import tty
+from multiprocessing import Event
+from queue import Empty
+
+import paho.mqtt.client as mqtt
+
+from utils.config_utils import ConfigUtils
+from utils.global_constants import Global
+from structs.io_data import IoData
+
+from mqtt_broker import MqttBroker
+from mqtt_replay import ReplayQueues, start_processes, stop_processes, \
+    report_latencies
+
+# seconds to wait for one response before it is counted as unanswered
+RESPONSE_WAIT = 5
+# seconds to wait for the processes to answer their first request
+WARM_UP_WAIT = 30
+# node id of the benchmark client
+BENCH_NODE = "mqtt-bench"
+# responses to benchmark requests are published to this topic
+BENCH_RESPOND_TO = "cmd/mqtt-lcp/node/" + BENCH_NODE + "/res"
+# dcc address of the loco of the first throttle, one loco per throttle
+FIRST_LOCO = 3001
+# seconds the fake command station takes to act on a command
+STATION_DELAY = 0.002
+# block and signal used by the signal benchmark
+BENCH_BLOCK = "bench-block"
+BENCH_SIGNAL = "bench-signal"
+
+THROTTLE_PROCESSES = ["processes.mqtt_process:MqttProcess",
+                      "app_process:AppProcess",
+                      "cab_process:CabProcess",
+                      "dccpp_driver:DccppDriver",
+                      "processes.serial_process:SerialProcess"]
+
+SIGNAL_PROCESSES = ["processes.mqtt_process:MqttProcess",
+                    "app_process:AppProcess",
+                    "inventory_process:InventoryProcess"]
+
+
+class BenchClient(object):
+    """ paho client, publishes requests and waits for their answers """
+
+    def __init__(self, port):
+        self.lock = threading.Lock()
+        # session id or topic -> [event, time answered]
+        self.waiting = {}
+        self.next_session = 0
+        self.client = mqtt.Client(BENCH_NODE)
+        self.client.on_message = self.__message_cb
+        self.client.connect("127.0.0.1", port)
+        self.client.loop_start()
+
+    def __repr__(self):
+        # return "%s(%r)" % (self.__class__, self.__dict__)
+        fdict = repr(self.__dict__)
+        return f"{self.__class__}({fdict})"
+
+    def subscribe(self, topic):
+        """ subscribe to answers """
+        self.client.subscribe(topic)
+
+    def new_session_id(self):
+        """ a unique session id for a request """
+        with self.lock:
+            self.next_session += 1
+            return "bench:" + str(self.next_session)
+
+    def publish(self, topic, io_data, answer_key):
+        """ publish a message, returns (time published, waiter) to
+            wait for the answer with answer key """
+        waiter = [threading.Event(), None]
+        with self.lock:
+            self.waiting[answer_key] = waiter
+        sent = time.perf_counter()
+        self.client.publish(topic, io_data.encode_mqtt_message())
+        return (sent, waiter)
+
+    def wait_answer(self, answer_key, waiter, wait=RESPONSE_WAIT):
+        """ wait for an answer, returns time answered or None """
+        waiter[0].wait(wait)
+        with self.lock:
+            self.waiting.pop(answer_key, None)
+        return waiter[1]
+
+    def publish_and_wait(self, topic, io_data, answer_key, wait=RESPONSE_WAIT):
+        """ publish a message, wait for the answer with answer key,
+            returns (time published, time answered or None) """
+        (sent, waiter) = self.publish(topic, io_data, answer_key)
+        return (sent, self.wait_answer(answer_key, waiter, wait))
+
+    def stop(self):
+        """ disconnect from the broker """
+        self.client.loop_stop()
+        self.client.disconnect()
+
+    def __message_cb(self, _client, _userdata, message):
+        """ an answer has been received """
+        answered = time.perf_counter()
+        try:
+            body = json.loads(message.payload)
+            body = list(body.values())[0]
+            answer_key = body.get(Global.SESSION_ID, None)
+        except (ValueError, AttributeError, IndexError):
+            answer_key = None
+        with self.lock:
+            waiter = self.waiting.get(answer_key, None)
+            if waiter is None:
+                waiter = self.waiting.get(message.topic, None)
+            if waiter is not None and waiter[1] is None:
+                waiter[1] = answered
+                waiter[0].set()
+
+
+class FakeCommandStation(object):
+    """ dcc++ command station on a pty, answers <t ...> commands """
+
+    def __init__(self):
+        (self.master, slave) = pty.openpty()
+        tty.setraw(self.master)
+        tty.setraw(slave)
+        self.port_name = os.ttyname(slave)
+        self.lock = threading.Lock()
+        # (time received, dcc id) of each <t ...> command
+        self.throttle_commands = []
+        self.thread = threading.Thread(target=self.__run, daemon=True)
+        self.thread.start()
+
+    def __repr__(self):
+        # return "%s(%r)" % (self.__class__, self.__dict__)
+        fdict = repr(self.__dict__)
+        return f"{self.__class__}({fdict})"
+
+    def first_command_time(self, dcc_id, after):
+        """ time the first <t ...> command for loco was received after a time,
+            speeds are scaled by the driver so they are not compared """
+        with self.lock:
+            for (received, command_dcc_id) in self.throttle_commands:
+                if received >= after and command_dcc_id == dcc_id:
+                    return received
+        return None
+
+    def last_command_time(self, dcc_id):
+        """ time the last <t ...> command for loco was received """
+        rett = None
+        with self.lock:
+            for (received, command_dcc_id) in self.throttle_commands:
+                if command_dcc_id == dcc_id:
+                    rett = received
+        return rett
+
+    def command_count(self, after):
+        """ number of <t ...> commands received after a time """
+        with self.lock:
+            return len([received for (received, _dcc_id)
+                        in self.throttle_commands if received >= after])
+
+    def __run(self):
+        """ read commands, answer throttle and power commands """
+        buffer = b""
+        while True:
+            buffer += os.read(self.master, 4096)
+            while b"\n" in buffer:
+                (line, buffer) = buffer.split(b"\n", 1)
+                received = time.perf_counter()
+                command = line.strip().decode(errors="replace")
+                time.sleep(STATION_DELAY)
+                if command.startswith("<t "):
+                    (_t, register, dcc_id, speed, direction) = \
+                        command[1:-1].split(" ")
+                    with self.lock:
+                        self.throttle_commands.append(
+                            (received, int(dcc_id)))
+                    os.write(self.master, f"<T {register} {speed} {direction}>\r\n".encode())
+                elif command in ("<0>", "<1>"):
+                    os.write(self.master, f"<p{command[1]}>\r\n".encode())
+
+
+def load_bench_config(broker_port, io_changes=None, option_changes=None):
+    """ load the app config and point it at the local broker, processes
+        created later in this program get the changed config """
+    ConfigUtils.load_config()
+    config = ConfigUtils.config[Global.CONFIG]
+    mqtt_config = config[Global.IO][Global.MQTT]
+    mqtt_config[Global.BROKER] = "127.0.0.1"
+    mqtt_config[Global.PORT] = broker_port
+    for (io_key, io_change) in (io_changes or {}).items():
+        config[Global.IO].setdefault(io_key, {}).update(io_change)
+    config.setdefault(Global.OPTIONS, {}).update(option_changes or {})
+    return config
+
+
+def drain_log_queue(queues, running):
+    """ keep the log queue from growing, no log process is started """
+    log_queue = queues[Global.LOGGER]
+    while running.is_set():
+        try:
+            log_queue.get(True, 0.1)
+        except Empty:
+            pass
+
+
+def cab_request(throttle_number, session_id, desired):
+    """ a cab request from a throttle """
+    body = IoData()
+    body.mqtt_message_root = Global.CAB
+    body.mqtt_node_id = BENCH_NODE
+    body.mqtt_throttle_id = "throttle-" + str(throttle_number)
+    body.mqtt_cab_id = "cab-" + str(throttle_number)
+    body.mqtt_loco_id = FIRST_LOCO + throttle_number
+    body.mqtt_desired = desired
+    body.mqtt_respond_to = BENCH_RESPOND_TO
+    body.mqtt_session_id = session_id
+    body.mqtt_timestamp = int(time.time() * 1000)
+    body.mqtt_version = "1.0"
+    return body
+
+
+def run_throttle(client, topic, station, throttle_number, requests, results):
+    """ one throttle: connect, acquire its loco then change speed,
+        each request is sent after the previous one is answered """
+    dcc_id = FIRST_LOCO + throttle_number
+    acquire_loco(client, topic, throttle_number)
+    for request in range(requests):
+        speed = request % 126 + 1
+        session_id = client.new_session_id()
+        (sent, answered) = client.publish_and_wait(
+            topic, cab_request(throttle_number, session_id,
+                               {Global.SPEED: speed}), session_id)
+        written = station.first_command_time(dcc_id, sent)
+        results.append((sent, written, answered))
+
+
+def run_knob(client, topic, station, throttle_number, requests, rate,
+             results, finals):
+    """ one throttle turning a knob: speed requests are sent at rate per
+        second without waiting for answers, finals gets the time from the
+        last request to the last command written for the loco """
+    dcc_id = FIRST_LOCO + throttle_number
+    acquire_loco(client, topic, throttle_number)
+    waiting = []
+    started = time.perf_counter()
+    for request in range(requests):
+        time.sleep(max(0, started + request / rate - time.perf_counter()))
+        session_id = client.new_session_id()
+        (sent, waiter) = client.publish(
+            topic, cab_request(throttle_number, session_id,
+                               {Global.SPEED: request % 100 + 1}), session_id)
+        waiting.append((session_id, sent, waiter))
+    for (session_id, sent, waiter) in waiting:
+        results.append((sent, None, client.wait_answer(session_id, waiter)))
+    written = station.last_command_time(dcc_id)
+    if written is not None and written >= waiting[-1][1]:
+        finals.append(written - waiting[-1][1])
+
+
+def acquire_loco(client, topic, throttle_number):
+    """ connect a throttle and acquire its loco """
+    for desired in (Global.CONNECT, Global.ACQUIRE):
+        session_id = client.new_session_id()
+        client.publish_and_wait(
+            topic, cab_request(throttle_number, session_id, desired),
+            session_id)
+
+
+def bench_throttle(args):
+    """ throttle speed requests through mqtt-dcc-command to a pty """
+    broker = MqttBroker(port=0)
+    broker_port = broker.start_in_thread()
+    station = FakeCommandStation()
+    # open the pty by name, not by usb ids
+    serial_changes = {Global.PORT: station.port_name,
+                      Global.USB + "-" + Global.VENDOR + "-" + Global.ID: None,
+                      Global.USB + "-" + Global.PRODUCT + "-" + Global.ID: None}
+    config = load_bench_config(
+        broker_port, io_changes={Global.SERIAL: serial_changes},
+        option_changes={Global.MAX_LOCOS: max(32, args.throttles)})
+    topic = config[Global.IO][Global.MQTT][Global.SUB_TOPICS][Global.CAB]
+    topic = topic.replace("**node**", config[Global.NODE][Global.NAME])
+    topic = topic.replace("/#", "/" + Global.REQ)
+    events = {Global.SHUTDOWN: Event(), Global.RESTART: Event()}
+    queues = ReplayQueues()
+    running = threading.Event()
+    running.set()
+    threading.Thread(target=drain_log_queue, args=(queues, running),
+                     daemon=True).start()
+    processes = start_processes(THROTTLE_PROCESSES, events, queues)
+    client = BenchClient(broker_port)
+    client.subscribe(BENCH_RESPOND_TO)
+    unanswered = 1
+    if warm_up(client, topic):
+        results = []
+        finals = []
+        if args.rate:
+            threads = [threading.Thread(target=run_knob,
+                                        args=(client, topic, station, number,
+                                              args.requests, args.rate,
+                                              results, finals))
+                       for number in range(1, args.throttles + 1)]
+        else:
+            threads = [threading.Thread(target=run_throttle,
+                                        args=(client, topic, station, number,
+                                              args.requests, results))
+                       for number in range(1, args.throttles + 1)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        print(f"throttles: {args.throttles}, speed requests: {len(results)}"
+              f" in {elapsed:.2f} s, {len(results) / elapsed:.0f} per s")
+        if args.rate:
+            print(f"throttle commands written: {station.command_count(started)}")
+            report_latencies("last request to last serial write",
+                             args.throttles, finals)
+        else:
+            report_latencies("publish to serial write", len(results),
+                             [written - sent for (sent, written, _answered)
+                              in results if written is not None])
+        unanswered = report_latencies(
+            "publish to response", len(results),
+            [answered - sent for (sent, _written, answered)
+             in results if answered is not None])
+    client.stop()
+    running.clear()
+    stop_processes(processes, events)
+    broker.stop()
+    return unanswered
+
+
+def warm_up(client, topic):
+    """ repeat a throttle connect until processes are subscribed and answer """
+    deadline = time.perf_counter() + WARM_UP_WAIT
+    while time.perf_counter() < deadline:
+        session_id = client.new_session_id()
+        (_sent, answered) = client.publish_and_wait(
+            topic, cab_request(0, session_id, Global.CONNECT), session_id, 1)
+        if answered is not None:
+            return True
+    print("no response from processes, benchmark not run")
+    return False
+
+
+def write_signal_rules(data_path):
+    """ a signal that is clear when the block is clear, else approach """
+    rules_path = os.path.join(data_path, "signal-rules")
+    os.makedirs(rules_path)
+    signal_rules = {
+        Global.GROUP: Global.SIGNAL,
+        Global.PORT_ID: BENCH_SIGNAL,
+        Global.BLOCK_ID: BENCH_BLOCK,
+        Global.RULES: {
+            Global.CLEAR: {"1": [{Global.GROUP: Global.BLOCK,
+                                  Global.PORT_ID: BENCH_BLOCK,
+                                  Global.STATE: Global.CLEAR}]},
+            Global.APPROACH: {"1": [{Global.GROUP: Global.BLOCK,
+                                     Global.PORT_ID: BENCH_BLOCK,
+                                     Global.STATE: Global.OCCUPIED}]}}}
+    with open(os.path.join(rules_path, BENCH_SIGNAL + ".json"), "w",
+              encoding="utf-8") as rules_file:
+        json.dump(signal_rules, rules_file)
+
+
+def inventory_response(signal_topic):
+    """ inventory of the benchmark node: one block and one signal """
+    body = IoData()
+    body.mqtt_message_root = Global.TOWER
+    body.mqtt_node_id = BENCH_NODE
+    body.mqtt_port_id = Global.INVENTORY
+    body.mqtt_desired = Global.REPORT
+    body.mqtt_reported = Global.REPORT
+    body.mqtt_version = "1.0"
+    body.mqtt_metadata = {Global.INVENTORY: {
+        Global.BLOCK: [{Global.NODE_ID: BENCH_NODE,
+                        Global.PORT_ID: BENCH_BLOCK}],
+        Global.SIGNAL: [{Global.NODE_ID: BENCH_NODE,
+                         Global.PORT_ID: BENCH_SIGNAL,
+                         Global.COMMAND_TOPIC: signal_topic}]}}
+    return body
+
+
+def block_data(reported):
+    """ a block sensor data message """
+    body = IoData()
+    body.mqtt_message_root = Global.BLOCK
+    body.mqtt_node_id = BENCH_NODE
+    body.mqtt_port_id = BENCH_BLOCK
+    body.mqtt_reported = reported
+    body.mqtt_timestamp = int(time.time() * 1000)
+    body.mqtt_version = "1.0"
+    return body
+
+
+def bench_signal(args):
+    """ block changes through mqtt-tower to signal requests """
+    broker = MqttBroker(port=0)
+    broker_port = broker.start_in_thread()
+    data_path = tempfile.mkdtemp(prefix="mqtt-bench-")
+    write_signal_rules(data_path)
+    config = load_bench_config(broker_port, option_changes={
+        Global.DATA_PATH: data_path, Global.BACKUP_PATH: data_path})
+    node_name = config[Global.NODE][Global.NAME]
+    inventory_topic = config[Global.IO][Global.MQTT][Global.SUB_TOPICS][
+        Global.TOWER].replace("**node**", node_name).replace(
+            "/#", "/" + Global.INVENTORY + "/" + Global.RES)
+    block_topic = "dt/mqtt-lcp/block/" + BENCH_NODE + "/" + BENCH_BLOCK
+    signal_topic = "cmd/mqtt-lcp/signal/" + BENCH_NODE + "/" + \
+        BENCH_SIGNAL + "/" + Global.REQ
+    events = {Global.SHUTDOWN: Event(), Global.RESTART: Event()}
+    queues = ReplayQueues()
+    running = threading.Event()
+    running.set()
+    threading.Thread(target=drain_log_queue, args=(queues, running),
+                     daemon=True).start()
+    processes = start_processes(SIGNAL_PROCESSES, events, queues)
+    client = BenchClient(broker_port)
+    client.subscribe(signal_topic)
+    # block state alternates, every change changes the signal aspect
+    states = (Global.OCCUPIED, Global.CLEAR)
+    warmed_up = False
+    deadline = time.perf_counter() + WARM_UP_WAIT
+    while not warmed_up and time.perf_counter() < deadline:
+        client.client.publish(inventory_topic,
+                              inventory_response(signal_topic).encode_mqtt_message())
+        time.sleep(0.2)
+        for state in states:
+            (_sent, answered) = client.publish_and_wait(
+                block_topic, block_data(state), signal_topic, 1)
+            warmed_up = warmed_up or answered is not None
+    unanswered = 1
+    if not warmed_up:
+        print("no response from processes, benchmark not run")
+    else:
+        latencies = []
+        started = time.perf_counter()
+        for request in range(args.requests):
+            (sent, answered) = client.publish_and_wait(
+                block_topic, block_data(states[request % 2]), signal_topic)
+            if answered is not None:
+                latencies.append(answered - sent)
+        elapsed = time.perf_counter() - started
+        print(f"block changes: {args.requests} in {elapsed:.2f} s")
+        unanswered = report_latencies("block data to signal request",
+                                      args.requests, latencies)
+    client.stop()
+    running.clear()
+    stop_processes(processes, events)
+    broker.stop()
+    shutil.rmtree(data_path, ignore_errors=True)
+    return unanswered
+
+
+def main():
+    """ parse arguments and run a benchmark """
+    parser = argparse.ArgumentParser(description="end to end mqtt benchmarks")
+    parser.add_argument("bench", choices=["throttle", "signal"])
+    parser.add_argument("--requests", type=int, default=50,
+                        help="requests per throttle, or block changes")
+    parser.add_argument("--throttles", type=int, default=4,
+                        help="throttles sending requests at the same time")
+    parser.add_argument("--rate", type=float, default=0,
+                        help="speed requests per second of each throttle, "
+                        "sent without waiting for answers, 0 waits for each")
+    args = parser.parse_args()
+    if args.bench == "throttle":
+        unanswered = bench_throttle(args)
+    else:
+        unanswered = bench_signal(args)
+    sys.exit(1 if unanswered else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,459 @@
+#!/usr/bin/python3
+# mqtt_broker.py
+"""
+
+mqtt_broker.py - small in-process MQTT 3.1.1 broker for local testing
+
+    A pure python asyncio broker that paho clients can connect to. Supports
+    QoS 0, 1 and 2 publishing (delivered to subscribers at QoS 0 or 1),
+    + and # wildcards, retained messages, will messages and keep alive.
+    Any user name and password is accepted, nothing is persisted.
+
+    Used with tools/mqtt_replay.py (broker mode) and mqtt-lcp applications to
+    measure performance on one machine without a network or a real broker:
+
+        python3 mqtt_broker.py --port 1883
+
+    or from python, running in a background thread:
+
+        broker = MqttBroker(port=0)
+        port = broker.start_in_thread()
+        ...
+        broker.stop()
+
+The MIT License (MIT)
+
+Copyright 2023 richard p hughes
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+and associated documentation files (the "Software"), to deal in the Software without restriction,
+including without limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom the Software
+is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies
+or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+
+import argparse
+import asyncio
+import struct
+import threading
+
+# control packet types
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+PUBREC = 5
+PUBREL = 6
+PUBCOMP = 7
+SUBSCRIBE = 8
+SUBACK = 9
+UNSUBSCRIBE = 10
+UNSUBACK = 11
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+CONNACK_ACCEPTED = 0
+CONNACK_BAD_PROTOCOL = 1
+SUBACK_FAILURE = 0x80
+
+MAX_QOS = 1
+
+
+class ProtocolError(Exception):
+    """ client sent something that is not valid mqtt """
+
+
+def topic_matches(topic_filter, topic):
+    """ does a topic match a subscription filter with + and # wildcards """
+    filter_parts = topic_filter.split("/")
+    topic_parts = topic.split("/")
+    if topic_parts[0].startswith("$") and \
+            filter_parts[0] in ("+", "#"):
+        return False
+    for index, filter_part in enumerate(filter_parts):
+        if filter_part == "#":
+            return True
+        if index >= len(topic_parts):
+            return False
+        if filter_part not in ("+", topic_parts[index]):
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+
+def valid_topic_filter(topic_filter):
+    """ check wildcards are used correctly in a subscription filter """
+    if not topic_filter:
+        return False
+    parts = topic_filter.split("/")
+    for index, part in enumerate(parts):
+        if "#" in part and (part != "#" or index != len(parts) - 1):
+            return False
+        if "+" in part and part != "+":
+            return False
+    return True
+
+
+def encode_string(value):
+    """ length prefixed utf-8 string """
+    data = value.encode("utf-8")
+    return struct.pack(">H", len(data)) + data
+
+
+def encode_packet(packet_type, flags, body):
+    """ fixed header with variable length remaining length """
+    length = len(body)
+    header = bytearray([(packet_type << 4) | flags])
+    while True:
+        byte = length % 128
+        length //= 128
+        if length > 0:
+            byte |= 0x80
+        header.append(byte)
+        if length == 0:
+            break
+    return bytes(header) + body
+
+
+class PacketReader(object):
+    """ read fields from a packet body """
+
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+
+    def __repr__(self):
+        # return "%s(%r)" % (self.__class__, self.__dict__)
+        fdict = repr(self.__dict__)
+        return f"{self.__class__}({fdict})"
+
+    def remaining(self):
+        """ bytes not yet read """
+        return len(self.data) - self.offset
+
+    def read_byte(self):
+        """ read one byte """
+        if self.remaining() < 1:
+            raise ProtocolError("packet too short")
+        value = self.data[self.offset]
+        self.offset += 1
+        return value
+
+    def read_short(self):
+        """ read a two byte integer """
+        if self.remaining() < 2:
+            raise ProtocolError("packet too short")
+        (value,) = struct.unpack_from(">H", self.data, self.offset)
+        self.offset += 2
+        return value
+
+    def read_bytes(self):
+        """ read length prefixed bytes """
+        length = self.read_short()
+        if self.remaining() < length:
+            raise ProtocolError("packet too short")
+        value = self.data[self.offset:self.offset + length]
+        self.offset += length
+        return value
+
+    def read_string(self):
+        """ read length prefixed utf-8 string """
+        try:
+            return self.read_bytes().decode("utf-8")
+        except UnicodeDecodeError as exc:
+            raise ProtocolError("bad utf-8 string") from exc
+
+    def read_rest(self):
+        """ read the remaining bytes """
+        value = self.data[self.offset:]
+        self.offset = len(self.data)
+        return value
+
+
+class MqttSession(object):
+    """ one connected client """
+
+    def __init__(self, broker, reader, writer):
+        self.broker = broker
+        self.reader = reader
+        self.writer = writer
+        self.client_id = None
+        self.keep_alive = 0
+        self.will = None
+        # topic filter -> granted qos
+        self.subscriptions = {}
+        self.next_packet_id = 0
+        # qos 2 packet ids received but not yet released
+        self.pending_releases = set()
+
+    def __repr__(self):
+        return f"{self.__class__}({self.client_id})"
+
+    async def run(self):
+        """ read and handle packets until client disconnects """
+        try:
+            (packet_type, flags, body) = await self.__read_packet(None)
+            if packet_type != CONNECT:
+                raise ProtocolError("first packet must be connect")
+            await self.__handle_connect(body)
+            while True:
+                timeout = self.keep_alive * 1.5 if self.keep_alive else None
+                (packet_type, flags, body) = await self.__read_packet(timeout)
+                if packet_type == DISCONNECT:
+                    self.will = None
+                    break
+                await self.__handle_packet(packet_type, flags, body)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError,
+                ConnectionError, ProtocolError):
+            pass
+        finally:
+            self.broker.remove_session(self)
+            if self.will is not None:
+                (topic, payload, qos, retain) = self.will
+                self.broker.publish(topic, payload, qos, retain)
+            self.writer.close()
+
+    def deliver(self, topic, payload, qos, retain=False):
+        """ send a published message to this client """
+        flags = (qos << 1) | (1 if retain else 0)
+        body = encode_string(topic)
+        if qos > 0:
+            self.next_packet_id = self.next_packet_id % 65535 + 1
+            body += struct.pack(">H", self.next_packet_id)
+        self.writer.write(encode_packet(PUBLISH, flags, body + payload))
+
+    def granted_qos(self, topic):
+        """ highest qos of subscriptions matching a topic, None if none """
+        granted = None
+        for topic_filter, qos in self.subscriptions.items():
+            if topic_matches(topic_filter, topic):
+                if granted is None or qos > granted:
+                    granted = qos
+        return granted
+
+    async def __read_packet(self, timeout):
+        """ read one control packet """
+        first = await asyncio.wait_for(self.reader.readexactly(1), timeout)
+        length = 0
+        multiplier = 1
+        for _i in range(4):
+            byte = (await self.reader.readexactly(1))[0]
+            length += (byte & 0x7f) * multiplier
+            multiplier *= 128
+            if not byte & 0x80:
+                break
+        else:
+            raise ProtocolError("bad remaining length")
+        body = await self.reader.readexactly(length)
+        return (first[0] >> 4, first[0] & 0x0f, body)
+
+    async def __handle_connect(self, body):
+        """ handle connect packet """
+        packet = PacketReader(body)
+        protocol_name = packet.read_string()
+        protocol_level = packet.read_byte()
+        if protocol_name not in ("MQTT", "MQIsdp") or \
+                protocol_level not in (3, 4):
+            self.writer.write(
+                encode_packet(CONNACK, 0, bytes([0, CONNACK_BAD_PROTOCOL])))
+            raise ProtocolError("unsupported protocol")
+        connect_flags = packet.read_byte()
+        self.keep_alive = packet.read_short()
+        self.client_id = packet.read_string()
+        if connect_flags & 0x04:
+            will_topic = packet.read_string()
+            will_payload = packet.read_bytes()
+            self.will = (will_topic, will_payload, (connect_flags >> 3) & 0x03,
+                         bool(connect_flags & 0x20))
+        # user name and password are not checked
+        self.broker.add_session(self)
+        self.writer.write(
+            encode_packet(CONNACK, 0, bytes([0, CONNACK_ACCEPTED])))
+        await self.writer.drain()
+
+    async def __handle_packet(self, packet_type, flags, body):
+        """ handle packets after connect """
+        packet = PacketReader(body)
+        if packet_type == PUBLISH:
+            qos = (flags >> 1) & 0x03
+            retain = bool(flags & 0x01)
+            topic = packet.read_string()
+            packet_id = packet.read_short() if qos > 0 else None
+            payload = packet.read_rest()
+            if qos == 2:
+                # deliver once, duplicates before release are ignored
+                if packet_id not in self.pending_releases:
+                    self.pending_releases.add(packet_id)
+                    self.broker.publish(topic, payload, qos, retain)
+                self.writer.write(
+                    encode_packet(PUBREC, 0, struct.pack(">H", packet_id)))
+            else:
+                self.broker.publish(topic, payload, qos, retain)
+                if qos == 1:
+                    self.writer.write(
+                        encode_packet(PUBACK, 0, struct.pack(">H", packet_id)))
+        elif packet_type == PUBREL:
+            packet_id = packet.read_short()
+            self.pending_releases.discard(packet_id)
+            self.writer.write(
+                encode_packet(PUBCOMP, 0, struct.pack(">H", packet_id)))
+        elif packet_type in (PUBACK, PUBCOMP):
+            pass
+        elif packet_type == PUBREC:
+            packet_id = packet.read_short()
+            self.writer.write(
+                encode_packet(PUBREL, 0x02, struct.pack(">H", packet_id)))
+        elif packet_type == SUBSCRIBE:
+            await self.__handle_subscribe(packet)
+        elif packet_type == UNSUBSCRIBE:
+            packet_id = packet.read_short()
+            while packet.remaining() > 0:
+                self.subscriptions.pop(packet.read_string(), None)
+            self.writer.write(
+                encode_packet(UNSUBACK, 0, struct.pack(">H", packet_id)))
+        elif packet_type == PINGREQ:
+            self.writer.write(encode_packet(PINGRESP, 0, b""))
+        else:
+            raise ProtocolError("unexpected packet type: " + str(packet_type))
+        await self.writer.drain()
+
+    async def __handle_subscribe(self, packet):
+        """ add subscriptions and send matching retained messages """
+        packet_id = packet.read_short()
+        return_codes = bytearray()
+        new_filters = []
+        while packet.remaining() > 0:
+            topic_filter = packet.read_string()
+            qos = min(packet.read_byte() & 0x03, MAX_QOS)
+            if valid_topic_filter(topic_filter):
+                self.subscriptions[topic_filter] = qos
+                new_filters.append((topic_filter, qos))
+                return_codes.append(qos)
+            else:
+                return_codes.append(SUBACK_FAILURE)
+        self.writer.write(
+            encode_packet(SUBACK, 0,
+                          struct.pack(">H", packet_id) + bytes(return_codes)))
+        for (topic_filter, qos) in new_filters:
+            for topic, (payload, retained_qos) in \
+                    self.broker.retained_messages.items():
+                if topic_matches(topic_filter, topic):
+                    self.deliver(topic, payload, min(qos, retained_qos), True)
+
+
+class MqttBroker(object):
+    """ mqtt broker serving clients on a local tcp port """
+
+    def __init__(self, host="127.0.0.1", port=1883):
+        self.host = host
+        self.port = port
+        self.sessions = {}
+        # topic -> (payload, qos)
+        self.retained_messages = {}
+        self.server = None
+        self.loop = None
+        self.thread = None
+        self.message_count = 0
+
+    def __repr__(self):
+        # return "%s(%r)" % (self.__class__, self.__dict__)
+        fdict = repr(self.__dict__)
+        return f"{self.__class__}({fdict})"
+
+    async def serve(self, started=None):
+        """ run the broker until cancelled """
+        self.server = await asyncio.start_server(self.__new_client, self.host,
+                                                 self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        if started is not None:
+            started.set()
+        async with self.server:
+            await self.server.serve_forever()
+
+    def start_in_thread(self):
+        """ run the broker in a background thread, returns port number """
+        started = threading.Event()
+        self.loop = asyncio.new_event_loop()
+
+        def run_loop():
+            asyncio.set_event_loop(self.loop)
+            try:
+                self.loop.run_until_complete(self.serve(started))
+            except asyncio.CancelledError:
+                pass
+
+        self.thread = threading.Thread(target=run_loop, daemon=True)
+        self.thread.start()
+        started.wait()
+        return self.port
+
+    def stop(self):
+        """ stop a broker started by start_in_thread """
+        if self.loop is not None and self.server is not None:
+            asyncio.run_coroutine_threadsafe(self.__close(),
+                                             self.loop).result(5)
+            self.thread.join(5)
+
+    def add_session(self, session):
+        """ a client has connected, replaces an older session of same id """
+        old_session = self.sessions.get(session.client_id, None)
+        if old_session is not None:
+            old_session.writer.close()
+        self.sessions[session.client_id] = session
+
+    def remove_session(self, session):
+        """ a client has disconnected """
+        if self.sessions.get(session.client_id, None) is session:
+            del self.sessions[session.client_id]
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        """ send a message to all matching subscribers """
+        self.message_count += 1
+        if retain:
+            if payload:
+                self.retained_messages[topic] = (payload, qos)
+            else:
+                self.retained_messages.pop(topic, None)
+        for session in list(self.sessions.values()):
+            granted = session.granted_qos(topic)
+            if granted is not None:
+                session.deliver(topic, payload, min(qos, granted))
+
+    async def __close(self):
+        """ disconnect all clients and stop serving """
+        for session in list(self.sessions.values()):
+            session.writer.close()
+        # let sessions see the disconnect before the server stops
+        await asyncio.sleep(0.1)
+        self.server.close()
+
+    async def __new_client(self, reader, writer):
+        """ handle a new client connection """
+        await MqttSession(self, reader, writer).run()
+
+
+def main():
+    """ run broker from command line """
+    parser = argparse.ArgumentParser(description="local mqtt 3.1.1 broker")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1883)
+    args = parser.parse_args()
+    broker = MqttBroker(args.host, args.port)
+    try:
+        asyncio.run(broker.serve())
+    except KeyboardInterrupt:
+        print(" ... Exiting.")
+
+
+if __name__ == "__main__":
+    main()
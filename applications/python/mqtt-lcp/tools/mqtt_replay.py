@@ -0,0 +1,357 @@
+#!/usr/bin/python3
+# mqtt_replay.py
+"""
+
+mqtt_replay.py - replay recorded mqtt traffic for load testing
+
+    Messages recorded by MqttProcess (io.mqtt "record-path" in config) as received
+    from the broker are replayed at their original pace, N times faster or as fast
+    as possible. Requests are matched to their responses by session id, or by
+    respond-to topic, to report end to end latency percentiles.
+
+    Run from the bin folder of an application so its config and lib are used:
+
+        cd mqtt-tower/bin
+        python3 ../../../tools/mqtt_replay.py analyze <capture files>
+        python3 ../../../tools/mqtt_replay.py broker --speed 10 <capture files>
+        python3 ../../../tools/mqtt_replay.py queue --speed 0 \\
+            --process app_process:AppProcess \\
+            --process inventory_process:InventoryProcess <capture files>
+
+    analyze: report latencies of the traffic as it was recorded
+    broker:  publish to the broker in the application config, or --broker host,
+             tools/mqtt_broker.py can be used as a local broker
+    queue:   start the given processes of the application and put messages
+             directly on their application queue, responses are read from
+             their mqtt queue, no broker is needed
+
+The MIT License (MIT)
+
+Copyright 2023 richard p hughes
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+and associated documentation files (the "Software"), to deal in the Software without restriction,
+including without limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom the Software
+is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies
+or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+
+import os
+import sys
+
+sys.path.append('../lib')
+sys.path.append(os.getcwd())
+
+import argparse
+import importlib
+import json
+import threading
+import time
+from collections import deque
+from multiprocessing import Event, Queue
+from queue import Empty
+
+from utils.global_constants import Global
+from utils.mqtt_recorder import read_capture_files, DIRECTION_IN, DIRECTION_OUT
+from utils.payload_codecs import PayloadCodecs
+
+# seconds to wait for responses after the last message is replayed
+RESPONSE_WAIT = 5
+# seconds to wait for started processes to be ready
+READY_WAIT = 30
+
+PERCENTILES = (50, 90, 99)
+
+# decodes json or binary payloads
+PAYLOAD_CODECS = PayloadCodecs()
+
+
+class LatencyTracker(object):
+    """ match requests to responses and collect latencies """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # session id -> time request was sent
+        self.pending_sessions = {}
+        # respond-to topic -> times requests without session id were sent
+        self.pending_topics = {}
+        self.latencies = []
+        self.requests = 0
+
+    def __repr__(self):
+        # return "%s(%r)" % (self.__class__, self.__dict__)
+        fdict = repr(self.__dict__)
+        return f"{self.__class__}({fdict})"
+
+    def request_sent(self, time_sent, session_id, respond_to):
+        """ a request has been sent """
+        if respond_to is None:
+            return
+        with self.lock:
+            self.requests += 1
+            if session_id is not None:
+                self.pending_sessions[session_id] = time_sent
+            else:
+                self.pending_topics.setdefault(respond_to,
+                                               deque()).append(time_sent)
+
+    def response_seen(self, time_seen, topic, session_id):
+        """ a response has been seen """
+        with self.lock:
+            time_sent = None
+            if session_id is not None:
+                time_sent = self.pending_sessions.pop(session_id, None)
+            if time_sent is None and self.pending_topics.get(topic, None):
+                time_sent = self.pending_topics[topic].popleft()
+            if time_sent is not None:
+                self.latencies.append(time_seen - time_sent)
+
+    def report(self, title):
+        """ print latency percentiles, returns count of unanswered requests """
+        with self.lock:
+            latencies = list(self.latencies)
+            requests = self.requests
+        return report_latencies(title, requests, latencies)
+
+
+def report_latencies(title, requests, latencies):
+    """ print latency percentiles, latencies in seconds,
+        returns count of requests without a latency """
+    latencies = sorted(latencies)
+    unanswered = requests - len(latencies)
+    print(title + ": requests: " + str(requests) + ", responses: " +
+          str(len(latencies)) + ", unanswered: " + str(unanswered))
+    if latencies:
+        line = "latency ms:"
+        for percent in PERCENTILES:
+            index = min(len(latencies) - 1,
+                        int(len(latencies) * percent / 100))
+            line += f" p{percent}: {latencies[index] * 1000:.2f}"
+        line += f" max: {latencies[-1] * 1000:.2f}"
+        print(line)
+    return unanswered
+
+
+def parse_request_ids(payload):
+    """ session id and respond-to topic of a json message """
+    session_id = None
+    respond_to = None
+    try:
+        if PAYLOAD_CODECS.is_binary(payload):
+            body = PAYLOAD_CODECS.decode(payload)
+        else:
+            body = json.loads(payload)
+    except ValueError:
+        body = None
+    if isinstance(body, dict) and len(body) == 1:
+        body = list(body.values())[0]
+        if isinstance(body, dict):
+            session_id = body.get(Global.SESSION_ID, None)
+            respond_to = body.get(Global.RESPOND_TO, None)
+    return (session_id, respond_to)
+
+
+def replay_records(records, send, speed):
+    """ call send(topic, payload) for each received message,
+        speed 1 == recorded pace, 0 == as fast as possible """
+    first_time = None
+    last_time = None
+    started = time.monotonic()
+    count = 0
+    for (time_stamp, direction, topic, payload) in records:
+        if direction != DIRECTION_IN:
+            continue
+        if first_time is None:
+            first_time = time_stamp
+        elif time_stamp < last_time:
+            # time stamps restart in captures from a restarted process
+            first_time += time_stamp - last_time
+        last_time = time_stamp
+        if speed > 0:
+            delay = (time_stamp - first_time) / speed - \
+                (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+        send(topic, payload)
+        count += 1
+    elapsed = time.monotonic() - started
+    print(f"replayed: {count} messages in {elapsed:.2f} s")
+
+
+def analyze_capture(args):
+    """ report latencies of requests and responses as recorded """
+    tracker = LatencyTracker()
+    for (time_stamp, direction, topic, payload) in \
+            read_capture_files(args.files):
+        (session_id, respond_to) = parse_request_ids(payload)
+        if direction == DIRECTION_IN:
+            tracker.request_sent(time_stamp, session_id, respond_to)
+        elif direction == DIRECTION_OUT:
+            tracker.response_seen(time_stamp, topic, session_id)
+    tracker.report("recorded")
+
+
+def replay_to_broker(args):
+    """ replay received messages to the broker in the app config """
+    import paho.mqtt.client as mqtt
+    from utils.config_utils import ConfigUtils
+    from structs.mqtt_config import MqttConfig
+
+    config = ConfigUtils.load_config()
+    mqtt_config = MqttConfig(config, "mqtt-replay", ConfigUtils.load_host_name())
+    tracker = LatencyTracker()
+    subscribed = set()
+
+    def data_cb(_client, _userdata, message):
+        (session_id, _respond_to) = parse_request_ids(message.payload)
+        tracker.response_seen(time.monotonic(), message.topic, session_id)
+
+    def send(topic, payload):
+        (session_id, respond_to) = parse_request_ids(payload)
+        if respond_to is not None and respond_to not in subscribed:
+            subscribed.add(respond_to)
+            client.subscribe(respond_to)
+        tracker.request_sent(time.monotonic(), session_id, respond_to)
+        client.publish(topic, payload)
+
+    client = mqtt.Client("mqtt-replay")
+    client.username_pw_set(mqtt_config.user_name, mqtt_config.user_password)
+    client.on_message = data_cb
+    client.connect(args.broker if args.broker else mqtt_config.broker,
+                   args.port if args.port else mqtt_config.port)
+    client.loop_start()
+    replay_records(read_capture_files(args.files), send, args.speed)
+    time.sleep(args.wait)
+    client.loop_stop()
+    client.disconnect()
+    tracker.report("broker replay")
+
+
+class ReplayQueues(dict):
+    """ queues for application processes, created as they are asked for """
+
+    def __missing__(self, key):
+        queue = Queue()
+        self[key] = queue
+        return queue
+
+
+def start_processes(process_names, events, queues):
+    """ create and start processes given as "module:Class",
+        waits for them to be ready, returns list of processes """
+    processes = []
+    for process_name in process_names:
+        (module_name, class_name) = process_name.split(":")
+        process_class = getattr(importlib.import_module(module_name),
+                                class_name)
+        processes.append(process_class(events=events, queues=queues))
+    for process in processes:
+        process.start()
+    for process in processes:
+        ready_event = getattr(process, "ready_event", None)
+        if ready_event is not None and not ready_event.wait(READY_WAIT):
+            print("process not ready: " + str(process.name))
+    return processes
+
+
+def stop_processes(processes, events):
+    """ shutdown processes started by start_processes """
+    events[Global.SHUTDOWN].set()
+    for process in processes:
+        process.join(5)
+        if process.is_alive():
+            process.terminate()
+
+
+def replay_to_queue(args):
+    """ replay received messages directly to application processes """
+    from structs.io_data import IoData
+
+    events = {Global.SHUTDOWN: Event(), Global.RESTART: Event()}
+    queues = ReplayQueues()
+    processes = start_processes(args.process, events, queues)
+    tracker = LatencyTracker()
+    reversed_globals = Global.generate_reversed_list()
+    app_queue = queues[Global.APPLICATION]
+    mqtt_queue = queues[Global.MQTT]
+    log_queue = queues[Global.LOGGER]
+    collecting = threading.Event()
+    collecting.set()
+
+    def collect_responses():
+        while collecting.is_set():
+            # keep log queue from growing while replaying
+            try:
+                while True:
+                    log_queue.get_nowait()
+            except Empty:
+                pass
+            try:
+                (_message_type, message) = mqtt_queue.get(True, 0.1)
+            except Empty:
+                continue
+            if isinstance(message, tuple):
+                (topic, body) = message
+                session_id = getattr(body, "mqtt_session_id", None)
+                tracker.response_seen(time.monotonic(), topic, session_id)
+
+    def send(topic, payload):
+        if PAYLOAD_CODECS.is_binary(payload):
+            new_message = IoData.parse_mqtt_map(
+                topic, PAYLOAD_CODECS.decode(payload), reversed_globals)
+        else:
+            new_message = IoData.parse_mqtt_mesage(topic,
+                                                   payload.decode("utf-8"),
+                                                   reversed_globals)
+        tracker.request_sent(time.monotonic(), new_message.mqtt_session_id,
+                             new_message.mqtt_respond_to)
+        app_queue.put((Global.MQTT_MESSAGE, new_message))
+
+    collector = threading.Thread(target=collect_responses, daemon=True)
+    collector.start()
+    replay_records(read_capture_files(args.files), send, args.speed)
+    time.sleep(args.wait)
+    collecting.clear()
+    collector.join()
+    stop_processes(processes, events)
+    tracker.report("queue replay")
+
+
+def main():
+    """ parse arguments and run replay """
+    parser = argparse.ArgumentParser(description="replay recorded mqtt traffic")
+    parser.add_argument("mode", choices=["analyze", "broker", "queue"])
+    parser.add_argument("files", nargs="+", help="capture files, oldest first")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="replay speed, 1 == recorded, 0 == max speed")
+    parser.add_argument("--wait", type=float, default=RESPONSE_WAIT,
+                        help="seconds to wait for responses after replay")
+    parser.add_argument("--broker", default=None,
+                        help="broker host, default is broker in app config")
+    parser.add_argument("--port", type=int, default=None,
+                        help="broker port, default is port in app config")
+    parser.add_argument("--process", action="append", default=[],
+                        help="module:Class of a process to start in queue mode")
+    args = parser.parse_args()
+    if args.mode == "analyze":
+        analyze_capture(args)
+    elif args.mode == "broker":
+        replay_to_broker(args)
+    elif not args.process:
+        parser.error("queue mode needs at least one --process")
+    else:
+        replay_to_queue(args)
+
+
+if __name__ == "__main__":
+    main()